@@ -0,0 +1,142 @@
+import asyncio
+import os
+import sqlite3
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
+from pathlib import Path
+from typing import Optional, Tuple, Iterator, List
+
+from config import Config
+from metrics import metrics
+from models import ArchivedPage
+
+INDEX_COLUMNS = (
+    "id", "created_at", "query", "mkt", "page", "start_position", "country", "user_agent", "proxy", "digest", "codec"
+)
+
+
+class HtmlArchive:
+    ZSTD = "zst"
+    ZLIB = "zlib"
+    INDEX_FILENAME = "index.sqlite"
+    warned: bool = False
+
+    def __init__(self, dirpath: Path):
+        self.dirpath: Path = dirpath
+        self.connection: Optional[sqlite3.Connection] = None
+        # один поток - файлы и соединение с индексом только в нем, цикл событий координатора не ждет диск
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="html-archive")
+
+        self.pages: int = 0
+        self.objects: int = 0
+        self.raw_bytes: int = 0
+        self.stored_bytes: int = 0
+
+    @classmethod
+    def from_config(cls) -> Optional["HtmlArchive"]:
+        if not Config.ARCHIVE_HTML:
+            return None
+
+        return cls(dirpath=Config.ARCHIVE_DIR)
+
+    @staticmethod
+    def compress(html: str) -> Tuple[str, str, bytes, int]:
+        # выполняется в воркере: (адрес содержимого, кодек, сжатые данные, исходный размер)
+        raw = html.encode("utf-8")
+        digest = blake2b(raw, digest_size=20).hexdigest()
+        try:
+            import zstandard
+
+        except ImportError:
+            if not HtmlArchive.warned:
+                HtmlArchive.warned = True
+                Config.logger.warning("zstandard не установлен! Архив HTML сжимается zlib - крупнее и медленнее")
+
+            return digest, HtmlArchive.ZLIB, zlib.compress(raw, Config.ARCHIVE_ZLIB_LEVEL), len(raw)
+
+        return digest, HtmlArchive.ZSTD, zstandard.ZstdCompressor(level=Config.ARCHIVE_ZSTD_LEVEL).compress(raw), len(raw)
+
+    @staticmethod
+    def decompress(codec: str, data: bytes) -> str:
+        if codec == HtmlArchive.ZSTD:
+            import zstandard
+
+            return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+
+        return zlib.decompress(data).decode("utf-8")
+
+    def object_path(self, digest: str, codec: str) -> Path:
+        return self.dirpath / "objects" / digest[:2] / f"{digest}.{codec}"
+
+    def connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            self.dirpath.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(str(self.dirpath / self.INDEX_FILENAME))
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS pages (id INTEGER PRIMARY KEY, created_at REAL, query TEXT, mkt TEXT, "
+                "page INTEGER, start_position INTEGER, country TEXT, user_agent TEXT, proxy TEXT, digest TEXT, codec TEXT)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS pages_query ON pages (query, mkt, page)")
+            self.connection.commit()
+
+        return self.connection
+
+    async def put(self, page: ArchivedPage):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._write, page)
+
+    def _write(self, page: ArchivedPage):
+        path = self.object_path(digest=page.digest, codec=page.codec)
+        if not path.exists():
+            # одинаковые страницы хранятся один раз; запись через временный файл не оставляет обрезанных объектов
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            tmp_path.write_bytes(page.data)
+            os.replace(tmp_path, path)
+            self.objects += 1
+            self.stored_bytes += len(page.data)
+            metrics.inc("archive_bytes", len(page.data))
+
+        connection = self.connect()
+        connection.execute(
+            f"INSERT INTO pages ({', '.join(INDEX_COLUMNS[1:])}) VALUES ({', '.join('?' * (len(INDEX_COLUMNS) - 1))})",
+            (time.time(), page.query, page.mkt, page.page, page.start_position, page.country, page.user_agent,
+             page.proxy, page.digest, page.codec)
+        )
+        connection.commit()
+        self.pages += 1
+        self.raw_bytes += page.raw_size
+        metrics.inc("archive_pages")
+
+    def iter_index(self, latest_only: bool = True, batch_size: int = 1000) -> Iterator[List[tuple]]:
+        # по умолчанию только последний снимок каждой страницы запроса
+        where = "WHERE id IN (SELECT MAX(id) FROM pages GROUP BY query, mkt, page)" if latest_only else ""
+        cursor = self.connect().execute(f"SELECT {', '.join(INDEX_COLUMNS)} FROM pages {where} ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+
+            yield rows
+
+    def read(self, digest: str, codec: str) -> str:
+        return self.decompress(codec=codec, data=self.object_path(digest=digest, codec=codec).read_bytes())
+
+    def close_index(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.close_index)
+        self.executor.shutdown(wait=True)
+        if self.pages:
+            Config.logger.info(
+                f"Архив HTML: страниц {self.pages}, новых объектов {self.objects}, "
+                f"{self.raw_bytes / 1024 / 1024:.1f} МБ -> {self.stored_bytes / 1024 / 1024:.1f} МБ на диске"
+            )
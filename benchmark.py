@@ -0,0 +1,773 @@
+import argparse
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import pickle
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from multiprocessing import Process, Queue
+from typing import List, Dict, Any
+
+from pydantic import BaseModel
+
+from blocking import BlockClassifier
+from config import Config
+from coordinator import Coordinator
+from extraction import Extractor
+from mock_bing import MockBing, start_mock
+from models import QueueMessage, ResultBatch, ProxyData, SearchResult
+from network import CoordinatorServer, WorkerNode
+from proxy_pool import ProxyPool
+from rpc import RpcClient
+from supervisor import Supervisor
+from utils import Utils as Ut
+from writer import ResultWriter
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+
+def _report(name: str, latencies: List[float]):
+    print(
+        f"{name:<10} n={len(latencies):<6} "
+        f"p50={_percentile(latencies, 50) * 1000:9.2f}ms "
+        f"p99={_percentile(latencies, 99) * 1000:9.2f}ms "
+        f"mean={statistics.fmean(latencies) * 1000 if latencies else 0:9.2f}ms"
+    )
+
+
+# прежний протокол по одному запросу - в координаторе его больше нет, им отвечает только _legacy_coordinator
+LEGACY_GET_NEW_QUERY = "get_new_query"
+LEGACY_SEND_NEW_QUERY = "send_new_query"
+
+
+def _handoff_worker(queue_in: Queue, queue_out: Queue, results: Queue, process_id: int, requests_count: int,
+                    legacy: bool):
+    latencies = []
+    for request_id in range(requests_count):
+        started = time.perf_counter()
+        if legacy:
+            queue_out.put(QueueMessage(msg_type=LEGACY_GET_NEW_QUERY, process_id=process_id))
+            queue_in.get()
+
+        else:
+            # аренда пачки из одного запроса - так же, как воркер получает запросы у координатора
+            queue_out.put(QueueMessage(
+                msg_type=Ut.GET_QUERY_BATCH, data=1, process_id=process_id, request_id=request_id
+            ))
+            for lease in queue_in.get().data:
+                queue_out.put(QueueMessage(
+                    msg_type=Ut.COMPLETE_QUERY, data={"lease_id": lease.lease_id, "finished": True},
+                    process_id=process_id
+                ))
+
+        latencies.append(time.perf_counter() - started)
+
+    results.put(latencies)
+
+
+async def _legacy_coordinator(tasks: Dict[int, Dict[str, Any]], input_queries: List[str], interval: float):
+    # прежний цикл main.main: sleep + один get_nowait на воркер за проход
+    while True:
+        await asyncio.sleep(interval)
+
+        for task in tasks.values():
+            msg = await Ut.get_message_from_queue(queue=task["queue_in"])
+            if msg is None:
+                continue
+
+            if msg.msg_type == LEGACY_GET_NEW_QUERY:
+                query_for_send = input_queries.pop(0) if input_queries else None
+                task["queue_out"].put(QueueMessage(msg_type=LEGACY_SEND_NEW_QUERY, data=query_for_send))
+
+        if not any(task["process"].is_alive() for task in tasks.values()):
+            return
+
+
+async def bench_handoff(args):
+    for mode in ("legacy", "event"):
+        results = Queue()
+        shared_queue_in = Queue()
+        tasks = {}
+        for n in range(1, args.workers + 1):
+            queue_in = Queue() if mode == "legacy" else shared_queue_in
+            queue_out = Queue()
+            proc = Process(
+                target=_handoff_worker, args=(queue_out, queue_in, results, n, args.requests, mode == "legacy")
+            )
+            proc.start()
+            tasks[n] = {"process": proc, "queue_in": queue_in, "queue_out": queue_out}
+
+        input_queries = [f"query {n}" for n in range(args.workers * args.requests)]
+        if mode == "legacy":
+            await _legacy_coordinator(tasks=tasks, input_queries=input_queries, interval=args.legacy_interval)
+
+        else:
+            await Coordinator(
+                tasks=tasks, queue_in=shared_queue_in, input_queries=input_queries, input_proxies=[]
+            ).run()
+
+        latencies = []
+        for _ in tasks:
+            latencies.extend(results.get())
+
+        _report(mode, latencies)
+
+
+async def bench_leasing(args):
+    input_queries = [f"query {n}" for n in range(args.queries)]
+
+    legacy_queries = list(input_queries[:args.legacy_queries])
+    started = time.perf_counter()
+    while legacy_queries:
+        legacy_queries.pop(0)
+
+    elapsed = time.perf_counter() - started
+    print(f"{'list.pop(0)':<12} {args.legacy_queries:>9} запросов за {elapsed:8.3f}s "
+          f"({args.legacy_queries / elapsed:12.0f}/s)")
+
+    coordinator = Coordinator(tasks={}, queue_in=Queue(), input_queries=input_queries, input_proxies=[])
+    started = time.perf_counter()
+    leased = 0
+    while True:
+        leases = await coordinator.lease_queries(process_id=1, size=args.batch)
+        if not leases:
+            break
+
+        leased += len(leases)
+        for lease in leases:
+            coordinator.leases.pop(lease.lease_id)
+
+    elapsed = time.perf_counter() - started
+    print(f"{'lease':<12} {leased:>9} запросов за {elapsed:8.3f}s ({leased / elapsed:12.0f}/s)")
+
+
+class _LegacyQueueMessage(BaseModel):
+    # прежний формат сообщения - для сравнения в bench_ipc
+    msg_type: str
+    data: Any = None
+    process_id: int = 0
+    request_id: int = 0
+
+
+def _ipc_messages(results: int) -> Dict[str, Any]:
+    proxy = ProxyData(id=7, host="10.0.0.7", port="8080", username="user", password="password")
+    user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+    records = [
+        (f"Заголовок результата {n}", f"https://example.com/page/{n}?utm=1", "Описание результата выдачи " * 8)
+        for n in range(1, results + 1)
+    ]
+    legacy_rows = lambda: [SearchResult(
+        query="купить ноутбук", page="3", position=str(n), title=title, url=url, snippet=snippet, lang="ru",
+        country="ru", mkt="ru-RU", user_agent=user_agent, proxy=str(proxy)
+    ).to_list() for n, (title, url, snippet) in enumerate(records, 1)]
+    compact_batch = lambda: ResultBatch(
+        query="купить ноутбук", page="3", lang="ru", country="ru", mkt="ru-RU", user_agent=user_agent,
+        proxy=str(proxy), items=[(str(n), title, url, snippet) for n, (title, url, snippet) in enumerate(records, 1)]
+    )
+    return {
+        "legacy": {
+            "upload": (lambda: _LegacyQueueMessage(msg_type=Ut.UPLOAD_DATA, data=legacy_rows(), process_id=1),
+                       lambda msg: msg.data),
+            "proxy": (lambda: _LegacyQueueMessage(msg_type=Ut.SEND_NEW_PROXY, data=proxy, request_id=1),
+                      lambda msg: msg.data)
+        },
+        "compact": {
+            "upload": (lambda: QueueMessage(msg_type=Ut.UPLOAD_DATA, data=compact_batch(), process_id=1),
+                       lambda msg: msg.data.to_rows()),
+            "proxy": (lambda: QueueMessage(msg_type=Ut.SEND_NEW_PROXY, data=proxy.id, request_id=1),
+                      lambda msg: msg.data)
+        }
+    }
+
+
+def _ipc_echo(queue_in: Queue, queue_out: Queue):
+    while True:
+        msg = queue_in.get()
+        queue_out.put(msg)
+        if msg is None:
+            return
+
+
+async def bench_ipc(args):
+    messages = _ipc_messages(results=args.results)
+
+    print(f"{'формат':<8} {'сообщение':<10} {'байт':>7} {'сборка+pickle':>14} {'unpickle+строки':>16}")
+    for fmt, kinds in messages.items():
+        for kind, (build, unpack) in kinds.items():
+            payload = pickle.dumps(build())
+            encode = _time_calls(lambda _: pickle.dumps(build()), [None], args.repeat)
+            decode = _time_calls(lambda _: unpack(pickle.loads(payload)), [None], args.repeat)
+            print(f"{fmt:<8} {kind:<10} {len(payload):>7} {encode * 1e6:>12.1f}µs {decode * 1e6:>14.1f}µs")
+
+    print(f"\nОчередь multiprocessing: {args.round_trips} пинг-понгов и {args.bulk} сообщений подряд (upload)")
+    for fmt, kinds in messages.items():
+        build, unpack = kinds["upload"]
+        queue_out, queue_in = Queue(), Queue()
+        echo = Process(target=_ipc_echo, kwargs={"queue_in": queue_out, "queue_out": queue_in})
+        echo.start()
+
+        latencies = []
+        for _ in range(args.round_trips):
+            started = time.perf_counter()
+            queue_out.put(build())
+            unpack(queue_in.get())
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for _ in range(args.bulk):
+            queue_out.put(build())
+
+        for _ in range(args.bulk):
+            unpack(queue_in.get())
+
+        elapsed = time.perf_counter() - started
+        queue_out.put(None)
+        queue_in.get()
+        echo.join()
+
+        _report(fmt, latencies)
+        print(f"{'':<10} {args.bulk / elapsed:.0f} сообщений/s")
+
+
+def _node_worker(queue_in: Queue, queue_out: Queue, process_id: int, proxies: List[ProxyData], work_seconds: float):
+    # воркер без браузера: прокси, аренда запроса, "поиск" за work_seconds, выгрузка страницы и завершение
+    async def work():
+        rpc = RpcClient(queue_in=queue_in, queue_out=queue_out, process_id=process_id)
+        await rpc.start()
+        proxy = proxies[(await rpc.request(msg_type=Ut.GET_NEW_PROXY)).data - 1]
+        while True:
+            leases = (await rpc.request(msg_type=Ut.GET_QUERY_BATCH, data=1)).data
+            if not leases:
+                break
+
+            for lease in leases:
+                started = time.perf_counter()
+                await asyncio.sleep(work_seconds)
+                # как настоящий воркер: исход по прокси - сигнал адаптивному лимиту воркеров координатора
+                await rpc.notify(msg_type=Ut.REPORT_PROXY, data={
+                    "proxy_id": proxy.id, "outcome": ProxyPool.SUCCESS, "latency": time.perf_counter() - started
+                })
+                await rpc.notify(msg_type=Ut.UPLOAD_DATA, data=ResultBatch(
+                    query=lease.query, page="1", lang="ru", country="ru", mkt="ru-RU", user_agent="bench",
+                    proxy=str(proxy), items=[(str(n), f"title {n}", f"https://example.com/{n}", "") for n in range(10)]
+                ))
+                await rpc.notify(msg_type=Ut.COMPLETE_QUERY, data={"lease_id": lease.lease_id, "finished": True})
+
+        await rpc.notify(msg_type=Ut.RELEASE_PROXY, data=proxy.id)
+        await rpc.stop()
+
+    asyncio.run(work())
+
+
+def _run_node(address: str, workers: int, work_seconds: float):
+    asyncio.run(WorkerNode(
+        address=address, token="bench", workers=workers, target=_node_worker,
+        target_kwargs={"work_seconds": work_seconds}
+    ).run())
+
+
+async def bench_nodes(args):
+    # конфигурация берется из .env как есть - масштабирование проверяется в том виде, в каком запускается парсер
+    print(f"ADAPTIVE_CONCURRENCY={int(Config.ADAPTIVE_CONCURRENCY)}")
+    print(f"{'узлы':>5} {'воркеры':>8} {'запросов':>9} {'время':>8} {'запросов/s':>11} {'строк':>7} {'масштаб':>8}")
+    base_rate = None
+    failures = []
+    for nodes in args.nodes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            address = args.address or f"unix://{tmp_dir}/coordinator.sock"
+            queries_count = args.queries_per_worker * nodes * args.workers
+            proxies = [
+                ProxyData(id=n, host="127.0.0.1", port="8080", username="user", password="password")
+                for n in range(1, nodes * args.workers + 1)
+            ]
+            writer = ResultWriter(
+                sink=ResultWriter.SINKS["csv"](Path(tmp_dir) / "out.csv"), batch_size=Config.WRITER_BATCH_SIZE,
+                flush_interval=Config.WRITER_FLUSH_INTERVAL
+            )
+            coordinator = Coordinator(
+                tasks={}, queue_in=Queue(), input_queries=[f"запрос {n}" for n in range(queries_count)],
+                input_proxies=proxies, writer=writer, node_server=CoordinatorServer(address=address, token="bench")
+            )
+
+            started = time.perf_counter()
+            coordinator_task = asyncio.create_task(coordinator.run())
+            await asyncio.sleep(0.2)
+            node_procs = [
+                Process(target=_run_node, args=(address, args.workers, args.work_seconds)) for _ in range(nodes)
+            ]
+            for proc in node_procs:
+                proc.start()
+
+            await coordinator_task
+            elapsed = time.perf_counter() - started
+            for proc in node_procs:
+                proc.join()
+
+            rows = sum(1 for _ in open(Path(tmp_dir) / "out.csv", encoding="utf-8-sig"))
+
+        rate = queries_count / elapsed
+        base_rate = base_rate or rate / nodes
+        scaling = rate / base_rate / nodes
+        print(
+            f"{nodes:>5} {args.workers:>8} {queries_count:>9} {elapsed:>7.2f}s {rate:>11.1f} {rows:>7} {scaling:>7.0%}"
+        )
+        if scaling < args.min_scaling:
+            failures.append(f"{nodes} узл.: масштабирование {scaling:.0%} < порога {args.min_scaling:.0%}")
+        if rows != queries_count * 10:
+            failures.append(f"{nodes} узл.: строк {rows} вместо {queries_count * 10}")
+
+    for failure in failures:
+        print(f"РЕГРЕССИЯ: {failure}")
+
+    if failures:
+        raise SystemExit(1)
+
+
+def _respawn_worker(queue_in: Queue, queue_out: Queue, process_id: int, pages_per_query: int, crash_after: int):
+    # воркер без браузера выгружает страницы запроса с той, что назначил координатор; воркер 1 падает посреди запроса
+    async def work():
+        rpc = RpcClient(queue_in=queue_in, queue_out=queue_out, process_id=process_id)
+        await rpc.start()
+        proxy_id = (await rpc.request(msg_type=Ut.GET_NEW_PROXY)).data
+        pages_done = 0
+        while True:
+            leases = (await rpc.request(msg_type=Ut.GET_QUERY_BATCH, data=1)).data
+            if not leases:
+                break
+
+            for lease in leases:
+                position = lease.start_position
+                for page in range(lease.start_page, pages_per_query + 1):
+                    items = [
+                        (str(position + n), f"title {n}", f"https://example.com/{lease.query}/{page}/{n}", "")
+                        for n in range(1, 11)
+                    ]
+                    position += len(items)
+                    await rpc.notify(msg_type=Ut.UPLOAD_DATA, data=ResultBatch(
+                        query=lease.query, page=str(page), lang="ru", country="ru", mkt="ru-RU", user_agent="bench",
+                        proxy=str(proxy_id), items=items
+                    ))
+                    await rpc.notify(msg_type=Ut.PAGE_DONE, data={
+                        "lease_id": lease.lease_id, "page": page, "rows": len(items)
+                    })
+                    pages_done += 1
+                    if process_id == 1 and pages_done == crash_after:
+                        # очередь отправляет сообщения фоновым потоком - даем ему дописать их перед падением
+                        await asyncio.sleep(0.2)
+                        os._exit(1)
+
+                await rpc.notify(msg_type=Ut.COMPLETE_QUERY, data={"lease_id": lease.lease_id, "finished": True})
+
+        await rpc.notify(msg_type=Ut.RELEASE_PROXY, data=proxy_id)
+        await rpc.stop()
+
+    asyncio.run(work())
+
+
+async def bench_respawn(args):
+    # упавший воркер перезапускается супервизором, а его начатый запрос продолжается со следующей страницы:
+    # в выгрузке нет повторов и нет пропусков
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queue_in = Queue()
+
+        def spawn(process_id: int) -> Dict[str, Any]:
+            queue_out = Queue()
+            proc = Process(
+                target=_respawn_worker, args=(queue_out, queue_in, process_id, args.pages_per_query, args.crash_after)
+            )
+            proc.start()
+            return {"process": proc, "queue_out": queue_out}
+
+        proxies = [
+            ProxyData(id=n, host="127.0.0.1", port="8080", username="user", password="password")
+            for n in range(1, args.workers + 1)
+        ]
+        writer = ResultWriter(
+            sink=ResultWriter.SINKS["csv"](Path(tmp_dir) / "out.csv"), batch_size=Config.WRITER_BATCH_SIZE,
+            flush_interval=Config.WRITER_FLUSH_INTERVAL
+        )
+        supervisor = Supervisor(spawn=spawn, heartbeat_timeout=30, max_restarts=1, restart_window=3600)
+        coordinator = Coordinator(
+            tasks={n: spawn(n) for n in range(1, args.workers + 1)}, queue_in=queue_in,
+            input_queries=[f"запрос {n}" for n in range(args.queries)], input_proxies=proxies, writer=writer,
+            supervisor=supervisor
+        )
+
+        started = time.perf_counter()
+        await coordinator.run()
+        elapsed = time.perf_counter() - started
+
+        with open(Path(tmp_dir) / "out.csv", encoding="utf-8-sig") as file:
+            rows = [tuple(line.rstrip("\n").split(";")[:5]) for line in file]
+
+    expected = args.queries * args.pages_per_query * 10
+    unique = len(set(rows))
+    print(f"перезапусков {supervisor.total_restarts}, строк {len(rows)}, уникальных {unique}, "
+          f"ожидалось {expected}, за {elapsed:.2f}s")
+
+    failures = []
+    if supervisor.total_restarts != 1:
+        failures.append(f"перезапусков {supervisor.total_restarts} вместо 1")
+    if unique != len(rows):
+        failures.append(f"повторов строк {len(rows) - unique}")
+    if unique != expected:
+        failures.append(f"уникальных строк {unique} вместо {expected}")
+
+    for failure in failures:
+        print(f"РЕГРЕССИЯ: {failure}")
+
+    if failures:
+        raise SystemExit(1)
+
+
+async def bench_writer(args):
+    row = ["query", "1", "1", "Заголовок результата", "https://example.com/page", "Сниппет " * 20, "ru", "ru",
+           "ru-RU", "Mozilla/5.0", "127.0.0.1:8080:user:password"]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, sink_class in ResultWriter.SINKS.items():
+            try:
+                sink = sink_class(Path(tmp_dir) / f"out.{name}")
+
+            except ImportError as ex:
+                print(f"{name:<8} пропущен: {ex}")
+                continue
+
+            writer = ResultWriter(sink=sink, batch_size=args.batch_size, flush_interval=1)
+            await writer.start()
+
+            started = time.perf_counter()
+            for _ in range(args.rows // args.message_rows):
+                await writer.put(rows=[row] * args.message_rows)
+
+            await writer.close()
+            elapsed = time.perf_counter() - started
+            print(f"{name:<8} {writer.rows_written:>9} строк за {elapsed:8.3f}s ({writer.rows_written / elapsed:10.0f} строк/s)")
+
+
+async def bench_extraction(args):
+    from playwright.async_api import async_playwright
+
+    html_files = sorted(Path(args.pages).glob("*.html"))
+    if not html_files:
+        print(f"Не нашел сохраненных страниц в {args.pages}")
+        return
+
+    async with async_playwright() as playwright_obj:
+        browser = await playwright_obj.chromium.launch(headless=True)
+        page = await browser.new_page()
+
+        # оба движка должны давать одинаковые записи - иначе сравнение скорости ничего не значит
+        failures = []
+        for html_file in html_files:
+            await page.set_content(html_file.read_text(encoding="utf-8"))
+            outputs = {
+                engine: await Extractor.from_page(page=page, engine=engine)
+                for engine in (Extractor.SELECTOLAX, Extractor.SCRIPT)
+            }
+            if outputs[Extractor.SELECTOLAX] != outputs[Extractor.SCRIPT]:
+                lang, records = outputs[Extractor.SELECTOLAX]
+                script_lang, script_records = outputs[Extractor.SCRIPT]
+                diff = next(
+                    (f"{record} != {script_record}" for record, script_record in zip(records, script_records)
+                     if record != script_record),
+                    f"lang {lang!r}/{script_lang!r}, записей {len(records)}/{len(script_records)}"
+                )
+                failures.append(f"{html_file.name}: движки расходятся: {diff}")
+
+        for engine in (Extractor.SELECTOLAX, Extractor.SCRIPT):
+            latencies = []
+            cpu_time = 0.0
+            for html_file in html_files:
+                await page.set_content(html_file.read_text(encoding="utf-8"))
+                for _ in range(args.repeat):
+                    started, cpu_started = time.perf_counter(), time.process_time()
+                    await Extractor.from_page(page=page, engine=engine)
+                    latencies.append(time.perf_counter() - started)
+                    cpu_time += time.process_time() - cpu_started
+
+            _report(engine, latencies)
+            print(f"{'':<10} CPU воркера на страницу: {cpu_time / len(latencies) * 1000:.2f}ms")
+
+        await browser.close()
+
+    for failure in failures:
+        print(f"РЕГРЕССИЯ: {failure}")
+
+    if failures:
+        raise SystemExit(1)
+
+
+def _time_calls(func, values: list, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for value in values:
+            func(value)
+
+    return (time.perf_counter() - started) / (repeat * len(values)) if values else 0.0
+
+
+async def bench_parse(args):
+    from selectolax.parser import HTMLParser
+
+    pages_dir = Path(args.pages)
+    manifest = json.loads((pages_dir / "manifest.json").read_text(encoding="utf-8"))
+    pages = {name: (pages_dir / name).read_text(encoding="utf-8") for name in manifest["pages"]}
+    thresholds = manifest.get("thresholds", {})
+    failures = []
+    # скорость на сгенерированной разметке не равна скорости на живой выдаче - это видно прямо в отчете
+    print(f"Корпус: {manifest.get('source', pages_dir)}")
+
+    for name, html in pages.items():
+        lang, records = Extractor.from_html(html=html)
+        expected = manifest["pages"][name]["results"]
+        if len(records) != expected:
+            failures.append(f"{name}: результатов {len(records)}, ожидалось {expected}")
+
+        # сверяются сами значения: число результатов не ловит склеенный текст или неверно раскодированную ссылку
+        expected_lang = manifest["pages"][name].get("lang")
+        if expected_lang is not None and lang != expected_lang:
+            failures.append(f"{name}: lang {lang!r}, ожидалось {expected_lang!r}")
+
+        expected_records = [
+            (record["title"], record["url"], record["snippet"])
+            for record in manifest["pages"][name].get("expected", [])
+        ]
+        for n, (record, expected_record) in enumerate(zip(records, expected_records), 1):
+            if record != expected_record:
+                failures.append(f"{name}: результат {n} {record} != ожидаемому {expected_record}")
+                break
+
+        kind = manifest["pages"][name]["kind"]
+        expected_block = kind if kind in (BlockClassifier.CAPTCHA, BlockClassifier.EMPTY, BlockClassifier.SOFT_BLOCK) \
+            else BlockClassifier.OK
+        block = BlockClassifier.classify_html(html)
+        if block != expected_block:
+            failures.append(f"{name}: классификатор вернул {block}, ожидалось {expected_block}")
+
+    results = 0
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for html in pages.values():
+            results += len(Extractor.from_html(html=html)[1])
+
+    elapsed = time.perf_counter() - started
+    results_per_sec = results / elapsed
+    print(f"from_html: {len(pages) * args.repeat / elapsed:10.0f} страниц/s, {results_per_sec:10.0f} результатов/s")
+
+    trees = [HTMLParser(html) for html in pages.values()]
+    hrefs = [a.attrs.get("href") or "" for tree in trees for a in tree.css("li.b_algo h2 a, li.b_algo h3 a")]
+    cleaned = [Extractor.clean_bing_href(href) or href for href in hrefs]
+    nodes = [node for tree in trees for node in tree.css("li.b_algo h2 a, li.b_algo .b_caption p")]
+    timings = {
+        "HTMLParser": _time_calls(HTMLParser, list(pages.values()), args.repeat),
+        "clean_bing_href": _time_calls(Extractor.clean_bing_href, hrefs, args.repeat),
+        "normalize_href": _time_calls(Extractor.normalize_href, hrefs, args.repeat),
+        "decode_a1": _time_calls(Extractor.decode_a1, [url for url in cleaned if url.startswith("a1")], args.repeat),
+        "_text": _time_calls(Extractor._text, nodes, args.repeat),
+    }
+    for name, seconds in timings.items():
+        print(f"{name:<16} {seconds * 1_000_000:10.2f}µs на вызов")
+
+    tracemalloc.start()
+    for html in pages.values():
+        Extractor.from_html(html=html)
+
+    _, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    allocated_kb = sum(stat.size for stat in snapshot.statistics("filename")) / 1024
+    print(f"Аллокации за проход по корпусу: пик {peak / 1024:.1f}KB, удерживается {allocated_kb:.1f}KB")
+
+    min_results_per_sec = args.min_results_per_sec or thresholds.get("min_results_per_sec", 0)
+    if results_per_sec < min_results_per_sec:
+        failures.append(f"результатов/s {results_per_sec:.0f} < порога {min_results_per_sec}")
+
+    max_peak_kb = thresholds.get("max_peak_alloc_kb")
+    if max_peak_kb and peak / 1024 > max_peak_kb:
+        failures.append(f"пик аллокаций {peak / 1024:.1f}KB > порога {max_peak_kb}KB")
+
+    for failure in failures:
+        print(f"РЕГРЕССИЯ: {failure}")
+
+    if failures:
+        raise SystemExit(1)
+
+
+async def _sample_workers(proc: subprocess.Popen, interval: float) -> Dict[int, Dict[str, float]]:
+    import psutil
+
+    workers = {}
+    main_proc = psutil.Process(proc.pid)
+    while proc.poll() is None:
+        try:
+            for child in main_proc.children():
+                with child.oneshot():
+                    cpu = child.cpu_times()
+                    browser_rss = 0
+                    for descendant in child.children(recursive=True):
+                        try:
+                            browser_rss += descendant.memory_info().rss
+
+                        except psutil.Error:
+                            pass
+
+                    worker = workers.setdefault(child.pid, {"cpu": 0.0, "rss": 0, "browser_rss": 0})
+                    worker["cpu"] = cpu.user + cpu.system
+                    worker["rss"] = max(worker["rss"], child.memory_info().rss)
+                    worker["browser_rss"] = max(worker["browser_rss"], browser_rss)
+
+        except psutil.Error:
+            pass
+
+        await asyncio.sleep(interval)
+
+    return workers
+
+
+async def bench_e2e(args):
+    # без psutil столбцы CPU и RSS были бы нулями, которые легко принять за результат
+    if importlib.util.find_spec("psutil") is None:
+        print("Для e2e нужен psutil (pip install -r requirements.txt) - без него не измерить CPU и память воркеров")
+        raise SystemExit(1)
+
+    mock = MockBing(
+        latency=args.latency, captcha_probability=args.captcha_probability, pages_per_query=args.pages_per_query
+    )
+    mock_server, proxy_server = start_mock(mock)
+    proxy_host, proxy_port = proxy_server.server_address
+
+    print(f"{'браузеры':>8} {'вкладки':>8} {'запросов/мин':>13} {'стр/s':>7} {'p50':>9} {'p99':>9} "
+          f"{'CPU воркера':>12} {'RSS воркера':>12} {'RSS браузера':>13}")
+    for browsers in args.browsers:
+        for tabs in args.tabs:
+            mock.reset()
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                tmp_path = Path(tmp_dir)
+                (tmp_path / "queries.txt").write_text(
+                    "\n".join(f"запрос {n}" for n in range(args.queries)), encoding="utf-8"
+                )
+                (tmp_path / "proxies.txt").write_text(
+                    "\n".join(f"{proxy_host}:{proxy_port}:user{n}:password" for n in range(browsers)), encoding="utf-8"
+                )
+
+                env = dict(
+                    os.environ, HEADLESS="1", MAX_BROWSERS=str(browsers), MAX_PAGES_PER_BROWSER=str(tabs),
+                    OUT_FILEPATH=str(tmp_path / "out.csv"), QUERIES_FILEPATH=str(tmp_path / "queries.txt"),
+                    PROXIES_FILEPATH=str(tmp_path / "proxies.txt"), BING_URL="http://bing.mock"
+                )
+                started = time.perf_counter()
+                proc = subprocess.Popen(
+                    [sys.executable, str(Path(__file__).parent / "main.py")], cwd=tmp_dir, env=env,
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                )
+                workers = await _sample_workers(proc=proc, interval=args.sample_interval)
+                elapsed = time.perf_counter() - started
+
+            stats = mock.stats()
+            intervals = stats["page_intervals"]
+            cpu = statistics.fmean(w["cpu"] / elapsed * 100 for w in workers.values()) if workers else 0
+            rss = statistics.fmean(w["rss"] for w in workers.values()) / 2 ** 20 if workers else 0
+            browser_rss = statistics.fmean(w["browser_rss"] for w in workers.values()) / 2 ** 20 if workers else 0
+            print(
+                f"{browsers:>8} {tabs:>8} {args.queries / elapsed * 60:>13.1f} {stats['served_pages'] / elapsed:>7.2f} "
+                f"{_percentile(intervals, 50):>8.2f}s {_percentile(intervals, 99):>8.2f}s "
+                f"{cpu:>11.1f}% {rss:>10.1f}МБ {browser_rss:>11.1f}МБ"
+            )
+
+    mock_server.shutdown()
+    proxy_server.shutdown()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарки parser-bing")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    handoff = subparsers.add_parser("handoff", help="Задержка выдачи запроса координатором")
+    handoff.add_argument("--workers", type=int, default=Config.MAX_BROWSERS)
+    handoff.add_argument("--requests", type=int, default=5)
+    handoff.add_argument("--legacy-interval", type=float, default=2)
+    handoff.set_defaults(func=bench_handoff)
+
+    leasing = subparsers.add_parser("leasing", help="Скорость выдачи запросов из большой очереди")
+    leasing.add_argument("--queries", type=int, default=1_000_000)
+    leasing.add_argument("--legacy-queries", type=int, default=200_000)
+    leasing.add_argument("--batch", type=int, default=Config.MAX_PAGES_PER_BROWSER)
+    leasing.set_defaults(func=bench_leasing)
+
+    writer = subparsers.add_parser("writer", help="Пропускная способность выгрузки по форматам")
+    writer.add_argument("--rows", type=int, default=200_000)
+    writer.add_argument("--message-rows", type=int, default=10)
+    writer.add_argument("--batch-size", type=int, default=Config.WRITER_BATCH_SIZE)
+    writer.set_defaults(func=bench_writer)
+
+    parse = subparsers.add_parser("parse", help="Разбор синтетических страниц выдачи без браузера")
+    parse.add_argument("--pages", default="fixtures/serp")
+    parse.add_argument("--repeat", type=int, default=200)
+    parse.add_argument("--min-results-per-sec", type=float, default=0)
+    parse.set_defaults(func=bench_parse)
+
+    e2e = subparsers.add_parser("e2e", help="Полный прогон main.py против локального mock Bing")
+    e2e.add_argument("--browsers", type=int, nargs="+", default=[1, 2, 4])
+    e2e.add_argument("--tabs", type=int, nargs="+", default=[1, 3])
+    e2e.add_argument("--queries", type=int, default=30)
+    e2e.add_argument("--pages-per-query", type=int, default=3)
+    e2e.add_argument("--latency", type=float, default=0.05)
+    e2e.add_argument("--captcha-probability", type=float, default=0.0)
+    e2e.add_argument("--sample-interval", type=float, default=0.5)
+    e2e.set_defaults(func=bench_e2e)
+
+    ipc = subparsers.add_parser("ipc", help="Сериализация и задержка сообщений между процессами")
+    ipc.add_argument("--results", type=int, default=10)
+    ipc.add_argument("--repeat", type=int, default=5000)
+    ipc.add_argument("--round-trips", type=int, default=2000)
+    ipc.add_argument("--bulk", type=int, default=20000)
+    ipc.set_defaults(func=bench_ipc)
+
+    nodes = subparsers.add_parser("nodes", help="Координатор по сокету и несколько локальных узлов без браузера")
+    nodes.add_argument("--nodes", type=int, nargs="+", default=[1, 2, 4])
+    nodes.add_argument("--workers", type=int, default=4)
+    nodes.add_argument("--queries-per-worker", type=int, default=100)
+    nodes.add_argument("--work-seconds", type=float, default=0.02)
+    nodes.add_argument("--address", default=None, help="По умолчанию unix-сокет во временной папке")
+    nodes.add_argument(
+        "--min-scaling", type=float, default=0.5,
+        help="Минимальная доля линейного роста на узел (на одном CPU узлы делят процессор, поэтому порог с запасом)"
+    )
+    nodes.set_defaults(func=bench_nodes)
+
+    respawn = subparsers.add_parser("respawn", help="Падение воркера посреди запроса и его перезапуск супервизором")
+    respawn.add_argument("--workers", type=int, default=2)
+    respawn.add_argument("--queries", type=int, default=6)
+    respawn.add_argument("--pages-per-query", type=int, default=3)
+    respawn.add_argument("--crash-after", type=int, default=4, help="Воркер 1 падает после стольких страниц")
+    respawn.set_defaults(func=bench_respawn)
+
+    extraction = subparsers.add_parser("extraction", help="Сравнение движков извлечения на синтетических страницах")
+    extraction.add_argument("--pages", default="fixtures/serp")
+    extraction.add_argument("--repeat", type=int, default=20)
+    extraction.set_defaults(func=bench_extraction)
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    Config.logger = logging.getLogger()
+
+    arguments = parse_args()
+    asyncio.run(arguments.func(arguments))
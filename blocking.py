@@ -0,0 +1,50 @@
+from playwright.async_api import Page
+from selectolax.parser import HTMLParser
+
+CAPTCHA_SELECTORS = (
+    "#b_captcha", ".cf-turnstile", "#challenge-form", "iframe[src*='challenges.cloudflare.com']",
+    "script[src*='turnstile']"
+)
+SOFT_BLOCK_MARKERS = (
+    "unusual traffic", "необычный трафик", "too many requests", "слишком много запросов",
+    "our systems have detected", "наши системы обнаружили"
+)
+
+CLASSIFY_SCRIPT = """
+([captchaSelectors, softBlockMarkers]) => {
+    if (captchaSelectors.some((sel) => document.querySelector(sel))) return "captcha";
+    if (document.querySelector("li.b_algo")) return "ok";
+
+    const text = (document.body ? document.body.textContent : "").toLowerCase();
+    if (softBlockMarkers.some((marker) => text.includes(marker))) return "soft_block";
+    return document.querySelector("li.b_no") ? "empty" : "soft_block";
+}
+"""
+
+
+class BlockClassifier:
+    OK = "ok"
+    CAPTCHA = "captcha"
+    EMPTY = "empty"
+    SOFT_BLOCK = "soft_block"
+
+    @staticmethod
+    def classify_html(html: str) -> str:
+        tree = HTMLParser(html)
+        if any(tree.css_first(sel) for sel in CAPTCHA_SELECTORS):
+            return BlockClassifier.CAPTCHA
+
+        if tree.css_first("li.b_algo"):
+            return BlockClassifier.OK
+
+        text = (tree.body.text() if tree.body else "").lower()
+        if any(marker in text for marker in SOFT_BLOCK_MARKERS):
+            return BlockClassifier.SOFT_BLOCK
+
+        # пустой выдачей считается только явное "ничего не найдено"; страница без результатов и без этого признака -
+        # тихое ограничение прокси
+        return BlockClassifier.EMPTY if tree.css_first("li.b_no") else BlockClassifier.SOFT_BLOCK
+
+    @staticmethod
+    async def classify_page(page: Page) -> str:
+        return await page.evaluate(CLASSIFY_SCRIPT, [list(CAPTCHA_SELECTORS), list(SOFT_BLOCK_MARKERS)])
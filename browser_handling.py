@@ -1,318 +1,561 @@
 import asyncio
-import base64
 import time
-import re
 import traceback
-from random import uniform, randint
-from typing import List, Optional, Union, Dict, Any
+from collections import deque
+from typing import List, Optional, Dict, Any, Deque, Tuple, Set
 from multiprocessing import Queue
-from urllib.parse import urlparse, parse_qs, unquote, urljoin
 
-from playwright.async_api import async_playwright, Page, Browser
-from playwright_stealth import Stealth
+from playwright.async_api import Page
 from playwright._impl._errors import TimeoutError, TargetClosedError
-from selectolax.parser import HTMLParser
 
+from archive import HtmlArchive
+from blocking import BlockClassifier
+from browser_pool import BrowserPool
+from concurrency import AimdController, HostLoad
 from config import Config
-from models import QueueMessage, ProxyData, SearchResult
-from test import logger
+from extraction import Extractor
+from metrics import metrics
+from models import QueueMessage, ProxyData, QueryLease, ResultBatch, ArchivedPage
+from pacing import Pacer
+from proxy_pool import ProxyPool
+from routing import ResourceRouter
+from rpc import RpcClient
 from utils import Utils as Ut
 
 
 class ParserTask:
     C_PAGE = "c_page"
     C_QUERY = "c_query"
+    C_MKT = "c_mkt"
+    C_LOCALE = "c_locale"
+    C_LEASE = "c_lease"
+    C_PROXY = "c_proxy"
+    C_PREFETCH_PAGE = "c_prefetch_page"
+    C_PREFETCH = "c_prefetch"
+    C_FALLBACK = "c_fallback"
     C_URL = "c_url"
+    C_ERRORS = "c_errors"
+    C_FINISHED = "c_finished"
     COUNT_OF_PAGE = "count_of_page"
     COUNT_OF_RESULT = "count_of_result"
 
+    DIRECT = "direct"
+    INTERACTIVE = "interactive"
+
     USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.6367.207 Safari/537.36"
 
-    def __init__(self, queue_in: Queue, queue_out: Queue, pages_count: int, process_id: int, datetime_of_start: str):
+    def __init__(self, queue_in: Queue, queue_out: Queue, pages_count: int, process_id: int, datetime_of_start: str,
+                 proxies: List[ProxyData]):
         self.queue_in: Queue = queue_in
         self.queue_out: Queue = queue_out
         self.pages_count: int = pages_count
         self.process_id: int = process_id
         self.datetime_of_start: str = datetime_of_start
 
+        # таблица прокси передается один раз при запуске, дальше по очередям ходят только их id
+        self.proxies: Dict[int, ProxyData] = {proxy.id: proxy for proxy in proxies}
         self.proxy: Optional[ProxyData] = None
-        self.playwright_obj = None
-        self.browser: Optional[Browser] = None
-        self.context = None
+        self.proxy_lock = asyncio.Lock()
         self.all_pages: Dict[int, Dict[str, Any]] = {}
+        self.query_buffer: Deque[QueryLease] = deque()
+        self.query_buffer_lock = asyncio.Lock()
+        self.queries_exhausted: bool = False
+        self.retired_tabs: Set[int] = set()
+        self.router: Optional[ResourceRouter] = ResourceRouter.from_config() if Config.BLOCK_RESOURCES else None
+        self.browser_pool = BrowserPool(user_agent=self.USER_AGENT, router=self.router, warm_contexts=Config.WARM_CONTEXTS)
+        self.rpc = RpcClient(
+            queue_in=queue_in, queue_out=queue_out, process_id=process_id, orphan_handler=self.on_orphan_reply
+        )
+        self.metrics_task: Optional[asyncio.Task] = None
+        self.heartbeat_task: Optional[asyncio.Task] = None
+        self.tab_controller = AimdController(
+            name=f"вкладок процесса {process_id}", min_limit=1, max_limit=pages_count,
+            initial=Config.CONCURRENCY_INITIAL_TABS if Config.ADAPTIVE_CONCURRENCY else pages_count
+        )
+        self.concurrency_task: Optional[asyncio.Task] = None
+        self.pacer = Pacer.from_config()
 
         asyncio.run(self.run_tasks())
 
     async def run_tasks(self):
+        # процесс, перезапущенный супервизором, ответвлен от координатора и унаследовал его реестр со всеми собранными
+        # метриками - без сброса они ушли бы координатору повторно под id нового воркера
+        metrics.take_snapshot()
+
         new_logger = await Ut.add_logging(process_id=self.process_id, datetime_of_start=self.datetime_of_start)
         Config.logger = new_logger
 
         Config.logger.info("Был успешно запущен новый процесс!")
 
-        await self.get_new_browser_obj()
+        await self.rpc.start()
+        self.metrics_task = asyncio.create_task(self.report_metrics_loop())
+        self.heartbeat_task = asyncio.create_task(self.heartbeat_loop())
+        if Config.ADAPTIVE_CONCURRENCY:
+            self.concurrency_task = asyncio.create_task(self.adjust_concurrency_loop())
+
+        try:
+            # воркер сверх лимита координатора ждет первую аренду здесь, не запуская браузер и не занимая прокси
+            async with self.query_buffer_lock:
+                await self.lease_queries()
+
+            if not self.query_buffer:
+                Config.logger.info("Поисковых запросов нет! Процесс завершается без запуска браузера")
+                return
+
+            await self.get_new_browser_obj()
+
+            tasks = []
+            for page_id in self.all_pages:
+                tasks.append(self.queries_iteration_wrapper(page_id=page_id))
 
-        tasks = []
-        for page_id in self.all_pages:
-            tasks.append(self.queries_iteration_wrapper(page_id=page_id))
+            await asyncio.gather(*tasks)
+            if self.retired_tabs and len(self.retired_tabs) == len(self.all_pages) and not self.queries_exhausted:
+                # ненулевой код выхода - супервизор заменит процесс, в котором не осталось рабочих вкладок
+                raise RuntimeError("Все вкладки процесса выведены из работы")
 
-        await asyncio.gather(*tasks)
+        except Exception:
+            # ненулевой код выхода - сигнал супервизору перезапустить процесс
+            Config.logger.critical(f"Процесс завершается с ошибкой!\n{traceback.format_exc()}")
+            raise
+
+        finally:
+            await self.return_leases()
+            await self.browser_pool.stop()
+            # браузеры закрыты - прокси можно отдать другому воркеру, не дожидаясь, пока координатор заметит выход
+            if self.proxy is not None:
+                await self.rpc.notify(msg_type=Ut.RELEASE_PROXY, data=self.proxy.id)
+                self.proxy = None
+
+            self.metrics_task.cancel()
+            self.heartbeat_task.cancel()
+            if self.concurrency_task is not None:
+                self.concurrency_task.cancel()
+
+            await self.report_metrics()
+            await self.rpc.stop()
+            await Ut.stop_logging()
 
     async def get_new_proxy(self) -> bool:
-        self.queue_out.put(QueueMessage(msg_type=Ut.GET_NEW_PROXY, data=self.proxy))
+        old_proxy_id = self.proxy.id if self.proxy is not None else None
         Config.logger.info("Запросил новый прокси...")
 
         while True:
-            msg = await Ut.get_message_from_queue(queue=self.queue_in)
-            if msg is None:
-                continue
+            try:
+                msg = await self.rpc.request(msg_type=Ut.GET_NEW_PROXY, data=old_proxy_id)
 
-            if msg.msg_type == Ut.SEND_NEW_PROXY:
-                self.proxy = msg.data
-                Config.logger.info(f"Получил новый прокси: {self.proxy.__str__}")
-                return True
+            except asyncio.TimeoutError:
+                # старый прокси уже освобожден первым запросом
+                old_proxy_id = None
+                Config.logger.warning("Не дождался свободного прокси! Запрашиваю заново...")
+                continue
 
-            time.sleep(0.1)
+            self.proxy = self.proxies[msg.data]
+            Config.logger.info(f"Получил новый прокси: {self.proxy}")
+            return True
 
     async def get_new_query(self, page_id: int) -> bool:
-        self.queue_out.put(QueueMessage(msg_type=Ut.GET_NEW_QUERY))
+        await self.complete_query(page_id=page_id)
+        await self.cancel_prefetch(page_id=page_id)
+        self.all_pages[page_id][self.C_FALLBACK] = False
         Config.logger.info("Запросил новый поисковый запрос...")
 
+        async with self.query_buffer_lock:
+            if not self.query_buffer and not self.queries_exhausted:
+                await self.lease_queries()
+
+            lease = await self.take_lease(locale=self.all_pages[page_id][self.C_LOCALE])
+
+        query, mkt = Ut.split_market(lease.query) if lease else (None, Config.DEFAULT_MKT)
+        self.all_pages[page_id][self.C_LEASE] = lease
+        self.all_pages[page_id][self.C_QUERY] = query
+        self.all_pages[page_id][self.C_MKT] = mkt
+        self.all_pages[page_id][self.COUNT_OF_PAGE] = lease.start_page - 1 if lease else 0
+        self.all_pages[page_id][self.COUNT_OF_RESULT] = lease.start_position if lease else 0
+        Config.logger.info(f"Получил новый поисковый запрос: {self.all_pages[page_id][self.C_QUERY]}")
+        return True
+
+    async def take_lease(self, locale: Optional[str]) -> Optional[QueryLease]:
+        # вкладке достается запрос ее рынка, если он есть в буфере - контекст не приходится менять
+        for n, lease in enumerate(self.query_buffer):
+            if Ut.split_market(lease.query)[1] == locale:
+                del self.query_buffer[n]
+                return lease
+
+        return self.query_buffer.popleft() if self.query_buffer else None
+
+    async def lease_queries(self):
+        batch_size = Config.QUERY_LEASE_BATCH or self.pages_count
         while True:
-            msg = await Ut.get_message_from_queue(queue=self.queue_in)
-            if msg is None:
+            try:
+                msg = await self.rpc.request(msg_type=Ut.GET_QUERY_BATCH, data=batch_size)
+
+            except asyncio.TimeoutError:
+                Config.logger.warning("Не дождался поисковых запросов! Запрашиваю заново...")
                 continue
 
-            if msg.msg_type == Ut.SEND_NEW_QUERY:
-                self.all_pages[page_id][self.C_QUERY] = msg.data
-                Config.logger.info(f"Получил новый поисковый запрос: {msg.data}")
-                return True
+            if not msg.data:
+                self.queries_exhausted = True
+
+            self.query_buffer.extend(msg.data)
+            Config.logger.info(f"Арендовал поисковые запросы: {len(msg.data)}")
+            return
+
+    async def complete_query(self, page_id: int):
+        lease = self.all_pages[page_id].get(self.C_LEASE)
+        if lease is None:
+            return
 
-            time.sleep(0.1)
+        # finished - выдача пройдена до конца, только такой запрос координатор кэширует целиком
+        await self.rpc.notify(msg_type=Ut.COMPLETE_QUERY, data={
+            "lease_id": lease.lease_id, "finished": self.all_pages[page_id][self.C_FINISHED]
+        })
+        self.all_pages[page_id][self.C_LEASE] = None
+        self.all_pages[page_id][self.C_FINISHED] = False
+
+    async def requeue_query(self, page_id: int):
+        lease = self.all_pages[page_id][self.C_LEASE]
+        if lease is None:
+            return
+
+        await self.rpc.notify(msg_type=Ut.REQUEUE_QUERY, data={
+            "lease_id": lease.lease_id,
+            "page": self.all_pages[page_id][self.COUNT_OF_PAGE] + 1,
+            "position": self.all_pages[page_id][self.COUNT_OF_RESULT]
+        })
+        self.all_pages[page_id][self.C_LEASE] = None
+        # запрос снова в очереди координатора - пустой ответ раньше не значит, что запросов больше нет
+        self.queries_exhausted = False
+
+    async def rotate_proxy(self, blocked_proxy: ProxyData):
+        async with self.proxy_lock:
+            # несколько вкладок могли упереться в блокировку одного прокси - меняем его один раз
+            if self.proxy is not None and self.proxy.id == blocked_proxy.id:
+                await self.get_new_proxy()
+
+    async def return_leases(self):
+        lease_ids = [lease.lease_id for lease in self.query_buffer]
+        self.query_buffer.clear()
+
+        for page_data in self.all_pages.values():
+            if page_data.get(self.C_LEASE) is not None:
+                lease_ids.append(page_data[self.C_LEASE].lease_id)
+                page_data[self.C_LEASE] = None
+
+        if lease_ids:
+            await self.rpc.notify(msg_type=Ut.RETURN_QUERIES, data=lease_ids)
+            Config.logger.info(f"Вернул координатору незавершенные запросы: {len(lease_ids)}")
+
+    async def on_orphan_reply(self, msg: QueueMessage):
+        # ответ пришел после таймаута - возвращаем ресурс координатору, чтобы он не потерялся
+        if msg.msg_type == Ut.SEND_NEW_PROXY and msg.data is not None:
+            await self.rpc.notify(msg_type=Ut.RELEASE_PROXY, data=msg.data)
+
+        elif msg.msg_type == Ut.SEND_QUERY_BATCH and msg.data:
+            await self.rpc.notify(msg_type=Ut.RETURN_QUERIES, data=[lease.lease_id for lease in msg.data])
+
+    async def report_proxy(self, outcome: str, latency: Optional[float] = None, proxy: Optional[ProxyData] = None):
+        proxy = proxy or self.proxy
+        if proxy is None:
+            return
+
+        data = {"proxy_id": proxy.id, "outcome": outcome, "latency": latency}
+        metrics.inc("proxy_outcomes", proxy=proxy.id, outcome=outcome)
+        self.pacer.record(proxy_id=proxy.id, blocked=outcome == ProxyPool.CAPTCHA)
+        self.tab_controller.record(outcome=outcome, latency=latency)
+        if latency is not None:
+            metrics.observe("proxy_latency_seconds", latency, proxy=proxy.id)
+
+        if self.router is not None:
+            data.update(await self.router.take_counters(key=proxy.id))
+
+        await self.rpc.notify(msg_type=Ut.REPORT_PROXY, data=data)
+
+    async def report_metrics(self):
+        snapshot = metrics.take_snapshot()
+        if snapshot["counters"] or snapshot["histograms"]:
+            await self.rpc.notify(msg_type=Ut.METRICS, data=snapshot)
+
+    async def report_metrics_loop(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(Config.METRICS_REPORT_INTERVAL)
+            # насколько позже срока проснулись - сколько цикл событий был занят синхронной работой
+            metrics.observe("event_loop_lag_seconds", time.perf_counter() - started - Config.METRICS_REPORT_INTERVAL)
+            await self.report_metrics()
 
-    async def send_data_to_file(self, search_results: List[SearchResult]):
-        self.queue_out.put(QueueMessage(msg_type=Ut.UPLOAD_DATA, data=search_results))
+    async def heartbeat_loop(self):
+        while True:
+            await self.rpc.notify(msg_type=Ut.WORKER_HEARTBEAT)
+            await asyncio.sleep(Config.WORKER_HEARTBEAT_INTERVAL)
+
+    async def adjust_concurrency_loop(self):
+        while True:
+            await asyncio.sleep(Config.CONCURRENCY_WINDOW)
+            cpu, memory = HostLoad.sample()
+            metrics.set_gauge("active_tabs", self.tab_controller.adjust(cpu=cpu, memory=memory))
+
+    async def wait_tab_slot(self, page_id: int):
+        # вкладки сверх текущего лимита простаивают между запросами
+        while page_id >= self.tab_controller.limit and not self.queries_exhausted:
+            await asyncio.sleep(1)
+
+    async def send_data_to_file(self, batch: ResultBatch):
+        await self.rpc.notify(msg_type=Ut.UPLOAD_DATA, data=batch)
         Config.logger.info("Отправил данные на выгрузку в файл!")
 
     async def get_new_browser_obj(self) -> bool:
         Config.logger.info("Пробую получить новый браузер...")
 
-        if self.browser is not None:
-            await self.browser.close()
-            Config.logger.info("Закрыл старый браузер")
-
-        if self.playwright_obj is not None:
-            await self.playwright_obj.stop()
-            Config.logger.info("Остановил старый playwright_obj")
-
-        self.playwright_obj = await async_playwright().start()
-        Config.logger.info("Запустил новый экземпляр playwright_obj")
+        await self.browser_pool.start()
 
         if self.proxy is None:
             await self.get_new_proxy()
 
-        self.browser = await self.playwright_obj.chromium.launch(
-            headless=Config.HEADLESS,
-            proxy={
-                "server": f"http://{self.proxy.host}:{self.proxy.port}",
-                "username": self.proxy.username,
-                "password": self.proxy.password
-            }
-        )
-        Config.logger.info("Запустил новый браузер")
-
-        self.context = await self.browser.new_context(
-            locale="ru-RU",
-            extra_http_headers={"Accept-Language": "ru-RU,ru;q=0.9"},
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                       "AppleWebKit/537.36 (KHTML, like Gecko) "
-                       "Chrome/124.0.6367.207 Safari/537.36"
-        )
-        Config.logger.info("Запустил новый контекст браузера")
-
         for n in range(self.pages_count):
-            new_page = await self.context.new_page()
-            if n in self.all_pages:
-                # при запросі всього сразу - капча
-                # if self.all_pages[n][self.C_URL] is not None:
-                #     await new_page.goto(self.all_pages[n][self.C_URL])
-
-                self.all_pages[n][self.C_PAGE] = new_page
-
-            else:
+            if n not in self.all_pages:
                 self.all_pages[n] = {
-                    self.C_PAGE: new_page, self.C_URL: None, self.C_QUERY: None,
+                    self.C_PAGE: None, self.C_URL: None, self.C_QUERY: None, self.C_MKT: Config.DEFAULT_MKT,
+                    self.C_LOCALE: None, self.C_LEASE: None, self.C_PROXY: None,
+                    self.C_PREFETCH_PAGE: None, self.C_PREFETCH: None, self.C_FALLBACK: False, self.C_ERRORS: 0,
+                    self.C_FINISHED: False,
                     self.COUNT_OF_PAGE: 0, self.COUNT_OF_RESULT: 0
                 }
 
-            Config.logger.info(f"Открыл новую вкладку: {n}")
+            # при запросі всього сразу - капча
+            await self.open_tab(page_id=n)
 
         return True
 
+    async def open_tab(self, page_id: int):
+        page_data = self.all_pages[page_id]
+        await self.cancel_prefetch(page_id=page_id)
+
+        await self.browser_pool.close_page(
+            proxy=page_data[self.C_PROXY], page=page_data[self.C_PAGE], locale=page_data[self.C_LOCALE]
+        )
+        if page_data[self.C_PREFETCH_PAGE] is not None:
+            await self.browser_pool.close_page(
+                proxy=page_data[self.C_PROXY], page=page_data[self.C_PREFETCH_PAGE], locale=page_data[self.C_LOCALE]
+            )
+
+        page_data[self.C_PROXY] = self.proxy
+        page_data[self.C_LOCALE] = page_data[self.C_MKT]
+        page_data[self.C_PAGE] = await self.browser_pool.new_page(proxy=self.proxy, locale=page_data[self.C_LOCALE])
+        page_data[self.C_PREFETCH_PAGE] = None
+        if Config.NAVIGATION_MODE == self.DIRECT and Config.PREFETCH_NEXT_PAGE:
+            page_data[self.C_PREFETCH_PAGE] = await self.browser_pool.new_page(
+                proxy=self.proxy, locale=page_data[self.C_LOCALE]
+            )
+
+        Config.logger.info(f"Открыл новую вкладку: {page_id}")
+
+    async def ensure_tab_context(self, page_id: int):
+        # после смены прокси или рынка запроса вкладка переезжает в контекст (прокси, локаль), прогретый если есть
+        page_data = self.all_pages[page_id]
+        tab_proxy = page_data[self.C_PROXY]
+        if tab_proxy is None or tab_proxy.id != self.proxy.id or page_data[self.C_LOCALE] != page_data[self.C_MKT]:
+            await self.open_tab(page_id=page_id)
+
+    async def recover_tab(self, page_id: int):
+        Config.logger.error(f"Вкладка {page_id} была закрыта! Восстанавливаю только ее...")
+
+        page_data = self.all_pages[page_id]
+        await self.browser_pool.recover(
+            proxy=page_data[self.C_PROXY] or self.proxy, locale=page_data[self.C_LOCALE] or page_data[self.C_MKT]
+        )
+        await self.open_tab(page_id=page_id)
+
+        if page_data[self.C_URL] is not None:
+            await page_data[self.C_PAGE].goto(page_data[self.C_URL])
+
     async def make_search_query(self, page_id: int, retries: int = 3):
         page: Page = await self.get_lambda_c_page(page_id=page_id)
         query: str = await self.get_lambda_c_query(page_id=page_id)
 
         try:
-            await page().goto(Ut.BING)  # temp
+            with metrics.timer("goto", proxy=self.proxy.id):
+                await page().goto(Ut.BING)  # temp
 
             await page().click("#sb_form_q", timeout=10000)
-            await asyncio.sleep(uniform(0.1, 0.5))
+            await self.pacer.pause(page_id=page_id, proxy_id=self.proxy.id, kind="typing")
             await page().fill("#sb_form_q", "")
-            await asyncio.sleep(uniform(0.1, 0.5))
+            await self.pacer.pause(page_id=page_id, proxy_id=self.proxy.id, kind="typing")
             await page().fill("#sb_form_q", query())
-            await asyncio.sleep(uniform(0.1, 0.5))
+            await self.pacer.pause(page_id=page_id, proxy_id=self.proxy.id, kind="typing")
             await page().locator("#sb_form").evaluate("form => form.submit()")
 
             return
 
         except TargetClosedError:
-            logger.error("Браузер был закрыт! Запускаю заново...")
-
-            await self.get_new_browser_obj()
+            await self.recover_tab(page_id=page_id)
 
         except TimeoutError:
             if await self.check_bnp_container(page_id=page_id):
                 Config.logger.info("Кликнул по кнопке принятия куков!")
 
+            else:
+                await self.report_proxy(outcome=ProxyPool.TIMEOUT)
+
         if retries:
-            logger.info(f"Пробую заново выполнить поиск по запросу: {query()}. Попыток: {retries}")
+            Config.logger.info(f"Пробую заново выполнить поиск по запросу: {query()}. Попыток: {retries}")
             return await self.make_search_query(page_id=page_id, retries=retries - 1)
 
-        else:
-            logger.error(f"Не удалось выполнить поиск по запросу {query()}!")
-
-    @staticmethod
-    async def clean_bing_href(href: str) -> Union[str, None]:
-        if not href or href.startswith("javascript:") or href == "#":
-            return None
-
-        if href.startswith("/"):
-            href = urljoin(Ut.BING, href)
-
-        p = urlparse(href)
-        if p.netloc and not p.netloc.endswith("bing.com") and p.netloc != "go.microsoft.com":
-            return href
-
-        qs = parse_qs(p.query)
-        for key in ("u", "r", "url", "target", "mediaurl"):
-            val = qs.get(key) or qs.get(key.upper())
-            if val and val[0]:
-                url = unquote(val[0])
-                if "%2F" in url or "%3A" in url:
-                    url = unquote(url)
-
-                return url
-
-        return None
-
-    async def _text(self, el) -> str:
-        return re.sub(r"\s+", " ", el.text(strip=True)) if el else ""
+        raise RuntimeError(f"Не удалось выполнить поиск по запросу {query()}!")
 
     async def parse_data(
             self, page_id: int, count_of_page: int, count_of_result: int, max_snippet_len: int = 300
-    ) -> List[SearchResult]:
+    ) -> List[Tuple[str, str, str, str]]:
         page: Page = await self.get_lambda_c_page(page_id=page_id)
+        start_position = count_of_result
+        html = await page().content() if Config.ARCHIVE_HTML else None
 
-        tree = HTMLParser(await page().content())
-        out = []
-
-        lang = await page().evaluate("document.documentElement.lang")
-
-        container = tree.css_first("#b_results") or tree
-        items = container.css("li.b_algo")
-
-        for li in items:
-            a = li.css_first("h2 a") or li.css_first("h3 a") or li.css_first(".b_title a")
-            if not a:
-                continue
+        try:
+            with metrics.timer("parse_data", engine=Config.EXTRACTION_ENGINE):
+                lang, records = await Extractor.from_page(
+                    page=page(), engine=Config.EXTRACTION_ENGINE, max_snippet_len=max_snippet_len, html=html
+                )
 
-            raw_href = a.attrs.get("href", "")
-            url = await self.clean_bing_href(raw_href) or (raw_href if raw_href else None)
-            if not url:
-                continue
+        except TargetClosedError:
+            raise
 
-            title = await self._text(a)
-            if not title:
-                continue
+        except Exception as ex:
+            if Config.EXTRACTION_ENGINE == Extractor.SELECTOLAX:
+                raise
 
-            snippet = ""
-            for sel in (".b_caption p", ".b_snippet", ".b_desc", ".b_caption", "p"):
-                el = li.css_first(sel)
-                snippet = await self._text(el)
-                if snippet and len(snippet) > 10:
-                    break
-
-            if max_snippet_len and snippet:
-                snippet = snippet[:max_snippet_len].rstrip()
+            Config.logger.warning(f"Не удалось собрать данные скриптом на странице: {ex}. Пробую через selectolax...")
+            with metrics.timer("parse_data", engine=Extractor.SELECTOLAX):
+                lang, records = await Extractor.from_page(
+                    page=page(), engine=Extractor.SELECTOLAX, max_snippet_len=max_snippet_len, html=html
+                )
 
+        items = []
+        for title, url, snippet in records:
             count_of_result += 1
 
-            if url.startswith("a1"):
-                url = url[2:]
-                url = url + "=" * (-len(url) % 4)
-                try:
-                    url = base64.b64decode(url)
-
-                except Exception:
-                    url = base64.urlsafe_b64decode(url)
-
-                url = url.decode("utf-8")
-
-            out.append(SearchResult(
-                query=page().url,
-                page=str(count_of_page),
-                position=str(count_of_result),
-                title=title,
-                url=url,
-                snippet=snippet,
-                lang=lang,
-                mkt="ru-RU",
-                country="ru",
-                user_agent=self.USER_AGENT,
-                proxy=self.proxy.__str__()
-            ).to_list())
-            logger.info(f"Собрал результат! Позиция: {count_of_result} | {self.all_pages[page_id][self.C_QUERY]}")
-
-        await self.send_data_to_file(search_results=out)
-        return out
-
-    async def smooth_scroll_wheel(self, page_id: int, distance=1500, step=50, delay=0.03):
+            items.append((str(count_of_result), title, url, snippet))
+            Config.logger.info(
+                f"Собрал результат! Позиция: {count_of_result} | {self.all_pages[page_id][self.C_QUERY]}",
+                extra={"stage": "result"}
+            )
+
+        await self.send_data_to_file(batch=ResultBatch(
+            query=self.all_pages[page_id][self.C_QUERY],
+            page=str(count_of_page),
+            lang=lang,
+            country=Ut.market_country(self.all_pages[page_id][self.C_MKT]),
+            mkt=self.all_pages[page_id][self.C_MKT],
+            user_agent=self.USER_AGENT,
+            proxy=self.proxy.__str__(),
+            items=items
+        ))
+        if html is not None:
+            await self.archive_page(page_id=page_id, page_number=count_of_page, start_position=start_position, html=html)
+
+        return items
+
+    async def archive_page(self, page_id: int, page_number: int, start_position: int, html: str):
+        # сжатие в потоке, чтобы вкладки не ждали; на координатор уходят уже сжатые байты
+        loop = asyncio.get_running_loop()
+        with metrics.timer("archive_compress"):
+            digest, codec, data, raw_size = await loop.run_in_executor(None, HtmlArchive.compress, html)
+
+        await self.rpc.notify(msg_type=Ut.ARCHIVE_PAGE, data=ArchivedPage(
+            query=self.all_pages[page_id][self.C_QUERY],
+            page=page_number,
+            mkt=self.all_pages[page_id][self.C_MKT],
+            country=Ut.market_country(self.all_pages[page_id][self.C_MKT]),
+            user_agent=self.USER_AGENT,
+            proxy=self.proxy.__str__(),
+            start_position=start_position,
+            digest=digest,
+            codec=codec,
+            data=data,
+            raw_size=raw_size
+        ))
+
+    async def smooth_scroll_wheel(self, page_id: int, distance: int = 1500):
         page: Page = await self.get_lambda_c_page(page_id=page_id)
+        profile = self.pacer.get_profile(proxy_id=self.proxy.id)
 
         scrolled = 0
-        while scrolled < distance:
-            await page().mouse.wheel(0, step)
-            scrolled += step
-            await asyncio.sleep(delay)
+        with metrics.timer("smooth_scroll_wheel"):
+            while scrolled < distance:
+                await page().mouse.wheel(0, profile.scroll_step)
+                scrolled += profile.scroll_step
+                await self.pacer.sleep(page_id=page_id, seconds=profile.scroll_delay, kind="scroll")
 
     async def queries_iteration_wrapper(self, page_id: int):
-        try:
-            return await self.queries_iteration(page_id=page_id)
+        page_data = self.all_pages[page_id]
+        while True:
+            try:
+                return await self.queries_iteration(page_id=page_id)
 
-        except TimeoutError:
-            if await self.check_bnp_container(page_id=page_id):
-                Config.logger.info("Кликнул по кнопке принятия куков!")
+            except TimeoutError:
+                if await self.check_bnp_container(page_id=page_id):
+                    # новый проход начнется с complete_query - недособранный запрос сначала возвращается в очередь
+                    Config.logger.info("Кликнул по кнопке принятия куков!")
+                    await self.cancel_prefetch(page_id=page_id)
+                    await self.requeue_query(page_id=page_id)
+                    continue
+
+                Config.logger.critical(traceback.format_exc())
+
+            except Exception:
+                Config.logger.critical(traceback.format_exc())
+
+            # начатый запрос продолжит другая вкладка с той же страницы; повторы запроса ограничены координатором
+            await self.cancel_prefetch(page_id=page_id)
+            await self.requeue_query(page_id=page_id)
+
+            page_data[self.C_ERRORS] += 1
+            errors = page_data[self.C_ERRORS]
+            metrics.inc("tab_errors")
+            if errors >= Config.TAB_MAX_ERRORS:
+                # соседние вкладки процесса продолжают работу - пересоздаем только эту
+                Config.logger.error(f"Вкладка {page_id}: {errors} ошибок подряд без собранной страницы! Пересоздаю ее")
+                try:
+                    await self.open_tab(page_id=page_id)
 
-        except Exception:
-            logger.critical(traceback.format_exc())
+                except Exception:
+                    Config.logger.critical(f"Не удалось пересоздать вкладку {page_id}! Вывожу ее из работы")
+                    self.retired_tabs.add(page_id)
+                    return
 
-        return await self.queries_iteration_wrapper(page_id=page_id)
+                page_data[self.C_ERRORS] = 0
+                metrics.inc("tab_reopens")
+                continue
+
+            delay = min(Config.TAB_RETRY_BACKOFF * 2 ** (errors - 1), Config.TAB_RETRY_BACKOFF_MAX)
+            Config.logger.warning(f"Перезапускаю вкладку {page_id} через {delay:.0f}s. Ошибок подряд: {errors}")
+            await asyncio.sleep(delay)
 
     async def queries_iteration(self, page_id: int):
         page: Page = await self.get_lambda_c_page(page_id=page_id)
         query = await self.get_lambda_c_query(page_id=page_id)
 
-        await Stealth().apply_stealth_async(page())
-
-        await page().goto(Ut.BING)
+        await self.wait_tab_slot(page_id=page_id)
+        with metrics.timer("goto", proxy=self.proxy.id):
+            await page().goto(Ut.BING)
 
         while True:
+            await self.complete_query(page_id=page_id)
+            await self.wait_tab_slot(page_id=page_id)
             await self.get_new_query(page_id=page_id)
             if query() is None:
                 Config.logger.info("Новых запросов не поступило! Задача закончила свою работу.")
                 return
 
-            await self.make_search_query(page_id=page_id)
+            await self.ensure_tab_context(page_id=page_id)
+
+            lease: QueryLease = self.all_pages[page_id][self.C_LEASE]
+            if Config.NAVIGATION_MODE == self.DIRECT or lease.start_page > 1:
+                if lease.start_page > 1:
+                    Config.logger.info(f"Продолжаю запрос {query()} со страницы {lease.start_page}")
+
+                await self.open_serp_page(page_id=page_id, page_number=lease.start_page)
+
+            else:
+                await self.make_search_query(page_id=page_id)
 
             while True:
                 try:
@@ -320,20 +563,31 @@ class ParserTask:
                         break
 
                 except TargetClosedError:
-                    logger.error("Браузер был закрыт! Запускаю заново...")
-
-                    await self.get_new_browser_obj()
+                    await self.recover_tab(page_id=page_id)
 
                 except TimeoutError:
                     if await self.check_bnp_container(page_id=page_id):
                         Config.logger.info("Кликнул по кнопке принятия куков!")
 
+    async def classify_block(self, page_id: int) -> str:
+        page: Page = await self.get_lambda_c_page(page_id=page_id)
+
+        try:
+            return await BlockClassifier.classify_page(page())
+
+        except TargetClosedError:
+            raise
+
+        except Exception:
+            # страница еще грузится - считаем ее обычной и перезагружаем
+            return BlockClassifier.OK
+
     async def check_bnp_container(self, page_id: int) -> bool:
         page = await self.get_lambda_c_page(page_id=page_id)
 
         container = page().locator("#bnp_container")
         if await container.count() > 0 and await container.is_visible():
-            logger.info("Нашел контейнер с куками!")
+            Config.logger.info("Нашел контейнер с куками!")
             await page().locator("#bnp_btn_accept").click()
             return True
 
@@ -345,43 +599,179 @@ class ParserTask:
 
         self.all_pages[page_id][self.C_URL] = page().url
 
+        started = time.monotonic()
         flag = False
+        block = BlockClassifier.SOFT_BLOCK
         for n in range(3):
             try:
-                await page().wait_for_selector("li.b_algo h2 a", timeout=5000)
-                logger.info("Нашел результаты на странице! Собираю их...")
+                with metrics.timer("wait_for_selector", proxy=self.proxy.id):
+                    await page().wait_for_selector("li.b_algo h2 a", timeout=5000)
+
+                Config.logger.info("Нашел результаты на странице! Собираю их...")
                 flag = True
+                break
 
             except TimeoutError:
-                logger.warning(f"Не нашел данных на странице! Попыток: {n}")
+                block = await self.classify_block(page_id=page_id)
+                if block in (BlockClassifier.CAPTCHA, BlockClassifier.EMPTY):
+                    # капча или пустая выдача перезагрузкой не лечатся
+                    break
+
+                # страница без результатов могла не догрузиться - блокировкой она считается, только если не помогли
+                # перезагрузки
+                Config.logger.warning(f"Не нашел данных на странице ({block})! Попыток: {n}")
                 await page().reload()
-                continue
 
         if not flag:
+            if block == BlockClassifier.OK:
+                # страница так и не догрузилась до результатов
+                block = BlockClassifier.SOFT_BLOCK
+
+            if block == BlockClassifier.EMPTY:
+                Config.logger.info(f"Нет результатов по запросу {self.all_pages[page_id][self.C_QUERY]}! Иду дальше...")
+                self.all_pages[page_id][self.C_FINISHED] = True
+                return True
+
+            blocked_proxy = self.all_pages[page_id][self.C_PROXY] or self.proxy
+            metrics.inc("blocks", kind=block, proxy=blocked_proxy.id)
+            Config.logger.warning(f"Страница заблокирована ({block}) на прокси {blocked_proxy.id}")
+            # и капча, и тихое ограничение отправляют прокси в карантин с нарастающим backoff
+            await self.report_proxy(outcome=ProxyPool.CAPTCHA, proxy=blocked_proxy)
+            if block == BlockClassifier.SOFT_BLOCK and Config.NAVIGATION_MODE == self.DIRECT \
+                    and not self.all_pages[page_id][self.C_FALLBACK]:
+                # прямая ссылка не сработала - пробуем обычный путь через главную страницу
+                self.all_pages[page_id][self.C_FALLBACK] = True
+                await self.fallback_to_interactive(page_id=page_id)
+                return
+
+            await self.requeue_query(page_id=page_id)
+            await self.rotate_proxy(blocked_proxy=blocked_proxy)
             return True
 
-        await asyncio.sleep(uniform(0.5, 1))
-        await self.smooth_scroll_wheel(page_id=page_id, distance=randint(200, 500))
+        await self.report_proxy(outcome=ProxyPool.SUCCESS, latency=time.monotonic() - started)
+
+        await self.pacer.pause(page_id=page_id, proxy_id=self.proxy.id, kind="reading")
+        first_scroll = await self.pacer.get_first_scroll(proxy_id=self.proxy.id)
+        await self.smooth_scroll_wheel(page_id=page_id, distance=first_scroll)
 
         self.all_pages[page_id][self.COUNT_OF_PAGE] += 1
 
         parsed_data = await self.parse_data(page_id=page_id, count_of_page=self.all_pages[page_id][self.COUNT_OF_PAGE],
                                             count_of_result=self.all_pages[page_id][self.COUNT_OF_RESULT])
-        logger.info(f"Собрал результаты! Количество")
+        Config.logger.info(f"Собрал результаты! Количество: {len(parsed_data)}")
         self.all_pages[page_id][self.COUNT_OF_RESULT] += len(parsed_data)
+        await self.rpc.notify(msg_type=Ut.PAGE_DONE, data={
+            "lease_id": self.all_pages[page_id][self.C_LEASE].lease_id,
+            "page": self.all_pages[page_id][self.COUNT_OF_PAGE],
+            "rows": len(parsed_data)
+        })
+        self.all_pages[page_id][self.C_ERRORS] = 0
+        # все намеренные паузы с прошлой выгруженной страницы этой вкладки
+        metrics.observe(
+            "page_pacing_seconds", await self.pacer.take_page_delay(page_id=page_id),
+            profile=self.pacer.get_profile(proxy_id=self.proxy.id).name
+        )
+
+        if Config.NAVIGATION_MODE == self.DIRECT:
+            if await self.is_last_serp_page(page_id=page_id):
+                Config.logger.info("Последняя страница выдачи! Иду дальше...")
+                self.all_pages[page_id][self.C_FINISHED] = True
+                return True
+
+            await self.open_serp_page(page_id=page_id, page_number=self.all_pages[page_id][self.COUNT_OF_PAGE] + 1)
+            return
 
-        await self.smooth_scroll_wheel(page_id=page_id, distance=2000)
-        await asyncio.sleep(uniform(0.2, 0.5))
+        full_scroll = self.pacer.get_profile(proxy_id=self.proxy.id).full_scroll
+        await self.smooth_scroll_wheel(page_id=page_id, distance=full_scroll)
+        await self.pacer.pause(page_id=page_id, proxy_id=self.proxy.id, kind="before_pagination")
 
         await page().wait_for_selector(".sb_pagN", timeout=5000)
 
         loc_pag_next = page().locator(".sb_pagN.sb_inactP")
         if await loc_pag_next.count() > 0:
-            logger.info("Кнопка пагинации не активна! Иду дальше...")
+            Config.logger.info("Кнопка пагинации не активна! Иду дальше...")
+            self.all_pages[page_id][self.C_FINISHED] = True
             return True
 
         await page().click(".sb_pagN", timeout=2000)
-        logger.info("Кликнул на пагинацию вперед")
+        Config.logger.info("Кликнул на пагинацию вперед")
+
+    async def open_serp_page(self, page_id: int, page_number: int):
+        url = await Ut.build_search_url(
+            query=self.all_pages[page_id][self.C_QUERY], page_number=page_number, mkt=self.all_pages[page_id][self.C_MKT]
+        )
+
+        prefetch = self.all_pages[page_id][self.C_PREFETCH]
+        if prefetch is not None and prefetch["url"] == url:
+            self.all_pages[page_id][self.C_PREFETCH] = None
+            try:
+                await prefetch["task"]
+                # предзагруженная вкладка становится основной, основная - вкладкой для следующей предзагрузки
+                page_data = self.all_pages[page_id]
+                page_data[self.C_PAGE], page_data[self.C_PREFETCH_PAGE] = (
+                    page_data[self.C_PREFETCH_PAGE], page_data[self.C_PAGE]
+                )
+                Config.logger.info(f"Открыл предзагруженную страницу выдачи {page_number}")
+
+            except Exception:
+                Config.logger.warning(f"Предзагрузка страницы {page_number} не удалась! Открываю заново...")
+                with metrics.timer("goto", proxy=self.proxy.id):
+                    await self.all_pages[page_id][self.C_PAGE].goto(url)
+
+        else:
+            await self.cancel_prefetch(page_id=page_id)
+            with metrics.timer("goto", proxy=self.proxy.id):
+                await self.all_pages[page_id][self.C_PAGE].goto(url)
+
+        await self.start_prefetch(page_id=page_id, page_number=page_number + 1)
+
+    async def start_prefetch(self, page_id: int, page_number: int):
+        prefetch_page: Optional[Page] = self.all_pages[page_id][self.C_PREFETCH_PAGE]
+        if prefetch_page is None:
+            return
+
+        url = await Ut.build_search_url(
+            query=self.all_pages[page_id][self.C_QUERY], page_number=page_number, mkt=self.all_pages[page_id][self.C_MKT]
+        )
+        self.all_pages[page_id][self.C_PREFETCH] = {"url": url, "task": asyncio.create_task(prefetch_page.goto(url))}
+
+    async def cancel_prefetch(self, page_id: int):
+        prefetch = self.all_pages[page_id].get(self.C_PREFETCH)
+        if prefetch is None:
+            return
+
+        prefetch["task"].cancel()
+        try:
+            await prefetch["task"]
+
+        except (asyncio.CancelledError, Exception):
+            pass
+
+        self.all_pages[page_id][self.C_PREFETCH] = None
+
+    async def is_last_serp_page(self, page_id: int) -> bool:
+        page: Page = await self.get_lambda_c_page(page_id=page_id)
+
+        if await page().locator(".sb_pagN").count() == 0:
+            return True
+
+        return await page().locator(".sb_pagN.sb_inactP").count() > 0
+
+    async def fallback_to_interactive(self, page_id: int):
+        page: Page = await self.get_lambda_c_page(page_id=page_id)
+        page_number = self.all_pages[page_id][self.COUNT_OF_PAGE] + 1
+
+        await self.cancel_prefetch(page_id=page_id)
+        if page_number == 1:
+            await self.make_search_query(page_id=page_id)
+            return
+
+        # на дальние страницы форма не ведет - прогреваем сессию главной страницей и повторяем прямой переход
+        await page().goto(Ut.BING)
+        await self.pacer.pause(page_id=page_id, proxy_id=self.proxy.id, kind="warmup")
+        await page().goto(await Ut.build_search_url(
+            query=self.all_pages[page_id][self.C_QUERY], page_number=page_number, mkt=self.all_pages[page_id][self.C_MKT]
+        ))
 
     async def get_lambda_c_page(self, page_id: int):
         return lambda: self.all_pages[page_id][self.C_PAGE]
@@ -0,0 +1,176 @@
+import asyncio
+from collections import OrderedDict
+from typing import Optional, Any, Dict
+
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page, Playwright
+from playwright_stealth import Stealth
+
+from config import Config
+from metrics import metrics
+from models import ProxyData
+from routing import ResourceRouter
+from utils import Utils as Ut
+
+
+class BrowserPool:
+    def __init__(self, user_agent: str, router: Optional[ResourceRouter] = None, warm_contexts: int = 0):
+        self.user_agent: str = user_agent
+        self.router: Optional[ResourceRouter] = router
+        self.warm_contexts: int = warm_contexts
+
+        self.playwright_obj: Optional[Playwright] = None
+        self.browser: Optional[Browser] = None
+        # (прокси, локаль) -> {"context": BrowserContext, "pages": количество открытых вкладок}
+        # порядок - от давно использованных к недавним, контексты без вкладок закрываются сверх warm_contexts
+        self.contexts: OrderedDict = OrderedDict()
+        # вкладки одного процесса работают параллельно: браузер запускается под одной блокировкой, а контекст
+        # каждого ключа создается один раз, даже если его одновременно ждут несколько вкладок
+        self.launch_lock = asyncio.Lock()
+        self.context_locks: Dict[Any, asyncio.Lock] = {}
+
+    async def start(self):
+        if self.playwright_obj is None:
+            self.playwright_obj = await async_playwright().start()
+            Config.logger.info("Запустил экземпляр playwright_obj")
+
+        await self.launch_browser()
+
+    async def launch_browser(self):
+        if self.browser is not None and self.browser.is_connected():
+            return
+
+        async with self.launch_lock:
+            # пока ждали блокировку, браузер могла перезапустить другая вкладка
+            if self.browser is not None and self.browser.is_connected():
+                return
+
+            self.contexts.clear()
+            # прокси задается на уровне контекста, браузер один на процесс
+            self.browser = await self.playwright_obj.chromium.launch(headless=Config.HEADLESS)
+            Config.logger.info("Запустил новый браузер")
+
+    async def stop(self):
+        if self.browser is not None:
+            try:
+                await self.browser.close()
+
+            except Exception:
+                pass
+
+            self.browser = None
+
+        if self.playwright_obj is not None:
+            await self.playwright_obj.stop()
+            self.playwright_obj = None
+
+        self.contexts.clear()
+
+    @staticmethod
+    async def get_context_key(proxy: ProxyData, locale: str) -> Any:
+        return proxy.id, locale
+
+    async def get_context(self, proxy: ProxyData, locale: str) -> BrowserContext:
+        # контекст выдается вместе с занятым местом под вкладку: прогретый контекст без вкладок не закроется в
+        # trim_idle_contexts, пока вызывающий открывает в нем страницу
+        await self.launch_browser()
+
+        key = await self.get_context_key(proxy=proxy, locale=locale)
+        async with self.context_locks.setdefault(key, asyncio.Lock()):
+            if key in self.contexts:
+                self.contexts.move_to_end(key)
+                self.contexts[key]["pages"] += 1
+                metrics.inc("browser_contexts", outcome="warm")
+                return self.contexts[key]["context"]
+
+            context = await self.browser.new_context(
+                proxy={
+                    "server": f"http://{proxy.host}:{proxy.port}",
+                    "username": proxy.username,
+                    "password": proxy.password
+                },
+                locale=locale,
+                extra_http_headers={"Accept-Language": Ut.market_accept_language(locale)},
+                user_agent=self.user_agent
+            )
+            context.on("close", lambda _: self.forget_context(key=key, context=context))
+            if self.router is not None:
+                await self.router.attach(context=context, key=proxy.id)
+
+            self.contexts[key] = {"context": context, "pages": 1}
+            metrics.inc("browser_contexts", outcome="new")
+            Config.logger.info(f"Создал новый контекст браузера для прокси {proxy.id} и локали {locale}")
+            return context
+
+    def forget_context(self, key: Any, context: BrowserContext):
+        # закрылся именно этот контекст, а не созданный позже под тем же ключом
+        context_data = self.contexts.get(key)
+        if context_data is not None and context_data["context"] is context:
+            del self.contexts[key]
+
+    async def new_page(self, proxy: ProxyData, locale: str) -> Page:
+        context = await self.get_context(proxy=proxy, locale=locale)
+        try:
+            page = await context.new_page()
+            await Stealth().apply_stealth_async(page)
+
+        except Exception:
+            # место под вкладку уже занято в get_context - возвращаем его
+            await self.close_page(proxy=proxy, page=None, locale=locale)
+            raise
+
+        return page
+
+    async def close_page(self, proxy: Optional[ProxyData], page: Optional[Page], locale: Optional[str]):
+        if page is not None and not page.is_closed():
+            try:
+                await page.close()
+
+            except Exception:
+                pass
+
+        if proxy is None or locale is None:
+            return
+
+        key = await self.get_context_key(proxy=proxy, locale=locale)
+        context_data = self.contexts.get(key)
+        if context_data is None:
+            return
+
+        context_data["pages"] -= 1
+        if context_data["pages"] <= 0:
+            await self.trim_idle_contexts()
+
+    async def trim_idle_contexts(self):
+        # контекст без вкладок остается прогретым для следующего запроса с тем же прокси и рынком
+        idle = [key for key, context_data in self.contexts.items() if context_data["pages"] <= 0]
+        for key in idle[:max(len(idle) - self.warm_contexts, 0)]:
+            # между закрытиями контекст могли снова занять - проверяем непосредственно перед закрытием
+            context_data = self.contexts.get(key)
+            if context_data is not None and context_data["pages"] <= 0:
+                await self.close_context(key=key)
+
+    async def close_context(self, key: Any):
+        context_data = self.contexts.pop(key, None)
+        if context_data is None:
+            return
+
+        try:
+            await context_data["context"].close()
+
+        except Exception:
+            pass
+
+        Config.logger.info(f"Закрыл контекст браузера {key}")
+
+    async def recover(self, proxy: ProxyData, locale: str):
+        # упал весь браузер - перезапускаем только его, драйвер playwright остается
+        if self.browser is None or not self.browser.is_connected():
+            # перезапуск под блокировкой launch_browser: несколько упавших вкладок поднимут один браузер
+            Config.logger.warning("Браузер отключился! Перезапускаю только браузер...")
+            await self.launch_browser()
+            return
+
+        key = await self.get_context_key(proxy=proxy, locale=locale)
+        context_data = self.contexts.get(key)
+        if context_data is not None and not context_data["context"].pages:
+            await self.close_context(key=key)
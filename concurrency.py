@@ -0,0 +1,93 @@
+import os
+import time
+from statistics import median
+from typing import List, Optional, Tuple
+
+from config import Config
+from proxy_pool import ProxyPool
+
+
+class HostLoad:
+    warned: bool = False
+
+    @staticmethod
+    def sample() -> Tuple[float, float]:
+        # (загрузка CPU %, занятая память %); без psutil - по load average, память не учитывается
+        try:
+            import psutil
+
+        except ImportError:
+            if not HostLoad.warned:
+                HostLoad.warned = True
+                Config.logger.warning(
+                    "psutil не установлен! Адаптивный лимит учитывает только load average, без нехватки памяти"
+                )
+
+            if not hasattr(os, "getloadavg"):
+                return 0.0, 0.0
+
+            return os.getloadavg()[0] / (os.cpu_count() or 1) * 100, 0.0
+
+        return psutil.cpu_percent(interval=None), psutil.virtual_memory().percent
+
+
+class AimdController:
+    def __init__(self, name: str, min_limit: int, max_limit: int, initial: Optional[int] = None):
+        self.name: str = name
+        self.min_limit: int = max(1, min_limit)
+        self.max_limit: int = max(self.min_limit, max_limit)
+        self.limit: int = min(self.max_limit, max(self.min_limit, initial or self.max_limit))
+
+        self.successes: int = 0
+        self.failures: int = 0
+        self.latencies: List[float] = []
+        # лучшая медиана задержки за прошлые окна - от нее считается деградация
+        self.baseline_latency: float = 0.0
+        self.window_started: float = time.monotonic()
+
+    def record(self, outcome: str, latency: Optional[float] = None):
+        if outcome == ProxyPool.SUCCESS:
+            self.successes += 1
+            if latency is not None:
+                self.latencies.append(latency)
+
+        else:
+            self.failures += 1
+
+    def is_window_over(self) -> bool:
+        return time.monotonic() - self.window_started >= Config.CONCURRENCY_WINDOW
+
+    def reset_window(self):
+        self.successes = 0
+        self.failures = 0
+        self.latencies = []
+        self.window_started = time.monotonic()
+
+    def adjust(self, cpu: float, memory: float) -> int:
+        total = self.successes + self.failures
+        host_overloaded = cpu > Config.CONCURRENCY_MAX_CPU or memory > Config.CONCURRENCY_MAX_MEMORY
+        if total < Config.CONCURRENCY_MIN_SAMPLES and not host_overloaded:
+            # мало данных - окно продлевается
+            return self.limit
+
+        fail_rate = self.failures / total if total else 0.0
+        latency = median(self.latencies) if self.latencies else 0.0
+        if latency and (not self.baseline_latency or latency < self.baseline_latency):
+            self.baseline_latency = latency
+
+        latency_degraded = bool(latency) and latency > self.baseline_latency * Config.CONCURRENCY_LATENCY_FACTOR
+        old_limit = self.limit
+        if host_overloaded or latency_degraded or fail_rate > Config.CONCURRENCY_MAX_FAIL_RATE:
+            self.limit = max(self.min_limit, int(self.limit * Config.CONCURRENCY_DECREASE))
+
+        else:
+            self.limit = min(self.max_limit, self.limit + 1)
+
+        if self.limit != old_limit:
+            Config.logger.info(
+                f"Лимит {self.name}: {old_limit} -> {self.limit} (ошибок {fail_rate:.0%}, задержка {latency:.2f}s, "
+                f"базовая {self.baseline_latency:.2f}s, CPU {cpu:.0f}%, память {memory:.0f}%)"
+            )
+
+        self.reset_window()
+        return self.limit
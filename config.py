@@ -10,33 +10,111 @@ from models import ProxyData
 load_dotenv()
 
 
+def get_env_list(name: str, default: str) -> List[str]:
+    return [item.strip() for item in os.getenv(name, default).split(",") if item.strip()]
+
+
 class Config:
     HEADLESS = bool(int(os.getenv("HEADLESS").strip()))
     MAX_BROWSERS = int(os.getenv("MAX_BROWSERS").strip())
     MAX_PAGES_PER_BROWSER = int(os.getenv("MAX_PAGES_PER_BROWSER").strip())
     OUT_FILEPATH = Path(os.path.abspath(os.getenv("OUT_FILEPATH").strip()))
+    OUT_FORMAT = os.getenv("OUT_FORMAT", "csv").strip().lower()
+    WRITER_BATCH_SIZE = int(os.getenv("WRITER_BATCH_SIZE", "500").strip())
+    WRITER_FLUSH_INTERVAL = float(os.getenv("WRITER_FLUSH_INTERVAL", "2").strip())
+    RPC_TIMEOUT = float(os.getenv("RPC_TIMEOUT", "30").strip())
+    NAVIGATION_MODE = os.getenv("NAVIGATION_MODE", "interactive").strip().lower()
+    PREFETCH_NEXT_PAGE = bool(int(os.getenv("PREFETCH_NEXT_PAGE", "0").strip()))
+    EXTRACTION_ENGINE = os.getenv("EXTRACTION_ENGINE", "script").strip().lower()
+    BLOCK_RESOURCES = bool(int(os.getenv("BLOCK_RESOURCES", "0").strip()))
+    BLOCK_ACTION = os.getenv("BLOCK_ACTION", "abort").strip().lower()
+    BLOCK_RESOURCE_TYPES = get_env_list("BLOCK_RESOURCE_TYPES", "image,media,font")
+    BLOCK_URL_PATTERNS = get_env_list(
+        "BLOCK_URL_PATTERNS",
+        r"bing\.com/fd/ls/,bing\.com/th\?,bat\.bing\.com,c\.bing\.com/c\.gif,clarity\.ms,"
+        r"browser\.events\.data\.microsoft\.com"
+    )
+    ALLOW_URL_PATTERNS = get_env_list("ALLOW_URL_PATTERNS", r"captcha,challenge,turing")
+    PROXY_STICKY = bool(int(os.getenv("PROXY_STICKY", "1").strip()))
+    PROXY_EWMA_ALPHA = float(os.getenv("PROXY_EWMA_ALPHA", "0.3").strip())
+    PROXY_MAX_FAILURES = int(os.getenv("PROXY_MAX_FAILURES", "3").strip())
+    PROXY_QUARANTINE_SECONDS = float(os.getenv("PROXY_QUARANTINE_SECONDS", "300").strip())
+    PROXY_QUARANTINE_MAX_SECONDS = float(os.getenv("PROXY_QUARANTINE_MAX_SECONDS", "3600").strip())
+    MAX_QUERY_REQUEUES = int(os.getenv("MAX_QUERY_REQUEUES", "3").strip())
+    QUERY_LEASE_BATCH = int(os.getenv("QUERY_LEASE_BATCH", "0").strip())
+    ADAPTIVE_CONCURRENCY = bool(int(os.getenv("ADAPTIVE_CONCURRENCY", "0").strip()))
+    CONCURRENCY_INITIAL_WORKERS = int(os.getenv("CONCURRENCY_INITIAL_WORKERS", "2").strip())
+    CONCURRENCY_INITIAL_TABS = int(os.getenv("CONCURRENCY_INITIAL_TABS", "1").strip())
+    CONCURRENCY_WINDOW = float(os.getenv("CONCURRENCY_WINDOW", "20").strip())
+    CONCURRENCY_MIN_SAMPLES = int(os.getenv("CONCURRENCY_MIN_SAMPLES", "5").strip())
+    CONCURRENCY_MAX_FAIL_RATE = float(os.getenv("CONCURRENCY_MAX_FAIL_RATE", "0.1").strip())
+    CONCURRENCY_LATENCY_FACTOR = float(os.getenv("CONCURRENCY_LATENCY_FACTOR", "2").strip())
+    CONCURRENCY_DECREASE = float(os.getenv("CONCURRENCY_DECREASE", "0.5").strip())
+    CONCURRENCY_MAX_CPU = float(os.getenv("CONCURRENCY_MAX_CPU", "85").strip())
+    CONCURRENCY_MAX_MEMORY = float(os.getenv("CONCURRENCY_MAX_MEMORY", "85").strip())
+    HREF_CACHE_SIZE = int(os.getenv("HREF_CACHE_SIZE", "100000").strip())
+    DEDUP_KEY = get_env_list("DEDUP_KEY", "")
+    DEDUP_MODE = os.getenv("DEDUP_MODE", "exact").strip().lower()
+    DEDUP_CAPACITY = int(os.getenv("DEDUP_CAPACITY", "10000000").strip())
+    DEDUP_ERROR_RATE = float(os.getenv("DEDUP_ERROR_RATE", "0.001").strip())
+    PACING_PROFILE = os.getenv("PACING_PROFILE", "balanced").strip().lower()
+    PACING_ADAPTIVE = bool(int(os.getenv("PACING_ADAPTIVE", "0").strip()))
+    PACING_SLOWDOWN_BLOCK_RATE = float(os.getenv("PACING_SLOWDOWN_BLOCK_RATE", "0.2").strip())
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "0").strip())
+    METRICS_REPORT_INTERVAL = float(os.getenv("METRICS_REPORT_INTERVAL", "5").strip())
+    METRICS_SNAPSHOT_INTERVAL = float(os.getenv("METRICS_SNAPSHOT_INTERVAL", "30").strip())
+    # обязателен для --listen и --connect: кадры узлов подписываются ключом сессии из этого токена
+    COORDINATOR_TOKEN = os.getenv("COORDINATOR_TOKEN", "").strip()
+    NODE_HEARTBEAT_INTERVAL = float(os.getenv("NODE_HEARTBEAT_INTERVAL", "5").strip())
+    NODE_TIMEOUT = float(os.getenv("NODE_TIMEOUT", "30").strip())
+    WORKER_HEARTBEAT_INTERVAL = float(os.getenv("WORKER_HEARTBEAT_INTERVAL", "5").strip())
+    WORKER_HEARTBEAT_TIMEOUT = float(os.getenv("WORKER_HEARTBEAT_TIMEOUT", "120").strip())
+    WORKER_MAX_RESTARTS = int(os.getenv("WORKER_MAX_RESTARTS", "5").strip())
+    # окно, в котором считаются перезапуски одного воркера
+    WORKER_RESTART_WINDOW = float(os.getenv("WORKER_RESTART_WINDOW", "3600").strip())
+    TAB_MAX_ERRORS = int(os.getenv("TAB_MAX_ERRORS", "5").strip())
+    TAB_RETRY_BACKOFF = float(os.getenv("TAB_RETRY_BACKOFF", "2").strip())
+    TAB_RETRY_BACKOFF_MAX = float(os.getenv("TAB_RETRY_BACKOFF_MAX", "60").strip())
 
     logger: Optional[Logger] = None
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").strip().upper()
+    # stage:доля - например, result:0.01 оставляет каждую сотую запись о собранном результате
+    LOG_SAMPLE_RATES = {
+        stage.strip(): float(rate) for stage, rate in
+        (item.split(":", 1) for item in get_env_list("LOG_SAMPLE_RATES", "result:0.01"))
+    }
     LOGGING_DIR = Path(os.path.abspath("log"))
     DATETIME_FORMAT = os.getenv("DATETIME_FORMAT").strip()
+    JOURNAL_FILENAME = "journal.sqlite"
+    METRICS_FILENAME = "metrics.jsonl"
 
-    QUERIES_FILEPATH = Path(os.path.abspath("queries.txt"))
-    PROXIES_FILEPATH = Path(os.path.abspath("proxies.txt"))
-
-    @staticmethod
-    async def load_queries() -> List[str]:
-        Config.QUERIES_FILEPATH.parent.mkdir(exist_ok=True, parents=True)
-        Config.QUERIES_FILEPATH.touch(exist_ok=True)
-
-        with open("queries.txt", "r", encoding="utf-8") as file:
-            return file.read().split("\n")
+    # путь к файлу или именованному каналу, "-" - стандартный ввод
+    QUERIES_SOURCE = os.getenv("QUERIES_FILEPATH", "queries.txt").strip()
+    QUERY_BUFFER_SIZE = int(os.getenv("QUERY_BUFFER_SIZE", "1000").strip())
+    QUERY_DEDUP_CAPACITY = int(os.getenv("QUERY_DEDUP_CAPACITY", "0").strip())
+    QUERY_DEDUP_ERROR_RATE = float(os.getenv("QUERY_DEDUP_ERROR_RATE", "0.000001").strip())
+    RESULT_CACHE_FILEPATH = Path(os.path.abspath(os.getenv("RESULT_CACHE_FILEPATH", "cache/results.sqlite").strip()))
+    # 0 - кэш выключен
+    RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "0").strip())
+    RESULT_CACHE_MAX_PAGES = int(os.getenv("RESULT_CACHE_MAX_PAGES", "1000000").strip())
+    # 1 - сохранять сжатый HTML каждой страницы выдачи для повторного разбора (reparse.py)
+    ARCHIVE_HTML = bool(int(os.getenv("ARCHIVE_HTML", "0").strip()))
+    ARCHIVE_DIR = Path(os.path.abspath(os.getenv("ARCHIVE_DIR", "archive").strip()))
+    ARCHIVE_ZSTD_LEVEL = int(os.getenv("ARCHIVE_ZSTD_LEVEL", "3").strip())
+    ARCHIVE_ZLIB_LEVEL = int(os.getenv("ARCHIVE_ZLIB_LEVEL", "6").strip())
+    PROXIES_FILEPATH = Path(os.path.abspath(os.getenv("PROXIES_FILEPATH", "proxies.txt").strip()))
+    BING_URL = os.getenv("BING_URL", "https://www.bing.com").strip().rstrip("/")
+    # рынок запросов без явного "<TAB>рынок" в источнике
+    DEFAULT_MKT = os.getenv("DEFAULT_MKT", "ru-RU").strip()
+    # сколько контекстов без вкладок (прокси, локаль) воркер держит прогретыми, 0 - закрывать сразу
+    WARM_CONTEXTS = int(os.getenv("WARM_CONTEXTS", "4").strip())
 
     @staticmethod
     async def load_proxies() -> List[ProxyData]:
         Config.PROXIES_FILEPATH.parent.mkdir(exist_ok=True, parents=True)
         Config.PROXIES_FILEPATH.touch(exist_ok=True)
 
-        with open("proxies.txt", "r", encoding="utf-8") as file:
+        with open(Config.PROXIES_FILEPATH, "r", encoding="utf-8") as file:
             proxies = file.read().split("\n")
             proxies_objs = []
             for proxy, proxy_id in zip(proxies, range(1, len(proxies) + 1)):
@@ -0,0 +1,444 @@
+from collections import deque, Counter
+from itertools import count
+from multiprocessing import Queue
+from typing import Dict, Any, List, Iterable, Optional, Callable, Set, Tuple
+
+from archive import HtmlArchive
+from concurrency import AimdController, HostLoad
+from config import Config
+from dedup import Deduplicator
+from journal import Journal
+from metrics import metrics, MetricsServer
+from models import QueueMessage, ProxyData, QueryLease
+from network import CoordinatorServer
+from proxy_pool import ProxyPool
+from query_source import QuerySource
+from result_cache import ResultCache
+from supervisor import Supervisor
+from utils import Utils as Ut
+from writer import ResultWriter
+
+
+class Coordinator:
+    WAKEUP_TIMEOUT = 1
+
+    def __init__(self, tasks: Dict[int, Dict[str, Any]], queue_in: Queue, input_queries: Iterable[str],
+                 input_proxies: List[ProxyData], writer: Optional[ResultWriter] = None,
+                 journal: Optional[Journal] = None, metrics_server: Optional[MetricsServer] = None,
+                 query_source: Optional[QuerySource] = None, node_server: Optional[CoordinatorServer] = None,
+                 supervisor: Optional[Supervisor] = None, result_cache: Optional[ResultCache] = None,
+                 archive: Optional[HtmlArchive] = None):
+        self.tasks: Dict[int, Dict[str, Any]] = tasks
+        self.queue_in: Queue = queue_in
+        # возвращенные и незавершенные запросы выдаются раньше новых из источника
+        self.input_queries: deque = deque(input_queries)
+        self.query_source: Optional[QuerySource] = query_source
+        self.proxy_pool: ProxyPool = ProxyPool(proxies=input_proxies)
+        self.writer: ResultWriter = writer or ResultWriter.from_config()
+        self.deduplicator: Optional[Deduplicator] = Deduplicator.from_config()
+        self.result_cache: Optional[ResultCache] = result_cache
+        self.archive: Optional[HtmlArchive] = archive
+        self.journal: Optional[Journal] = journal
+        # (запрос, рынок, страница) -> строк записано после дедупликации; забирается отметкой PAGE_DONE этой страницы
+        self.page_rows: Dict[Tuple[str, str, int], int] = {}
+        if self.journal is not None:
+            self.writer.on_flushed = self.journal.record_flushed
+
+        self.metrics_server: MetricsServer = metrics_server or MetricsServer(registry=metrics, snapshot_filepath=None)
+        # воркеры удаленных узлов получают id после локальных
+        self.node_server: Optional[CoordinatorServer] = node_server
+        self.process_ids = count(max(tasks, default=0) + 1)
+        self.supervisor: Optional[Supervisor] = supervisor
+
+        self.lease_ids = count(1)
+        self.leases: Dict[int, Dict[str, Any]] = {}
+        # запросы, вернувшиеся после блокировки: query -> (страница, позиция) и количество возвратов
+        self.offsets: Dict[str, tuple] = {}
+        self.requeues: Dict[str, int] = {}
+
+        # сколько воркеров каждого узла получают новые запросы (лимит опирается на загрузку хоста, поэтому он на узел,
+        # а не на всех); остальные ждут в query_waiters
+        self.worker_controller = AimdController(
+            name="воркеров", min_limit=1, max_limit=len(tasks),
+            initial=Config.CONCURRENCY_INITIAL_WORKERS if Config.ADAPTIVE_CONCURRENCY else len(tasks)
+        )
+        self.query_waiters: Dict[int, QueueMessage] = {}
+
+    async def run(self):
+        await self.writer.start()
+        await self.metrics_server.start()
+        if self.query_source is not None:
+            await self.query_source.start()
+        if self.node_server is not None:
+            await self.node_server.start(coordinator=self)
+
+        try:
+            await self.serve()
+
+        finally:
+            self.proxy_pool.log_stats()
+            if self.deduplicator is not None:
+                Config.logger.info(f"Отброшено дубликатов: {self.deduplicator.duplicates}")
+            if self.query_source is not None:
+                await self.query_source.close()
+            if self.node_server is not None:
+                await self.node_server.stop()
+            if self.supervisor is not None and self.supervisor.total_restarts:
+                Config.logger.info(f"Перезапусков воркеров: {self.supervisor.total_restarts}")
+            if self.result_cache is not None:
+                await self.result_cache.log_stats()
+                await self.result_cache.close()
+            if self.archive is not None:
+                await self.archive.close()
+
+            await self.writer.close()
+            await self.metrics_server.stop()
+            if self.journal is not None:
+                await self.journal.close()
+
+    async def serve(self):
+        while True:
+            messages = await Ut.get_messages_from_queue(queue=self.queue_in, timeout=self.WAKEUP_TIMEOUT)
+            metrics.inc("coordinator_messages", len(messages))
+            for msg in messages:
+                # любое сообщение, включая WORKER_HEARTBEAT, подтверждает, что цикл событий воркера не завис
+                if self.supervisor is not None:
+                    self.supervisor.beat(process_id=msg.process_id)
+
+                with metrics.timer("coordinator_handle", msg_type=msg.msg_type):
+                    await self.handle_message(msg=msg)
+
+            await self.serve_proxy_waiters()
+            await self.adjust_concurrency()
+            await self.serve_query_waiters()
+            await self.supervise()
+
+            if not any(task["process"].is_alive() for task in self.tasks.values()):
+                # с узлами работа не заканчивается, пока есть запросы: новые узлы могут подключиться позже
+                if self.node_server is not None and (await self.has_queries() or self.leases):
+                    continue
+
+                Config.logger.info("Все процессы завершили свою работу!")
+                return
+
+    async def send(self, process_id: int, msg: QueueMessage):
+        task = self.tasks.get(process_id)
+        if task is None:
+            Config.logger.warning(f"Получил сообщение от неизвестного процесса: {process_id}")
+            return
+
+        task["queue_out"].put(msg)
+
+    async def reply(self, request: QueueMessage, msg_type: str, data: Any = None):
+        # id процесса в ответе нужен узлу, чтобы передать ответ своему воркеру
+        await self.send(
+            process_id=request.process_id,
+            msg=QueueMessage(msg_type=msg_type, data=data, process_id=request.process_id, request_id=request.request_id)
+        )
+
+    async def serve_proxy_waiters(self):
+        for request, proxy in self.proxy_pool.serve_waiters():
+            await self.reply(request=request, msg_type=Ut.SEND_NEW_PROXY, data=proxy.id)
+
+    async def register_process(self, make_task: Callable[[int], Dict[str, Any]]) -> int:
+        process_id = next(self.process_ids)
+        self.tasks[process_id] = make_task(process_id)
+        self.worker_controller.max_limit = await self.get_max_node_workers()
+        if not Config.ADAPTIVE_CONCURRENCY:
+            self.worker_controller.limit = self.worker_controller.max_limit
+
+        return process_id
+
+    async def release_process(self, process_id: int):
+        # процесс пропал, не вернув ресурсы: его прокси и запросы снова доступны остальным
+        self.query_waiters.pop(process_id, None)
+        released = self.proxy_pool.release_process(process_id=process_id)
+        await self.return_leases(lease_ids=[
+            lease_id for lease_id, lease_data in self.leases.items() if lease_data["process_id"] == process_id
+        ])
+        if released:
+            Config.logger.info(f"Освободил прокси процесса {process_id}: {released}")
+
+        await self.serve_proxy_waiters()
+
+    async def unregister_process(self, process_id: int):
+        await self.release_process(process_id=process_id)
+        self.tasks.pop(process_id, None)
+        self.worker_controller.max_limit = await self.get_max_node_workers()
+        self.worker_controller.limit = min(self.worker_controller.limit, self.worker_controller.max_limit)
+        if not Config.ADAPTIVE_CONCURRENCY:
+            self.worker_controller.limit = self.worker_controller.max_limit
+
+    async def supervise(self):
+        if self.supervisor is None:
+            return
+
+        for process_id, reason in self.supervisor.find_failed(tasks=self.tasks):
+            metrics.inc("worker_failures", reason=reason)
+            remote = "node" in self.tasks.get(process_id, {})
+            await self.unregister_process(process_id=process_id)
+            if remote:
+                # аренды и прокси удаленного воркера освобождены, запускает воркеры только его узел
+                continue
+
+            if not self.supervisor.can_restart(process_id=process_id):
+                Config.logger.error(f"Воркер {process_id} исчерпал перезапуски! Продолжаю без него")
+                continue
+
+            await self.register_process(
+                make_task=lambda new_process_id: self.supervisor.respawn(
+                    old_process_id=process_id, process_id=new_process_id
+                )
+            )
+
+    async def is_worker_active(self, process_id: int) -> bool:
+        if self.worker_controller.limit >= self.worker_controller.max_limit:
+            return True
+
+        return process_id in await self.get_active_workers()
+
+    async def get_active_workers(self) -> Set[int]:
+        # на каждом узле работают его первые limit воркеров (локальные воркеры - узел 0): узлы, подключившиеся позже
+        # и получившие старшие id, не простаивают целиком
+        by_node: Dict[int, List[int]] = {}
+        for process_id in sorted(self.tasks):
+            by_node.setdefault(self.tasks[process_id].get("node", 0), []).append(process_id)
+
+        return {
+            process_id for process_ids in by_node.values() for process_id in process_ids[:self.worker_controller.limit]
+        }
+
+    async def get_max_node_workers(self) -> int:
+        node_sizes = Counter(task.get("node", 0) for task in self.tasks.values())
+        return max(self.worker_controller.min_limit, max(node_sizes.values(), default=0))
+
+    async def adjust_concurrency(self):
+        if not Config.ADAPTIVE_CONCURRENCY or not self.worker_controller.is_window_over():
+            return
+
+        cpu, memory = HostLoad.sample()
+        limit = self.worker_controller.adjust(cpu=cpu, memory=memory)
+        metrics.set_gauge("active_workers", limit)
+        metrics.set_gauge("host_cpu_percent", cpu)
+        metrics.set_gauge("host_memory_percent", memory)
+
+    async def has_queries(self) -> bool:
+        return bool(self.input_queries) or (self.query_source is not None and not self.query_source.drained)
+
+    async def has_ready_queries(self) -> bool:
+        return bool(self.input_queries) or (self.query_source is not None and bool(self.query_source.buffer))
+
+    async def has_leases_in_progress(self) -> bool:
+        # аренды живых процессов еще могут вернуться в очередь - при блокировке или потере узла; аренды удаленного
+        # процесса считаются до снятия его с учета, иначе между истечением пульса и возвратом аренд воркеры
+        # получили бы пустой ответ и завершились
+        for lease_data in self.leases.values():
+            task = self.tasks.get(lease_data["process_id"])
+            if task is not None and ("node" in task or task["process"].is_alive()):
+                return True
+
+        return False
+
+    async def serve_query_waiters(self):
+        for process_id, request in list(self.query_waiters.items()):
+            # пустой ответ означает конец работы, поэтому пока источник не дочитан или есть чужие аренды - воркер ждет
+            if (await self.has_queries() or await self.has_leases_in_progress()) and (
+                    not await self.is_worker_active(process_id=process_id) or not await self.has_ready_queries()
+            ):
+                continue
+
+            del self.query_waiters[process_id]
+            leases = await self.lease_queries(process_id=process_id, size=request.data)
+            if not leases and (await self.has_queries() or await self.has_leases_in_progress()):
+                # все готовые запросы закрыты кэшем, а источник еще не дочитан
+                self.query_waiters[process_id] = request
+                continue
+
+            await self.reply(request=request, msg_type=Ut.SEND_QUERY_BATCH, data=leases)
+
+    async def lease_queries(self, process_id: int, size: int) -> List[QueryLease]:
+        # запросы из кэша и уже завершенные в прошлом запуске не арендуются - добираем пачку дальше
+        leases = []
+        while len(leases) < size and await self.has_ready_queries():
+            leases.extend(await self.lease_ready_queries(process_id=process_id, size=size - len(leases)))
+
+        return leases
+
+    async def lease_ready_queries(self, process_id: int, size: int) -> List[QueryLease]:
+        queries = []
+        while self.input_queries and len(queries) < size:
+            queries.append(self.input_queries.popleft())
+
+        cursor = None
+        if self.query_source is not None and len(queries) < size:
+            taken = await self.query_source.take(count=size - len(queries))
+            if taken:
+                cursor = taken[-1][1]
+
+            for query, _ in taken:
+                # повтор запроса, завершенного в прошлом запуске до курсора
+                if self.journal is None or not self.journal.is_done(query=query):
+                    queries.append(query)
+
+        leases = []
+        for query in queries:
+            lease = QueryLease(lease_id=next(self.lease_ids), query=query)
+            if lease.query in self.offsets:
+                lease.start_page, lease.start_position = self.offsets.pop(lease.query)
+
+            elif self.journal is not None:
+                lease.start_page, lease.start_position = await self.journal.get_start(query=lease.query)
+
+            if lease.start_page == 1 and await self.serve_from_cache(lease=lease):
+                continue
+
+            self.leases[lease.lease_id] = {
+                "process_id": process_id, "lease": lease, "pages": lease.start_page - 1,
+                "position": lease.start_position
+            }
+            leases.append(lease)
+
+        # взятые из кэша запросы тоже журналируются: до записи их строк они остаются незавершенными
+        if self.journal is not None and (queries or cursor is not None):
+            await self.journal.record_leases(queries=queries, cursor=cursor)
+
+        return leases
+
+    async def serve_from_cache(self, lease: QueryLease) -> bool:
+        if self.result_cache is None:
+            return False
+
+        query, mkt = Ut.split_market(lease.query)
+        pages, complete = await self.result_cache.get(query=query, mkt=mkt)
+        for page, rows in enumerate(pages, 1):
+            written = await self.put_rows(rows=rows)
+            if self.journal is not None:
+                await self.writer.put_marker(marker=(Journal.PAGE, lease.query, page, written))
+
+        if complete:
+            if self.journal is not None:
+                await self.writer.put_marker(marker=(Journal.DONE, lease.query, None, None))
+
+            return True
+
+        # воркер продолжит с первой страницы, которой нет в кэше
+        lease.start_page = len(pages) + 1
+        lease.start_position = sum(len(rows) for rows in pages)
+        return False
+
+    async def put_rows(self, rows: List[list]) -> int:
+        if self.deduplicator is not None:
+            rows = self.deduplicator.filter(rows=rows)
+
+        await self.writer.put(rows=rows)
+        return len(rows)
+
+    async def return_leases(self, lease_ids: List[int]):
+        returned = [self.leases.pop(lease_id) for lease_id in lease_ids if lease_id in self.leases]
+        for lease_data in returned:
+            # журнал узнает о страницах только после записи батча - продолжение берем из аренды, иначе уже выгруженные
+            # страницы упавшего воркера собрались бы заново
+            if lease_data["pages"]:
+                self.offsets[lease_data["lease"].query] = (lease_data["pages"] + 1, lease_data["position"])
+
+        self.input_queries.extendleft(lease_data["lease"].query for lease_data in reversed(returned))
+
+        if returned:
+            Config.logger.info(f"Вернул в очередь незавершенные запросы: {len(returned)}")
+
+    async def requeue_query(self, lease_id: int, page: int, position: int):
+        lease_data = self.leases.pop(lease_id, None)
+        if lease_data is None:
+            return
+
+        query = lease_data["lease"].query
+        self.requeues[query] = self.requeues.get(query, 0) + 1
+        if self.requeues[query] > Config.MAX_QUERY_REQUEUES:
+            Config.logger.error(f"Запрос {query} возвращался {self.requeues[query]} раз подряд! Пропускаю его")
+            return
+
+        # к запросу вернется воркер уже с другим прокси
+        self.offsets[query] = (page, position)
+        self.input_queries.append(query)
+        Config.logger.info(f"Вернул в очередь запрос {query} со страницы {page}")
+
+    async def handle_message(self, msg: QueueMessage):
+        if msg.msg_type == Ut.GET_NEW_PROXY:
+            old_proxy_id = msg.data
+            if old_proxy_id is not None:
+                self.proxy_pool.release(proxy_id=old_proxy_id)
+
+            proxy = self.proxy_pool.checkout(process_id=msg.process_id, exclude=old_proxy_id)
+            if proxy is None:
+                Config.logger.warning(f"Нет свободных прокси! Процесс {msg.process_id} ожидает в очереди")
+                self.proxy_pool.add_waiter(process_id=msg.process_id, ticket=msg)
+
+            else:
+                await self.reply(request=msg, msg_type=Ut.SEND_NEW_PROXY, data=proxy.id)
+
+        elif msg.msg_type == Ut.RELEASE_PROXY:
+            self.proxy_pool.release(proxy_id=msg.data)
+            await self.serve_proxy_waiters()
+
+        elif msg.msg_type == Ut.REPORT_PROXY:
+            self.proxy_pool.report(**msg.data)
+            self.worker_controller.record(outcome=msg.data["outcome"], latency=msg.data.get("latency"))
+
+        elif msg.msg_type == Ut.GET_QUERY_BATCH:
+            # воркер сверх лимита или при пустом буфере источника ждет, повторный запрос заменяет старый
+            self.query_waiters[msg.process_id] = msg
+            await self.serve_query_waiters()
+
+        elif msg.msg_type == Ut.COMPLETE_QUERY:
+            lease_data = self.leases.pop(msg.data["lease_id"], None)
+            if lease_data is not None:
+                self.requeues.pop(lease_data["lease"].query, None)
+
+            # запрос, брошенный до конца выдачи, не кэшируется целиком - иначе повтор получит обрезанный результат
+            if self.result_cache is not None and lease_data is not None and msg.data["finished"]:
+                query, mkt = Ut.split_market(lease_data["lease"].query)
+                await self.result_cache.put_complete(query=query, mkt=mkt, pages=lease_data["pages"])
+
+            if self.journal is not None and lease_data is not None:
+                await self.writer.put_marker(marker=(Journal.DONE, lease_data["lease"].query, None, None))
+
+        elif msg.msg_type == Ut.PAGE_DONE:
+            lease_data = self.leases.get(msg.data["lease_id"])
+            if lease_data is not None and msg.data["page"] > lease_data["pages"]:
+                lease_data["pages"] = msg.data["page"]
+                lease_data["position"] += msg.data["rows"]
+                # новая страница - возвраты больше не идут подряд
+                self.requeues.pop(lease_data["lease"].query, None)
+
+            if self.journal is not None and lease_data is not None:
+                # в журнал идет число записанных строк, а не собранных воркером - дубликаты в файл не попали
+                query, mkt = Ut.split_market(lease_data["lease"].query)
+                written = self.page_rows.pop((query, mkt, msg.data["page"]), 0)
+                await self.writer.put_marker(
+                    marker=(Journal.PAGE, lease_data["lease"].query, msg.data["page"], written)
+                )
+
+        elif msg.msg_type == Ut.REQUEUE_QUERY:
+            await self.requeue_query(**msg.data)
+
+        elif msg.msg_type == Ut.RETURN_QUERIES:
+            await self.return_leases(lease_ids=msg.data)
+
+        elif msg.msg_type == Ut.UPLOAD_DATA:
+            if self.result_cache is not None:
+                await self.result_cache.put_page(batch=msg.data)
+
+            written = await self.put_rows(rows=msg.data.to_rows())
+            if self.journal is not None:
+                self.page_rows[(msg.data.query, msg.data.mkt, int(msg.data.page))] = written
+
+        elif msg.msg_type == Ut.ARCHIVE_PAGE:
+            if self.archive is not None:
+                await self.archive.put(page=msg.data)
+
+        elif msg.msg_type == Ut.METRICS:
+            metrics.merge(snapshot=msg.data, process=str(msg.process_id))
+
+        elif msg.msg_type == Ut.PROCESS_LOST:
+            Config.logger.info(f"Процесс {msg.process_id} удаленного узла больше не работает")
+            await self.unregister_process(process_id=msg.process_id)
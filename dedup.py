@@ -0,0 +1,76 @@
+import math
+from hashlib import blake2b
+from typing import List, Optional, Set
+
+from config import Config
+from metrics import metrics
+from writer import COLUMNS
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.size: int = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes: int = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def add(self, key: bytes) -> bool:
+        # True, если ключ (вероятно) уже встречался
+        digest = blake2b(key, digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+        seen = True
+        for n in range(self.hashes):
+            position = (h1 + n * h2) % self.size
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                seen = False
+                self.bits[byte] |= 1 << bit
+
+        return seen
+
+
+class Deduplicator:
+    EXACT = "exact"
+    BLOOM = "bloom"
+
+    def __init__(self, key_columns: List[str], mode: str, capacity: int, error_rate: float):
+        unknown = [column for column in key_columns if column not in COLUMNS]
+        if unknown:
+            raise ValueError(f"Неизвестные колонки для дедупликации: {', '.join(unknown)}")
+
+        self.key_indexes: List[int] = [COLUMNS.index(column) for column in key_columns]
+        self.mode: str = mode
+        # в точном режиме храним 8-байтные хеши ключей, а не сами строки
+        self.seen: Set[int] = set()
+        self.bloom: Optional[BloomFilter] = BloomFilter(capacity, error_rate) if mode == self.BLOOM else None
+        self.duplicates: int = 0
+
+    @classmethod
+    def from_config(cls) -> Optional["Deduplicator"]:
+        if not Config.DEDUP_KEY:
+            return None
+
+        return cls(
+            key_columns=Config.DEDUP_KEY, mode=Config.DEDUP_MODE, capacity=Config.DEDUP_CAPACITY,
+            error_rate=Config.DEDUP_ERROR_RATE
+        )
+
+    def is_duplicate(self, row: list) -> bool:
+        key = "\x1f".join(str(row[n]) for n in self.key_indexes).encode("utf-8")
+        if self.bloom is not None:
+            return self.bloom.add(key)
+
+        digest = int.from_bytes(blake2b(key, digest_size=8).digest(), "little")
+        if digest in self.seen:
+            return True
+
+        self.seen.add(digest)
+        return False
+
+    def filter(self, rows: List[list]) -> List[list]:
+        unique = [row for row in rows if not self.is_duplicate(row)]
+        if len(unique) != len(rows):
+            self.duplicates += len(rows) - len(unique)
+            metrics.inc("duplicates_dropped", len(rows) - len(unique))
+
+        return unique
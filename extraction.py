@@ -0,0 +1,144 @@
+import base64
+import re
+from functools import lru_cache
+from typing import List, Optional, Tuple, Union
+from urllib.parse import urlparse, parse_qs, unquote, urljoin
+
+from playwright.async_api import Page
+from selectolax.parser import HTMLParser
+
+from config import Config
+from utils import Utils as Ut
+
+SNIPPET_SELECTORS = (".b_caption p", ".b_snippet", ".b_desc", ".b_caption", "p")
+WHITESPACE_RE = re.compile(r"\s+")
+
+# один проход по DOM внутри страницы: без сериализации всего документа и без отдельного запроса за lang
+EXTRACT_SCRIPT = """
+(snippetSelectors) => {
+    const text = (el) => el ? el.textContent.replace(/\\s+/g, " ").trim() : "";
+    const container = document.querySelector("#b_results") || document;
+    const items = [];
+    for (const li of container.querySelectorAll("li.b_algo")) {
+        const a = li.querySelector("h2 a") || li.querySelector("h3 a") || li.querySelector(".b_title a");
+        if (!a) continue;
+
+        let snippet = "";
+        for (const sel of snippetSelectors) {
+            snippet = text(li.querySelector(sel));
+            if (snippet && snippet.length > 10) break;
+        }
+        items.push([text(a), a.getAttribute("href") || "", snippet]);
+    }
+    return [document.documentElement.lang || "", items];
+}
+"""
+
+
+class Extractor:
+    SCRIPT = "script"
+    SELECTOLAX = "selectolax"
+
+    @staticmethod
+    def clean_bing_href(href: str) -> Union[str, None]:
+        if not href or href.startswith("javascript:") or href == "#":
+            return None
+
+        if href.startswith("/"):
+            href = urljoin(Ut.BING, href)
+
+        p = urlparse(href)
+        if p.netloc and not p.netloc.endswith("bing.com") and p.netloc != "go.microsoft.com":
+            return href
+
+        qs = parse_qs(p.query)
+        for key in ("u", "r", "url", "target", "mediaurl"):
+            val = qs.get(key) or qs.get(key.upper())
+            if val and val[0]:
+                url = unquote(val[0])
+                if "%2F" in url or "%3A" in url:
+                    url = unquote(url)
+
+                return url
+
+        return None
+
+    @staticmethod
+    def decode_a1(url: str) -> str:
+        if not url.startswith("a1"):
+            return url
+
+        url = url[2:]
+        url = url + "=" * (-len(url) % 4)
+        try:
+            url = base64.b64decode(url)
+
+        except Exception:
+            url = base64.urlsafe_b64decode(url)
+
+        return url.decode("utf-8")
+
+    @staticmethod
+    @lru_cache(maxsize=Config.HREF_CACHE_SIZE)
+    def normalize_href(raw_href: str) -> Union[str, None]:
+        # одни и те же ссылки повторяются на соседних страницах и в похожих запросах
+        url = Extractor.clean_bing_href(raw_href) or (raw_href if raw_href else None)
+        return Extractor.decode_a1(url) if url else None
+
+    @staticmethod
+    def _text(el) -> str:
+        # как textContent в EXTRACT_SCRIPT: текстовые узлы склеиваются как есть, затем схлопываются пробелы -
+        # strip=True по узлам склеивал слова ("foo <b>bar</b>" -> "foobar")
+        return WHITESPACE_RE.sub(" ", el.text()).strip() if el else ""
+
+    @staticmethod
+    def build_records(raw_items: List[Tuple[str, str, str]], max_snippet_len: int) -> List[Tuple[str, str, str]]:
+        records = []
+        for title, raw_href, snippet in raw_items:
+            url = Extractor.normalize_href(raw_href)
+            if not url or not title:
+                continue
+
+            if max_snippet_len and snippet:
+                snippet = snippet[:max_snippet_len].rstrip()
+
+            records.append((title, url, snippet))
+
+        return records
+
+    @staticmethod
+    def from_html(html: str, max_snippet_len: int = 300) -> Tuple[str, List[Tuple[str, str, str]]]:
+        tree = HTMLParser(html)
+        html_node = tree.css_first("html")
+        lang = (html_node.attrs.get("lang") if html_node else None) or ""
+
+        container = tree.css_first("#b_results") or tree
+        raw_items = []
+        for li in container.css("li.b_algo"):
+            a = li.css_first("h2 a") or li.css_first("h3 a") or li.css_first(".b_title a")
+            if not a:
+                continue
+
+            snippet = ""
+            for sel in SNIPPET_SELECTORS:
+                snippet = Extractor._text(li.css_first(sel))
+                if snippet and len(snippet) > 10:
+                    break
+
+            raw_items.append((Extractor._text(a), a.attrs.get("href") or "", snippet))
+
+        return lang, Extractor.build_records(raw_items=raw_items, max_snippet_len=max_snippet_len)
+
+    @staticmethod
+    async def from_page(
+            page: Page, engine: str, max_snippet_len: int = 300, html: Optional[str] = None
+    ) -> Tuple[str, List[Tuple[str, str, str]]]:
+        if engine == Extractor.SCRIPT:
+            lang, raw_items = await page.evaluate(EXTRACT_SCRIPT, list(SNIPPET_SELECTORS))
+            return lang, Extractor.build_records(raw_items=raw_items, max_snippet_len=max_snippet_len)
+
+        # html уже снят для архива - второй раз со страницы не забираем
+        if html is None:
+            html = await page.content()
+
+        return Extractor.from_html(html=html, max_snippet_len=max_snippet_len)
@@ -0,0 +1,143 @@
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Tuple, List, Optional, Union, Set
+
+from config import Config
+
+
+class Journal:
+    LEASE = "lease"
+    PAGE = "page"
+    DONE = "done"
+
+    def __init__(self, filepath: Path):
+        self.filepath: Path = filepath
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+
+        # один поток - запросы и коммиты sqlite идут в нем, цикл событий координатора не ждет диск
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal")
+        self.connection = sqlite3.connect(str(self.filepath), check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "id INTEGER PRIMARY KEY, created_at REAL, kind TEXT, query TEXT)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS events_query ON events (query)")
+        # по строке на страницу запроса: повторно разобранная страница не добавляет свои строки к прежним - остается
+        # большее из количеств (после дедупликации повтор обычно записывает 0 строк)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS pages (query TEXT, page INTEGER, rows INTEGER, created_at REAL, "
+            "PRIMARY KEY (query, page))"
+        )
+        self.connection.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+        self.connection.commit()
+
+        # в памяти только начатые запросы: query -> {страница: количество записанных после дедупликации результатов}
+        self.progress: Dict[str, Dict[int, int]] = {}
+        # смещение в источнике запросов сразу после последнего арендованного запроса
+        self.cursor: int = 0
+        # арендованные, но не завершенные запросы - с них начинается продолжение работы
+        self.pending: List[str] = []
+        # завершенные запросы - повтор из источника отсеивается без обращения к sqlite
+        self.done: Set[str] = set()
+
+    @staticmethod
+    async def get_filepath(datetime_of_start: str) -> Path:
+        return Config.LOGGING_DIR / datetime_of_start / Config.JOURNAL_FILENAME
+
+    @staticmethod
+    async def find_latest() -> Optional[Path]:
+        journals = sorted(Config.LOGGING_DIR.glob(f"*/{Config.JOURNAL_FILENAME}"), key=lambda path: path.stat().st_mtime)
+        return journals[-1] if journals else None
+
+    @staticmethod
+    async def resolve_resume_path(resume: Union[str, bool]) -> Optional[Path]:
+        if resume is True:
+            return await Journal.find_latest()
+
+        path = Path(resume)
+        return path / Config.JOURNAL_FILENAME if path.is_dir() else path
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def load(self):
+        self.progress, self.pending, self.cursor, self.done = await self.run(self._load)
+
+    def _load(self) -> Tuple[Dict[str, Dict[int, int]], List[str], int, Set[str]]:
+        not_done = "query NOT IN (SELECT query FROM events WHERE kind = ?)"
+
+        progress = {}
+        for query, page, rows in self.connection.execute(
+                f"SELECT query, page, rows FROM pages WHERE {not_done}", (self.DONE,)
+        ):
+            progress.setdefault(query, {})[page] = rows or 0
+
+        pending = [row[0] for row in self.connection.execute(
+            f"SELECT query FROM events WHERE kind = ? AND {not_done} GROUP BY query ORDER BY MIN(id)",
+            (self.LEASE, self.DONE)
+        )]
+
+        done = {
+            row[0] for row in self.connection.execute("SELECT DISTINCT query FROM events WHERE kind = ?", (self.DONE,))
+        }
+
+        row = self.connection.execute("SELECT value FROM state WHERE key = 'cursor'").fetchone()
+        return progress, pending, int(row[0]) if row else 0, done
+
+    def is_done(self, query: str) -> bool:
+        return query in self.done
+
+    async def get_start(self, query: str) -> Tuple[int, int]:
+        pages = self.progress.get(query, {})
+        return max(pages, default=0) + 1, sum(pages.values())
+
+    async def record_leases(self, queries: List[str], cursor: Optional[int] = None):
+        now = time.time()
+        if cursor is not None:
+            self.cursor = cursor
+
+        await self.run(self._record_leases, [(now, self.LEASE, query) for query in queries], cursor)
+
+    def _record_leases(self, events: List[tuple], cursor: Optional[int]):
+        self.connection.executemany("INSERT INTO events (created_at, kind, query) VALUES (?, ?, ?)", events)
+        if cursor is not None:
+            self.connection.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('cursor', ?)", (str(cursor),))
+
+        self.connection.commit()
+
+    async def record_flushed(self, markers: List[tuple]):
+        now = time.time()
+        events = []
+        pages = []
+        for kind, query, page, rows in markers:
+            if kind == self.PAGE:
+                pages.append((query, page, rows, now))
+                pages_rows = self.progress.setdefault(query, {})
+                pages_rows[page] = max(pages_rows.get(page, 0), rows)
+
+            else:
+                events.append((now, kind, query))
+                if kind == self.DONE:
+                    self.progress.pop(query, None)
+                    self.done.add(query)
+
+        await self.run(self._record_events, events, pages)
+
+    def _record_events(self, events: List[tuple], pages: List[tuple]):
+        self.connection.executemany("INSERT INTO events (created_at, kind, query) VALUES (?, ?, ?)", events)
+        self.connection.executemany(
+            "INSERT INTO pages (query, page, rows, created_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (query, page) DO UPDATE SET rows = MAX(rows, excluded.rows), created_at = excluded.created_at",
+            pages
+        )
+        self.connection.commit()
+
+    async def close(self):
+        await self.run(self.connection.close)
+        self.executor.shutdown(wait=True)
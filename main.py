@@ -1,90 +1,127 @@
+import argparse
 import asyncio
-import csv
 from datetime import datetime
 from multiprocessing import Process, Queue
 
+from archive import HtmlArchive
 from browser_handling import ParserTask
 from config import Config
-from models import QueueMessage, ProxyData
+from coordinator import Coordinator
+from journal import Journal
+from metrics import metrics, MetricsServer
+from network import CoordinatorServer, WorkerNode
+from query_source import QuerySource
+from result_cache import ResultCache
+from supervisor import Supervisor
 from utils import Utils as Ut
 
 
-async def main():
+async def main(resume=None, queries=None, listen=None, connect=None, workers=None):
     datetime_of_start = datetime.now().strftime(Config.DATETIME_FORMAT)
     process_id = 0
+    workers = Config.MAX_BROWSERS if workers is None else workers
 
     logger = await Ut.add_logging(datetime_of_start=datetime_of_start, process_id=process_id)
     Config.logger = logger
 
-    input_queries = await Config.load_queries()
-    if not input_queries:
-        logger.error("Файл queries.txt пуст! Завершаю работу...")
+    if connect:
+        # узел без своего координатора: запросы, прокси и выгрузка - на стороне координатора
+        await WorkerNode.from_config(
+            address=connect, workers=workers, target=ParserTask, target_kwargs={
+                "datetime_of_start": datetime_of_start, "pages_count": Config.MAX_PAGES_PER_BROWSER
+            }
+        ).run()
         return
 
-    logger.info(f"Подгрузил queries.txt! Количество запросов: {len(input_queries)}")
+    query_source = QuerySource.from_config(filepath=queries)
+    input_queries = []
+    logger.info(f"Читаю запросы потоком из {query_source.filepath}")
+
+    if resume:
+        journal_filepath = await Journal.resolve_resume_path(resume=resume)
+        if journal_filepath is None or not journal_filepath.exists():
+            logger.error("Не нашел журнал для продолжения работы! Завершаю работу...")
+            return
+
+        journal = Journal(filepath=journal_filepath)
+        await journal.load()
+        # все до курсора уже арендовано: незавершенное берем из журнала, дальше читаем источник
+        input_queries = journal.pending
+        query_source.offset = journal.cursor
+        logger.info(
+            f"Продолжаю работу по журналу {journal_filepath}! Незавершенных запросов: {len(input_queries)}, "
+            f"из них начатых: {len(journal.progress)}, источник читаю с байта {journal.cursor}"
+        )
+
+    else:
+        journal = Journal(filepath=await Journal.get_filepath(datetime_of_start=datetime_of_start))
 
     input_proxies = await Config.load_proxies()
     if not input_proxies:
         logger.error("Не нашел прокси-адресов в proxies.txt! Завершаю работу...")
         return
 
-    logger.info(f"Подгрузил proxies.txt! Количество прокси: {len(input_queries)}")
+    logger.info(f"Подгрузил proxies.txt! Количество прокси: {len(input_proxies)}")
 
-    pages_count = len((await Ut.calculate_pages_count(input_queries, Config.MAX_BROWSERS))[0])
-    tasks = []
-    for n in range(1, Config.MAX_BROWSERS + 1):
-        queue_in, queue_out = Queue(), Queue()
+    # размер входа заранее неизвестен - вкладок по максимуму, лишние простаивают или отсекаются контроллером
+    pages_count = Config.MAX_PAGES_PER_BROWSER
+    queue_in = Queue()
+
+    def spawn_worker(worker_id: int) -> dict:
+        # тот же запуск используется супервизором для замены упавших воркеров
+        queue_out = Queue()
         new_proc = Process(
             target=ParserTask, kwargs={
-                "queue_in": queue_out, "queue_out": queue_in, "process_id": n, "datetime_of_start": datetime_of_start,
-                "pages_count": pages_count if Config.MAX_PAGES_PER_BROWSER >= pages_count else Config.MAX_PAGES_PER_BROWSER
+                "queue_in": queue_out, "queue_out": queue_in, "process_id": worker_id,
+                "datetime_of_start": datetime_of_start, "pages_count": pages_count, "proxies": input_proxies
             }
         )
         new_proc.start()
 
-        tasks.append({"process": new_proc, "queue_in": queue_in, "queue_out": queue_out})
-
-    while True:
-        await asyncio.sleep(2)
+        return {"process": new_proc, "queue_out": queue_out}
 
-        process_counter = 0
-        for task in tasks:
-            if not task["process"].is_alive():
-                process_counter += 1
+    tasks = {n: spawn_worker(worker_id=n) for n in range(1, workers + 1)}
 
-            msg = await Ut.get_message_from_queue(queue=task["queue_in"])
-            if msg is None:
-                continue
-
-            if msg.msg_type == Ut.GET_NEW_PROXY:
-                for proxy in input_proxies:
-                    if proxy.available:
-                        proxy.available = False
-                        task["queue_out"].put(QueueMessage(msg_type=Ut.SEND_NEW_PROXY, data=proxy))
-                        break
-
-                if isinstance(msg.data, ProxyData):
-                    for proxy in input_proxies:
-                        if proxy.id == msg.data.id:
-                            proxy.available = True
-                            break
-
-            elif msg.msg_type == Ut.GET_NEW_QUERY:
-                query_for_send = input_queries[0] if len(input_queries) else None
-                task["queue_out"].put(QueueMessage(msg_type=Ut.SEND_NEW_QUERY, data=query_for_send))
-
-                if len(input_queries):
-                    input_queries.pop(0)
-
-            elif msg.msg_type == Ut.UPLOAD_DATA:
-                with open(str(Config.OUT_FILEPATH), "a", newline="", encoding="utf-8-sig") as file:
-                    writer = csv.writer(file, delimiter=";")
-                    writer.writerows(msg.data)
-
-        if process_counter == len(tasks):
-            logger.info("Все процессы завершили свою работу!")
-            return
+    metrics_server = MetricsServer(
+        registry=metrics, snapshot_filepath=await MetricsServer.get_filepath(datetime_of_start=datetime_of_start)
+    )
+    await Coordinator(
+        tasks=tasks, queue_in=queue_in, input_queries=input_queries, input_proxies=input_proxies, journal=journal,
+        metrics_server=metrics_server, query_source=query_source,
+        node_server=CoordinatorServer.from_config(address=listen), supervisor=Supervisor.from_config(spawn=spawn_worker),
+        result_cache=ResultCache.from_config(), archive=HtmlArchive.from_config()
+    ).run()
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--resume", nargs="?", const=True, default=None,
+        help="Продолжить работу по журналу: путь к journal.sqlite или папке лога (по умолчанию - последний)"
+    )
+    parser.add_argument(
+        "--queries", default=None,
+        help="Источник запросов: файл, именованный канал или '-' для stdin (по умолчанию QUERIES_FILEPATH)"
+    )
+    parser.add_argument(
+        "--listen", default=None,
+        help="Принимать удаленные узлы: tcp://host:port или unix:///path/to.sock"
+    )
+    parser.add_argument(
+        "--connect", default=None,
+        help="Запустить узел с воркерами, подключенный к координатору по адресу из --listen"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="Количество локальных воркеров (по умолчанию MAX_BROWSERS, 0 - только координатор)"
+    )
+    arguments = parser.parse_args()
+
+    try:
+        asyncio.run(main(
+            resume=arguments.resume, queries=arguments.queries, listen=arguments.listen, connect=arguments.connect,
+            workers=arguments.workers
+        ))
+
+    finally:
+        asyncio.run(Ut.stop_logging())
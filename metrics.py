@@ -0,0 +1,225 @@
+import asyncio
+import json
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Tuple, List, Optional
+
+from config import Config
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelsKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(BUCKETS) + 1)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, counts: List[int], total: float, count: int):
+        for n, value in enumerate(counts):
+            self.counts[n] += value
+
+        self.sum += total
+        self.count += count
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for n, value in enumerate(self.counts):
+            seen += value
+            if seen >= rank:
+                return BUCKETS[n] if n < len(BUCKETS) else float("inf")
+
+        return float("inf")
+
+
+class Metrics:
+    def __init__(self):
+        self.counters: Dict[Tuple[str, LabelsKey], float] = {}
+        self.histograms: Dict[Tuple[str, LabelsKey], Histogram] = {}
+        self.gauges: Dict[Tuple[str, LabelsKey], float] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, object]) -> Tuple[str, LabelsKey]:
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+
+        histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - started, stage=stage, **labels)
+
+    def take_snapshot(self) -> dict:
+        # снимок-дельта для отправки координатору, локальные значения обнуляются
+        snapshot = {
+            "counters": [(name, labels, value) for (name, labels), value in self.counters.items()],
+            "histograms": [
+                (name, labels, histogram.counts, histogram.sum, histogram.count)
+                for (name, labels), histogram in self.histograms.items()
+            ],
+            "gauges": [(name, labels, value) for (name, labels), value in self.gauges.items()]
+        }
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        return snapshot
+
+    def merge(self, snapshot: dict, **extra_labels):
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(sorted(dict(labels, **extra_labels).items())))
+            self.counters[key] = self.counters.get(key, 0) + value
+
+        for name, labels, counts, total, count in snapshot["histograms"]:
+            key = (name, tuple(sorted(dict(labels, **extra_labels).items())))
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+
+            histogram.merge(counts=counts, total=total, count=count)
+
+        for name, labels, value in snapshot.get("gauges", []):
+            self.gauges[(name, tuple(sorted(dict(labels, **extra_labels).items())))] = value
+
+    @staticmethod
+    def _render_labels(labels: LabelsKey, **extra) -> str:
+        pairs = list(labels) + list(extra.items())
+        if not pairs:
+            return ""
+
+        return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f"parser_bing_{name}_total{self._render_labels(labels)} {value}")
+
+        for (name, labels), value in sorted(self.gauges.items()):
+            lines.append(f"parser_bing_{name}{self._render_labels(labels)} {value}")
+
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            cumulative = 0
+            for bound, value in zip(list(BUCKETS) + ["+Inf"], histogram.counts):
+                cumulative += value
+                lines.append(f"parser_bing_{name}_bucket{self._render_labels(labels, le=bound)} {cumulative}")
+
+            lines.append(f"parser_bing_{name}_sum{self._render_labels(labels)} {histogram.sum}")
+            lines.append(f"parser_bing_{name}_count{self._render_labels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+    def to_json(self) -> dict:
+        return {
+            "time": time.time(),
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in self.counters.items()],
+            "gauges": [{"name": name, "labels": dict(labels), "value": value}
+                       for (name, labels), value in self.gauges.items()],
+            "histograms": [
+                {"name": name, "labels": dict(labels), "count": histogram.count, "sum": histogram.sum,
+                 "p50": histogram.quantile(0.5), "p99": histogram.quantile(0.99)}
+                for (name, labels), histogram in self.histograms.items()
+            ]
+        }
+
+
+# метрики текущего процесса - у каждого воркера свои, координатор собирает их в свой экземпляр
+metrics = Metrics()
+
+
+class MetricsServer:
+    def __init__(self, registry: Metrics, snapshot_filepath: Optional[Path]):
+        self.registry: Metrics = registry
+        self.snapshot_filepath: Optional[Path] = snapshot_filepath
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.snapshot_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    async def get_filepath(datetime_of_start: str) -> Path:
+        return Config.LOGGING_DIR / datetime_of_start / Config.METRICS_FILENAME
+
+    async def start(self):
+        if Config.METRICS_PORT:
+            self.server = await asyncio.start_server(self.handle_client, host="127.0.0.1", port=Config.METRICS_PORT)
+            Config.logger.info(f"Метрики доступны на http://127.0.0.1:{Config.METRICS_PORT}/metrics")
+
+        if self.snapshot_filepath is not None and Config.METRICS_SNAPSHOT_INTERVAL:
+            self.snapshot_task = asyncio.create_task(self.snapshot_loop())
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+        if self.snapshot_task is not None:
+            self.snapshot_task.cancel()
+            self.snapshot_task = None
+            await self.write_snapshot()
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            path = request_line.split(b" ")[1] if request_line.count(b" ") >= 2 else b"/"
+            if path.startswith(b"/metrics"):
+                status, content_type, body = "200 OK", "text/plain; version=0.0.4", self.registry.render_prometheus()
+
+            elif path.startswith(b"/json"):
+                status, content_type, body = "200 OK", "application/json", json.dumps(self.registry.to_json())
+
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", "not found\n"
+
+            data = body.encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(data)}\r\n"
+                f"Connection: close\r\n\r\n".encode("utf-8") + data
+            )
+            await writer.drain()
+
+        finally:
+            writer.close()
+
+    async def snapshot_loop(self):
+        while True:
+            await asyncio.sleep(Config.METRICS_SNAPSHOT_INTERVAL)
+            await self.write_snapshot()
+
+    async def write_snapshot(self):
+        self.snapshot_filepath.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.snapshot_filepath, "a", encoding="utf-8") as file:
+            file.write(json.dumps(self.registry.to_json(), ensure_ascii=False) + "\n")
@@ -0,0 +1,212 @@
+import argparse
+import base64
+import http.client
+import json
+import random
+import threading
+import time
+from html import escape
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Dict, List, Tuple
+from urllib.parse import urlparse, parse_qs, quote
+
+CAPTCHA_FILEPATH = Path(__file__).parent / "fixtures" / "serp" / "captcha.html"
+
+HOMEPAGE = """<!DOCTYPE html>
+<html lang="ru"><head><meta charset="utf-8"/><title>Bing</title></head>
+<body>
+{cookie_banner}
+<form action="/search" id="sb_form" method="get">
+<input id="sb_form_q" name="q" type="search" value=""/>
+<input type="hidden" name="form" value="QBLH"/>
+</form>
+</body></html>
+"""
+
+COOKIE_BANNER = """<div id="bnp_container"><div class="bnp_cookie_banner">Мы используем файлы cookie
+<button id="bnp_btn_accept" type="button"
+        onclick="document.getElementById('bnp_container').style.display='none'">Принять</button></div></div>"""
+
+
+class MockBing:
+    def __init__(self, latency: float = 0.05, captcha_probability: float = 0.0, pages_per_query: int = 3,
+                 results_per_page: int = 10, cookie_banner: bool = True):
+        self.latency: float = latency
+        self.captcha_probability: float = captcha_probability
+        self.pages_per_query: int = pages_per_query
+        self.results_per_page: int = results_per_page
+        self.cookie_banner: bool = cookie_banner
+        self.captcha_html: str = CAPTCHA_FILEPATH.read_text(encoding="utf-8")
+
+        self.lock = threading.Lock()
+        # query -> время предыдущей выдачи; интервал между страницами одного запроса = цикл страницы у воркера
+        self.last_seen: Dict[str, float] = {}
+        self.page_intervals: List[float] = []
+        self.served_pages: int = 0
+        self.served_captchas: int = 0
+
+    def render_homepage(self) -> str:
+        return HOMEPAGE.format(cookie_banner=COOKIE_BANNER if self.cookie_banner else "")
+
+    def render_serp(self, query: str, page_number: int) -> str:
+        last = page_number >= self.pages_per_query
+        items = []
+        for n in range(self.results_per_page):
+            position = (page_number - 1) * self.results_per_page + n + 1
+            url = f"https://example.com/{quote(query)}/{position}"
+            target = "a1" + base64.urlsafe_b64encode(url.encode()).decode().rstrip("=")
+            items.append(
+                f'<li class="b_algo"><h2><a href="https://www.bing.com/ck/a?!&amp;&amp;p=mock&amp;u={target}&amp;ntb=1">'
+                f'{escape(query)} — результат {position}</a></h2>'
+                f'<div class="b_caption"><p>Описание результата {position} для запроса {escape(query)}, '
+                f'сгенерированное локальным сервером.</p></div></li>'
+            )
+
+        next_class = "sb_pagN sb_inactP" if last else "sb_pagN"
+        next_href = "" if last else (
+            f' href="/search?q={quote(query)}&amp;first={page_number * self.results_per_page + 1}&amp;FORM=PERE"'
+        )
+        return (
+            f'<!DOCTYPE html><html lang="ru"><head><meta charset="utf-8"/><title>{escape(query)} - Поиск</title></head>'
+            f'<body><form action="/search" id="sb_form"><input id="sb_form_q" name="q" value="{escape(query)}"/></form>'
+            f'<ol id="b_results">{"".join(items)}'
+            f'<li class="b_pag"><nav><ul><li><a class="{next_class}"{next_href}>Далее</a></li></ul></nav></li>'
+            f'</ol></body></html>'
+        )
+
+    def handle_search(self, query: str, first: int) -> Tuple[int, str]:
+        time.sleep(self.latency)
+        now = time.monotonic()
+        with self.lock:
+            previous = self.last_seen.get(query)
+            self.last_seen[query] = now
+            if previous is not None:
+                self.page_intervals.append(now - previous)
+
+            if random.random() < self.captcha_probability:
+                self.served_captchas += 1
+                return 200, self.captcha_html
+
+            self.served_pages += 1
+
+        page_number = (first - 1) // self.results_per_page + 1
+        return 200, self.render_serp(query=query, page_number=page_number)
+
+    def reset(self):
+        with self.lock:
+            self.last_seen.clear()
+            self.page_intervals.clear()
+            self.served_pages = 0
+            self.served_captchas = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "served_pages": self.served_pages,
+                "served_captchas": self.served_captchas,
+                "page_intervals": list(self.page_intervals)
+            }
+
+
+def make_handler(mock: MockBing):
+    class MockBingHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def send_body(self, status: int, body: str, content_type: str = "text/html; charset=utf-8"):
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+
+            if url.path == "/":
+                self.send_body(200, mock.render_homepage())
+
+            elif url.path == "/search":
+                query = (params.get("q") or [""])[0]
+                first = int((params.get("first") or ["1"])[0])
+                self.send_body(*mock.handle_search(query=query, first=first))
+
+            elif url.path == "/__stats":
+                self.send_body(200, json.dumps(mock.stats()), content_type="application/json")
+
+            else:
+                self.send_response(204)
+                self.end_headers()
+
+    return MockBingHandler
+
+
+def make_proxy_handler(upstream: Tuple[str, int]):
+    # прокси-пустышка: любой запрос (на любой хост) отправляет на локальный mock
+    class NoopProxyHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            path = url.path + (f"?{url.query}" if url.query else "")
+
+            connection = http.client.HTTPConnection(*upstream, timeout=30)
+            try:
+                connection.request("GET", path or "/")
+                response = connection.getresponse()
+                body = response.read()
+
+            finally:
+                connection.close()
+
+            self.send_response(response.status)
+            for header in ("Content-Type", "Content-Length"):
+                if response.getheader(header):
+                    self.send_header(header, response.getheader(header))
+
+            self.end_headers()
+            self.wfile.write(body)
+
+    return NoopProxyHandler
+
+
+def start_server(handler, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_mock(mock: MockBing, port: int = 0, proxy_port: int = 0) -> Tuple[ThreadingHTTPServer, ThreadingHTTPServer]:
+    server = start_server(make_handler(mock), port=port)
+    proxy = start_server(make_proxy_handler(server.server_address), port=proxy_port)
+    return server, proxy
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Локальный mock Bing и прокси-пустышка для бенчмарков")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--proxy-port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--captcha-probability", type=float, default=0.0)
+    parser.add_argument("--pages-per-query", type=int, default=3)
+    arguments = parser.parse_args()
+
+    mock_server, proxy_server = start_mock(
+        MockBing(latency=arguments.latency, captcha_probability=arguments.captcha_probability,
+                 pages_per_query=arguments.pages_per_query),
+        port=arguments.port, proxy_port=arguments.proxy_port
+    )
+    print(f"Mock Bing: http://127.0.0.1:{arguments.port}, прокси: 127.0.0.1:{arguments.proxy_port}")
+    print("Для воркеров: BING_URL=http://bing.mock (любой хост через прокси попадает на mock)")
+    try:
+        while True:
+            time.sleep(3600)
+
+    except KeyboardInterrupt:
+        mock_server.shutdown()
+        proxy_server.shutdown()
@@ -1,6 +1,5 @@
-from typing import Any
+from typing import Any, List, Tuple
 
-from playwright.async_api import Page
 from pydantic import BaseModel
 
 
@@ -16,9 +15,87 @@ class ProxyData(BaseModel):
         return f"{self.host}:{self.port}:{self.username}:{self.password}"
 
 
-class QueueMessage(BaseModel):
-    msg_type: str
-    data: Any = None
+# сообщения между процессами - легкие записи со __slots__, в pickle уходят кортежем аргументов без имен полей
+class QueryLease:
+    __slots__ = ("lease_id", "query", "start_page", "start_position")
+
+    def __init__(self, lease_id: int, query: str, start_page: int = 1, start_position: int = 0):
+        self.lease_id: int = lease_id
+        self.query: str = query
+        self.start_page: int = start_page
+        self.start_position: int = start_position
+
+    def __reduce__(self):
+        return QueryLease, (self.lease_id, self.query, self.start_page, self.start_position)
+
+
+class QueueMessage:
+    __slots__ = ("msg_type", "data", "process_id", "request_id")
+
+    def __init__(self, msg_type: str, data: Any = None, process_id: int = 0, request_id: int = 0):
+        self.msg_type: str = msg_type
+        self.data: Any = data
+        self.process_id: int = process_id
+        self.request_id: int = request_id
+
+    def __reduce__(self):
+        return QueueMessage, (self.msg_type, self.data, self.process_id, self.request_id)
+
+
+class ResultBatch:
+    # результаты одной страницы выдачи: общие для всех строк поля передаются один раз
+    __slots__ = ("query", "page", "lang", "country", "mkt", "user_agent", "proxy", "items")
+
+    def __init__(self, query: str, page: str, lang: str, country: str, mkt: str, user_agent: str, proxy: str,
+                 items: List[Tuple[str, str, str, str]]):
+        self.query: str = query
+        self.page: str = page
+        self.lang: str = lang
+        self.country: str = country
+        self.mkt: str = mkt
+        self.user_agent: str = user_agent
+        self.proxy: str = proxy
+        # (позиция, заголовок, ссылка, сниппет)
+        self.items: List[Tuple[str, str, str, str]] = items
+
+    def __reduce__(self):
+        return ResultBatch, (
+            self.query, self.page, self.lang, self.country, self.mkt, self.user_agent, self.proxy, self.items
+        )
+
+    def to_rows(self) -> List[list]:
+        # порядок колонок как в SearchResult
+        return [
+            [self.query, self.page, position, title, url, snippet, self.lang, self.country, self.mkt, self.user_agent,
+             self.proxy]
+            for position, title, url, snippet in self.items
+        ]
+
+
+class ArchivedPage:
+    # сырой HTML страницы выдачи, сжатый в воркере, и то, что нужно для повторного разбора без браузера
+    __slots__ = ("query", "page", "mkt", "country", "user_agent", "proxy", "start_position", "digest", "codec", "data",
+                 "raw_size")
+
+    def __init__(self, query: str, page: int, mkt: str, country: str, user_agent: str, proxy: str,
+                 start_position: int, digest: str, codec: str, data: bytes, raw_size: int):
+        self.query: str = query
+        self.page: int = page
+        self.mkt: str = mkt
+        self.country: str = country
+        self.user_agent: str = user_agent
+        self.proxy: str = proxy
+        self.start_position: int = start_position
+        self.digest: str = digest
+        self.codec: str = codec
+        self.data: bytes = data
+        self.raw_size: int = raw_size
+
+    def __reduce__(self):
+        return ArchivedPage, (
+            self.query, self.page, self.mkt, self.country, self.user_agent, self.proxy, self.start_position,
+            self.digest, self.codec, self.data, self.raw_size
+        )
 
 
 class SearchResult(BaseModel):
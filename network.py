@@ -0,0 +1,378 @@
+import asyncio
+import hmac
+import os
+import pickle
+import socket
+import struct
+import time
+from hashlib import sha256
+from itertools import count
+from multiprocessing import Process, Queue
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple, Callable
+
+from config import Config
+from metrics import metrics
+from models import QueueMessage
+from utils import Utils as Ut
+
+FRAME_HEADER = struct.Struct("!I")
+FRAME_SEQUENCE = struct.Struct("!Q")
+FRAME_MAC_SIZE = sha256().digest_size
+MAX_FRAME_SIZE = 256 * 1024 * 1024
+CHALLENGE_SIZE = 32
+
+
+def parse_address(address: str) -> Tuple[str, str, int]:
+    # tcp://host:port, host:port или unix:///path/to.sock
+    if address.startswith("unix://"):
+        return "unix", address[len("unix://"):], 0
+
+    host, port = address[len("tcp://"):].rsplit(":", 1) if address.startswith("tcp://") else address.rsplit(":", 1)
+    return "tcp", host.strip("[]"), int(port)
+
+
+class FrameStream:
+    SERVER = b"server"
+    CLIENT = b"client"
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader: asyncio.StreamReader = reader
+        self.writer: asyncio.StreamWriter = writer
+        # сообщения за один проход цикла событий уходят одним кадром: 4 байта длины + подпись + pickle списка
+        self.pending: List[QueueMessage] = []
+        # ключ сессии появляется после authenticate; до этого кадры не читаются и не отправляются
+        self.session_key: Optional[bytes] = None
+        self.role: bytes = b""
+        self.peer_role: bytes = b""
+        self.sent: int = 0
+        self.received: int = 0
+
+    @classmethod
+    async def connect(cls, address: str) -> "FrameStream":
+        kind, host, port = parse_address(address)
+        if kind == "unix":
+            reader, writer = await asyncio.open_unix_connection(path=host)
+
+        else:
+            reader, writer = await asyncio.open_connection(host=host, port=port)
+
+        return cls(reader=reader, writer=writer)
+
+    async def authenticate(self, token: bytes, role: bytes) -> bool:
+        # взаимная проверка общего токена до первого pickle; роль в подписи не дает отразить вызов обратно
+        challenge = os.urandom(CHALLENGE_SIZE)
+        self.writer.write(challenge)
+        await self.writer.drain()
+
+        peer_challenge = await self.reader.readexactly(CHALLENGE_SIZE)
+        self.writer.write(hmac.new(token, role + peer_challenge, sha256).digest())
+        await self.writer.drain()
+
+        peer_role = self.CLIENT if role == self.SERVER else self.SERVER
+        answer = await self.reader.readexactly(sha256().digest_size)
+        if not hmac.compare_digest(answer, hmac.new(token, peer_role + challenge, sha256).digest()):
+            return False
+
+        # ключ из обоих вызовов: кадр нельзя подставить из другого соединения, номер кадра - повторить в этом же
+        server_challenge, client_challenge = (
+            (challenge, peer_challenge) if role == self.SERVER else (peer_challenge, challenge)
+        )
+        self.session_key = hmac.new(token, b"session" + server_challenge + client_challenge, sha256).digest()
+        self.role, self.peer_role = role, peer_role
+        return True
+
+    def sign(self, role: bytes, sequence: int, payload: bytes) -> bytes:
+        return hmac.new(self.session_key, role + FRAME_SEQUENCE.pack(sequence) + payload, sha256).digest()
+
+    async def read(self) -> List[QueueMessage]:
+        size, = FRAME_HEADER.unpack(await self.reader.readexactly(FRAME_HEADER.size))
+        if self.session_key is None or size > MAX_FRAME_SIZE:
+            raise ConnectionError(f"Недопустимый кадр размером {size} байт")
+
+        mac = await self.reader.readexactly(FRAME_MAC_SIZE)
+        payload = await self.reader.readexactly(size)
+        # pickle разбирается только после проверки подписи - неподписанный кадр рвет соединение
+        if not hmac.compare_digest(mac, self.sign(role=self.peer_role, sequence=self.received, payload=payload)):
+            raise ConnectionError("Кадр не прошел проверку подписи")
+
+        self.received += 1
+        return pickle.loads(payload)
+
+    def put(self, msg: QueueMessage):
+        # тот же интерфейс, что у multiprocessing.Queue - координатор отвечает удаленным воркерам как локальным
+        if not self.pending:
+            asyncio.get_running_loop().call_soon(self.flush)
+
+        self.pending.append(msg)
+
+    def flush(self):
+        messages, self.pending = self.pending, []
+        if not messages or self.writer.is_closing():
+            return
+
+        payload = pickle.dumps(messages, protocol=pickle.HIGHEST_PROTOCOL)
+        mac = self.sign(role=self.role, sequence=self.sent, payload=payload)
+        self.sent += 1
+        self.writer.write(FRAME_HEADER.pack(len(payload)) + mac + payload)
+        metrics.inc("network_frames", direction="out")
+        metrics.inc("network_bytes", FRAME_HEADER.size + FRAME_MAC_SIZE + len(payload), direction="out")
+
+    async def drain(self):
+        self.flush()
+        await self.writer.drain()
+
+    async def close(self):
+        self.flush()
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+
+        except (ConnectionError, OSError):
+            pass
+
+
+class RemoteProcess:
+    # стоит в Coordinator.tasks вместо multiprocessing.Process: жив, пока от него идут сообщения или узел
+    # подтверждает его в пульсе; явную потерю процесса узел сообщает через PROCESS_LOST
+    def __init__(self):
+        self.last_seen: float = time.monotonic()
+
+    def beat(self):
+        self.last_seen = time.monotonic()
+
+    def is_alive(self) -> bool:
+        return time.monotonic() - self.last_seen <= Config.NODE_TIMEOUT
+
+
+class CoordinatorServer:
+    def __init__(self, address: str, token: str):
+        self.address: str = address
+        self.token: bytes = token.encode("utf-8")
+        self.coordinator = None
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.expire_task: Optional[asyncio.Task] = None
+
+        self.node_ids = count(1)
+        # node_id -> имя, поток, id живых процессов и время последнего кадра
+        self.nodes: Dict[int, Dict[str, Any]] = {}
+
+    @classmethod
+    def from_config(cls, address: Optional[str]) -> Optional["CoordinatorServer"]:
+        if not address:
+            return None
+
+        return cls(address=address, token=Config.COORDINATOR_TOKEN)
+
+    async def start(self, coordinator):
+        # узлы присылают pickle - без общего токена кадры любого локального пользователя или узла сети исполнялись бы
+        if not self.token:
+            raise ValueError("Для приема узлов нужен COORDINATOR_TOKEN!")
+
+        self.coordinator = coordinator
+
+        kind, host, port = parse_address(self.address)
+        if kind == "unix":
+            Path(host).unlink(missing_ok=True)
+            self.server = await asyncio.start_unix_server(self.handle_node, path=host)
+
+        else:
+            self.server = await asyncio.start_server(self.handle_node, host=host, port=port)
+
+        self.expire_task = asyncio.create_task(self.expire_loop())
+        Config.logger.info(f"Координатор принимает узлы на {self.address}")
+
+    async def stop(self):
+        if self.expire_task is not None:
+            self.expire_task.cancel()
+            self.expire_task = None
+
+        if self.server is not None:
+            self.server.close()
+            for node in list(self.nodes.values()):
+                await node["stream"].close()
+
+            await self.server.wait_closed()
+            self.server = None
+
+        kind, host, _ = parse_address(self.address)
+        if kind == "unix":
+            Path(host).unlink(missing_ok=True)
+
+    async def handle_node(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        stream = FrameStream(reader=reader, writer=writer)
+        node_id = None
+        try:
+            if not await asyncio.wait_for(
+                    stream.authenticate(token=self.token, role=FrameStream.SERVER), timeout=Config.NODE_TIMEOUT
+            ):
+                Config.logger.warning(f"Узел {writer.get_extra_info('peername')} не прошел проверку токена!")
+                return
+
+            hello = (await asyncio.wait_for(stream.read(), timeout=Config.NODE_TIMEOUT))[0]
+            if hello.msg_type != Ut.NODE_HELLO:
+                return
+
+            node_id = next(self.node_ids)
+            process_ids = [
+                await self.coordinator.register_process(
+                    make_task=lambda process_id: {"process": RemoteProcess(), "queue_out": stream, "node": node_id}
+                )
+                for _ in range(hello.data["workers"])
+            ]
+            node = self.nodes[node_id] = {
+                "name": hello.data["name"], "stream": stream, "process_ids": set(process_ids),
+                "last_seen": time.monotonic()
+            }
+            stream.put(QueueMessage(msg_type=Ut.NODE_WELCOME, data={
+                "process_ids": process_ids, "proxies": list(self.coordinator.proxy_pool.proxies.values())
+            }))
+            Config.logger.info(f"Подключился узел {node['name']} ({node_id}), воркеры: {process_ids}")
+            metrics.set_gauge("nodes", len(self.nodes))
+
+            while True:
+                messages = await stream.read()
+                node["last_seen"] = time.monotonic()
+                metrics.inc("network_frames", direction="in")
+                for msg in messages:
+                    if msg.msg_type == Ut.NODE_HEARTBEAT:
+                        await self.lose_processes(node=node, process_ids=node["process_ids"] - set(msg.data))
+                        for process_id in node["process_ids"]:
+                            await self.beat_process(process_id=process_id)
+
+                    elif msg.process_id in node["process_ids"]:
+                        # дальше сообщение идет тем же путем, что и от локальных воркеров
+                        await self.beat_process(process_id=msg.process_id)
+                        self.coordinator.queue_in.put(msg)
+
+                    else:
+                        Config.logger.warning(f"Узел {node['name']} прислал сообщение чужого процесса {msg.process_id}")
+
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, OSError):
+            pass
+
+        finally:
+            node = self.nodes.pop(node_id, None)
+            if node is not None:
+                if node["process_ids"]:
+                    Config.logger.warning(f"Потерял связь с узлом {node['name']} ({node_id})!")
+
+                await self.lose_processes(node=node, process_ids=set(node["process_ids"]))
+                metrics.set_gauge("nodes", len(self.nodes))
+
+            await stream.close()
+
+    async def beat_process(self, process_id: int):
+        task = self.coordinator.tasks.get(process_id)
+        if task is not None and isinstance(task["process"], RemoteProcess):
+            task["process"].beat()
+
+    async def lose_processes(self, node: Dict[str, Any], process_ids: set):
+        # идет через общую очередь, чтобы координатор сначала обработал все уже присланные процессом сообщения
+        for process_id in process_ids:
+            node["process_ids"].discard(process_id)
+            self.coordinator.queue_in.put(QueueMessage(msg_type=Ut.PROCESS_LOST, process_id=process_id))
+
+    async def expire_loop(self):
+        while True:
+            await asyncio.sleep(Config.NODE_HEARTBEAT_INTERVAL)
+            now = time.monotonic()
+            for node_id, node in list(self.nodes.items()):
+                if now - node["last_seen"] > Config.NODE_TIMEOUT:
+                    # аренды узла истекают: закрытие соединения возвращает его запросы и прокси
+                    Config.logger.warning(f"Узел {node['name']} ({node_id}) не присылал пульс {Config.NODE_TIMEOUT}s!")
+                    await node["stream"].close()
+
+
+class WorkerNode:
+    WAKEUP_TIMEOUT = 1
+
+    def __init__(self, address: str, token: str, workers: int, target: Callable, target_kwargs: Dict[str, Any]):
+        self.address: str = address
+        self.token: bytes = token.encode("utf-8")
+        self.workers: int = workers
+        self.target: Callable = target
+        self.target_kwargs: Dict[str, Any] = target_kwargs
+
+        self.stream: Optional[FrameStream] = None
+        self.queue_in: Queue = Queue()
+        self.tasks: Dict[int, Dict[str, Any]] = {}
+
+    @classmethod
+    def from_config(cls, address: str, workers: int, target: Callable, target_kwargs: Dict[str, Any]) -> "WorkerNode":
+        return cls(
+            address=address, token=Config.COORDINATOR_TOKEN, workers=workers, target=target,
+            target_kwargs=target_kwargs
+        )
+
+    async def run(self):
+        if not self.token:
+            raise ValueError("Для подключения к координатору нужен COORDINATOR_TOKEN!")
+
+        self.stream = await FrameStream.connect(address=self.address)
+        try:
+            if not await self.stream.authenticate(token=self.token, role=FrameStream.CLIENT):
+                Config.logger.error(f"Координатор {self.address} не прошел проверку токена! Завершаю работу...")
+                return
+
+            self.stream.put(QueueMessage(
+                msg_type=Ut.NODE_HELLO, data={"name": socket.gethostname(), "workers": self.workers}
+            ))
+            welcome = (await self.stream.read())[0]
+            Config.logger.info(f"Подключился к координатору {self.address}! Воркеры: {welcome.data['process_ids']}")
+
+            for process_id in welcome.data["process_ids"]:
+                queue_out = Queue()
+                new_proc = Process(target=self.target, kwargs=dict(
+                    self.target_kwargs, queue_in=queue_out, queue_out=self.queue_in, process_id=process_id,
+                    proxies=welcome.data["proxies"]
+                ))
+                new_proc.start()
+
+                self.tasks[process_id] = {"process": new_proc, "queue_out": queue_out}
+
+            receive_task = asyncio.create_task(self.receive_loop())
+            send_task = asyncio.create_task(self.send_loop())
+            done, pending = await asyncio.wait((receive_task, send_task), return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+
+            if receive_task in done:
+                Config.logger.error("Потерял связь с координатором! Останавливаю воркеры...")
+                for task in self.tasks.values():
+                    task["process"].terminate()
+
+        finally:
+            await self.stream.close()
+
+    async def send_loop(self):
+        heartbeat_at = 0.0
+        while True:
+            for msg in await Ut.get_messages_from_queue(queue=self.queue_in, timeout=self.WAKEUP_TIMEOUT):
+                self.stream.put(msg)
+
+            alive = [process_id for process_id, task in self.tasks.items() if task["process"].is_alive()]
+            if not alive:
+                # процесс мог дописать очередь уже после чтения выше - перед последним пульсом забираем остаток
+                for msg in await Ut.get_messages_from_queue(queue=self.queue_in, timeout=0.1):
+                    self.stream.put(msg)
+
+            if not alive or time.monotonic() >= heartbeat_at:
+                self.stream.put(QueueMessage(msg_type=Ut.NODE_HEARTBEAT, data=alive))
+                heartbeat_at = time.monotonic() + Config.NODE_HEARTBEAT_INTERVAL
+
+            await self.stream.drain()
+            if not alive:
+                Config.logger.info("Все процессы узла завершили свою работу!")
+                return
+
+    async def receive_loop(self):
+        try:
+            while True:
+                for msg in await self.stream.read():
+                    task = self.tasks.get(msg.process_id)
+                    if task is not None:
+                        task["queue_out"].put(msg)
+
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            return
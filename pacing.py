@@ -0,0 +1,90 @@
+import asyncio
+from random import uniform, randint
+from typing import Dict, Tuple
+
+from config import Config
+from metrics import metrics
+
+
+class PacingProfile:
+    __slots__ = ("name", "typing", "reading", "first_scroll", "full_scroll", "before_pagination", "warmup",
+                 "scroll_step", "scroll_delay")
+
+    def __init__(self, name: str, typing: Tuple[float, float], reading: Tuple[float, float],
+                 first_scroll: Tuple[int, int], full_scroll: int, before_pagination: Tuple[float, float],
+                 warmup: Tuple[float, float], scroll_step: int, scroll_delay: float):
+        self.name: str = name
+        # паузы (мин, макс) в секундах
+        self.typing: Tuple[float, float] = typing
+        self.reading: Tuple[float, float] = reading
+        self.before_pagination: Tuple[float, float] = before_pagination
+        self.warmup: Tuple[float, float] = warmup
+        # прокрутка: дистанции в пикселях, шаг колеса и пауза между шагами
+        self.first_scroll: Tuple[int, int] = first_scroll
+        self.full_scroll: int = full_scroll
+        self.scroll_step: int = scroll_step
+        self.scroll_delay: float = scroll_delay
+
+
+# от быстрого к осторожному - адаптация сдвигает прокси вправо по этому списку
+PROFILES = [
+    PacingProfile(
+        name="fast", typing=(0.0, 0.05), reading=(0.0, 0.2), first_scroll=(0, 0), full_scroll=0,
+        before_pagination=(0.0, 0.1), warmup=(0.1, 0.3), scroll_step=250, scroll_delay=0.01
+    ),
+    PacingProfile(
+        name="balanced", typing=(0.1, 0.5), reading=(0.5, 1.0), first_scroll=(200, 500), full_scroll=2000,
+        before_pagination=(0.2, 0.5), warmup=(0.5, 1.0), scroll_step=50, scroll_delay=0.03
+    ),
+    PacingProfile(
+        name="stealth", typing=(0.3, 1.0), reading=(1.5, 3.0), first_scroll=(300, 700), full_scroll=2500,
+        before_pagination=(0.5, 1.5), warmup=(1.0, 2.0), scroll_step=40, scroll_delay=0.05
+    ),
+]
+
+
+class Pacer:
+    def __init__(self, profile_name: str, adaptive: bool):
+        names = [profile.name for profile in PROFILES]
+        if profile_name not in names:
+            raise ValueError(f"Неизвестный профиль пауз: {profile_name}")
+
+        self.base_index: int = names.index(profile_name)
+        self.adaptive: bool = adaptive
+        # ewma доли блокировок по прокси
+        self.block_rates: Dict[int, float] = {}
+        # секунды намеренных пауз на текущей странице каждой вкладки
+        self.page_delays: Dict[int, float] = {}
+
+    @classmethod
+    def from_config(cls) -> "Pacer":
+        return cls(profile_name=Config.PACING_PROFILE, adaptive=Config.PACING_ADAPTIVE)
+
+    def record(self, proxy_id: int, blocked: bool):
+        rate = self.block_rates.get(proxy_id, 0.0)
+        self.block_rates[proxy_id] = rate + Config.PROXY_EWMA_ALPHA * (float(blocked) - rate)
+
+    def get_profile(self, proxy_id: int) -> PacingProfile:
+        index = self.base_index
+        if self.adaptive:
+            rate = self.block_rates.get(proxy_id, 0.0)
+            index += (rate > Config.PACING_SLOWDOWN_BLOCK_RATE) + (rate > 2 * Config.PACING_SLOWDOWN_BLOCK_RATE)
+
+        return PROFILES[min(index, len(PROFILES) - 1)]
+
+    async def sleep(self, page_id: int, seconds: float, kind: str):
+        if seconds <= 0:
+            return
+
+        await asyncio.sleep(seconds)
+        self.page_delays[page_id] = self.page_delays.get(page_id, 0.0) + seconds
+        metrics.inc("pacing_seconds", seconds, kind=kind)
+
+    async def pause(self, page_id: int, proxy_id: int, kind: str):
+        await self.sleep(page_id=page_id, seconds=uniform(*getattr(self.get_profile(proxy_id), kind)), kind=kind)
+
+    async def get_first_scroll(self, proxy_id: int) -> int:
+        return randint(*self.get_profile(proxy_id).first_scroll)
+
+    async def take_page_delay(self, page_id: int) -> float:
+        return self.page_delays.pop(page_id, 0.0)
@@ -0,0 +1,178 @@
+import heapq
+import time
+from typing import List, Dict, Optional, Tuple, Any
+
+from config import Config
+from models import ProxyData
+
+
+class ProxyStats:
+    __slots__ = (
+        "latency", "successes", "captchas", "timeouts", "failures_in_row", "quarantined_until", "blocked_requests",
+        "passed_bytes", "backoff_level"
+    )
+
+    def __init__(self):
+        self.latency: float = 0.0
+        self.successes: int = 0
+        self.captchas: int = 0
+        self.timeouts: int = 0
+        self.failures_in_row: int = 0
+        self.quarantined_until: float = 0.0
+        self.blocked_requests: int = 0
+        self.passed_bytes: int = 0
+        self.backoff_level: int = 0
+
+
+class ProxyPool:
+    SUCCESS = "success"
+    CAPTCHA = "captcha"
+    TIMEOUT = "timeout"
+
+    def __init__(self, proxies: List[ProxyData]):
+        self.proxies: Dict[int, ProxyData] = {proxy.id: proxy for proxy in proxies}
+        self.stats: Dict[int, ProxyStats] = {proxy.id: ProxyStats() for proxy in proxies}
+        self.holders: Dict[int, int] = {}
+        self.sticky: Dict[int, int] = {}
+        self.waiters: Dict[int, Any] = {}
+
+        # куча свободных прокси (ewma задержки, версия, id) - устаревшие записи пропускаются при выдаче
+        self.versions: Dict[int, int] = {proxy.id: 0 for proxy in proxies}
+        self.free: List[Tuple[float, int, int]] = []
+        self.quarantine: List[Tuple[float, int]] = []
+
+        for proxy in proxies:
+            self._push_free(proxy_id=proxy.id)
+
+    def _push_free(self, proxy_id: int):
+        self.versions[proxy_id] += 1
+        heapq.heappush(self.free, (self.stats[proxy_id].latency, self.versions[proxy_id], proxy_id))
+
+    def _is_free(self, proxy_id: int) -> bool:
+        return proxy_id not in self.holders and self.stats[proxy_id].quarantined_until <= time.monotonic()
+
+    def _take(self, proxy_id: int, process_id: int) -> ProxyData:
+        # запись в куче станет устаревшей
+        self.versions[proxy_id] += 1
+        self.holders[proxy_id] = process_id
+        self.sticky[process_id] = proxy_id
+
+        proxy = self.proxies[proxy_id]
+        proxy.available = False
+        return proxy
+
+    def release_expired_quarantine(self):
+        now = time.monotonic()
+        while self.quarantine and self.quarantine[0][0] <= now:
+            _, proxy_id = heapq.heappop(self.quarantine)
+            if self._is_free(proxy_id):
+                Config.logger.info(f"Прокси {proxy_id} вышел из карантина")
+                self._push_free(proxy_id=proxy_id)
+
+    def checkout(self, process_id: int, exclude: Optional[int] = None) -> Optional[ProxyData]:
+        self.release_expired_quarantine()
+
+        sticky_id = self.sticky.get(process_id)
+        if Config.PROXY_STICKY and sticky_id is not None and sticky_id != exclude and self._is_free(sticky_id):
+            return self._take(proxy_id=sticky_id, process_id=process_id)
+
+        skipped = []
+        proxy = None
+        while self.free:
+            latency, version, proxy_id = heapq.heappop(self.free)
+            if version != self.versions[proxy_id] or not self._is_free(proxy_id):
+                continue
+
+            if proxy_id == exclude:
+                skipped.append((latency, version, proxy_id))
+                continue
+
+            proxy = self._take(proxy_id=proxy_id, process_id=process_id)
+            break
+
+        for entry in skipped:
+            heapq.heappush(self.free, entry)
+
+        return proxy
+
+    def release(self, proxy_id: int):
+        if self.holders.pop(proxy_id, None) is None:
+            return
+
+        self.proxies[proxy_id].available = True
+        if self._is_free(proxy_id):
+            self._push_free(proxy_id=proxy_id)
+
+    def release_process(self, process_id: int) -> List[int]:
+        self.waiters.pop(process_id, None)
+        self.sticky.pop(process_id, None)
+
+        released = [proxy_id for proxy_id, holder in self.holders.items() if holder == process_id]
+        for proxy_id in released:
+            self.release(proxy_id=proxy_id)
+
+        return released
+
+    def report(self, proxy_id: int, outcome: str, latency: Optional[float] = None, blocked_requests: int = 0,
+               passed_bytes: int = 0):
+        stats = self.stats.get(proxy_id)
+        if stats is None:
+            return
+
+        stats.blocked_requests += blocked_requests
+        stats.passed_bytes += passed_bytes
+
+        if outcome == self.SUCCESS:
+            stats.successes += 1
+            stats.failures_in_row = 0
+            stats.backoff_level = 0
+            if latency is not None:
+                alpha = Config.PROXY_EWMA_ALPHA
+                stats.latency = latency if not stats.latency else alpha * latency + (1 - alpha) * stats.latency
+
+            return
+
+        stats.failures_in_row += 1
+        if outcome == self.CAPTCHA:
+            # блокировка - сразу в карантин, таймауты копятся до PROXY_MAX_FAILURES подряд
+            stats.captchas += 1
+            self.quarantine_proxy(proxy_id=proxy_id)
+
+        elif outcome == self.TIMEOUT:
+            stats.timeouts += 1
+            if stats.failures_in_row >= Config.PROXY_MAX_FAILURES:
+                self.quarantine_proxy(proxy_id=proxy_id)
+
+    def quarantine_proxy(self, proxy_id: int):
+        # экспоненциальный backoff: каждый следующий карантин без успехов между ними вдвое длиннее
+        stats = self.stats[proxy_id]
+        seconds = min(Config.PROXY_QUARANTINE_SECONDS * 2 ** stats.backoff_level, Config.PROXY_QUARANTINE_MAX_SECONDS)
+        stats.backoff_level += 1
+        stats.failures_in_row = 0
+        stats.quarantined_until = time.monotonic() + seconds
+        heapq.heappush(self.quarantine, (stats.quarantined_until, proxy_id))
+        Config.logger.warning(f"Прокси {proxy_id} отправлен в карантин на {seconds:.0f}s")
+
+    def add_waiter(self, process_id: int, ticket: Any):
+        # повторный запрос того же процесса заменяет старый
+        self.waiters.pop(process_id, None)
+        self.waiters[process_id] = ticket
+
+    def serve_waiters(self) -> List[Tuple[Any, ProxyData]]:
+        served = []
+        for process_id in list(self.waiters):
+            proxy = self.checkout(process_id=process_id)
+            if proxy is None:
+                break
+
+            served.append((self.waiters.pop(process_id), proxy))
+
+        return served
+
+    def log_stats(self):
+        for proxy_id, stats in self.stats.items():
+            Config.logger.info(
+                f"Прокси {proxy_id}: успехов {stats.successes}, капч {stats.captchas}, таймаутов {stats.timeouts}, "
+                f"задержка {stats.latency:.2f}s, заблокировано запросов {stats.blocked_requests}, "
+                f"получено {stats.passed_bytes / 1024 / 1024:.1f} МБ"
+            )
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import stat
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Deque, List, Optional, Tuple, BinaryIO
+
+from config import Config
+from dedup import BloomFilter
+
+
+class QuerySource:
+    STDIN = "-"
+    # емкость фильтра повторов по размеру файла: строка запроса считается не короче MIN_LINE_BYTES - оценка с запасом
+    MIN_LINE_BYTES = 16
+    MIN_SEEN_CAPACITY = 10_000
+    # размер канала и stdin заранее не известен
+    STREAM_SEEN_CAPACITY = 10_000_000
+
+    def __init__(self, filepath: str, offset: int = 0, buffer_size: int = 1000, seen_capacity: int = 0,
+                 seen_error_rate: float = 0.000001):
+        self.filepath: str = filepath
+        self.offset: int = offset
+        self.buffer_size: int = buffer_size
+
+        # (запрос, смещение в байтах сразу после его строки)
+        self.buffer: Deque[Tuple[str, int]] = deque()
+        # 0 - по размеру непрочитанной части файла; фильтр создается при открытии источника
+        self.seen_capacity: int = seen_capacity
+        self.seen_error_rate: float = seen_error_rate
+        self.seen: Optional[BloomFilter] = None
+        self.file: Optional[BinaryIO] = None
+        self.exhausted: bool = False
+        self.read_count: int = 0
+        self.skipped_count: int = 0
+
+        self.space = asyncio.Event()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-source")
+        self.read_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_config(cls, filepath: Optional[str] = None) -> "QuerySource":
+        return cls(
+            filepath=filepath or Config.QUERIES_SOURCE, buffer_size=Config.QUERY_BUFFER_SIZE,
+            seen_capacity=Config.QUERY_DEDUP_CAPACITY, seen_error_rate=Config.QUERY_DEDUP_ERROR_RATE
+        )
+
+    @property
+    def drained(self) -> bool:
+        return self.exhausted and not self.buffer
+
+    def _open(self):
+        if self.filepath == self.STDIN:
+            self.file = sys.stdin.buffer
+
+        else:
+            path = Path(self.filepath)
+            if not path.exists():
+                path.parent.mkdir(exist_ok=True, parents=True)
+                path.touch()
+
+            # именованный канал открывается на чтение только после подключения пишущей стороны
+            self.file = open(path, "rb")
+
+        if self.offset:
+            if self.file.seekable():
+                self.file.seek(self.offset)
+
+            else:
+                Config.logger.warning(f"Источник запросов {self.filepath} не поддерживает смещение! Читаю с начала")
+                self.offset = 0
+
+        capacity = self.get_seen_capacity()
+        self.seen = BloomFilter(capacity=capacity, error_rate=self.seen_error_rate)
+        Config.logger.info(f"Фильтр повторов запросов: емкость {capacity}, {len(self.seen.bits) / 1024 / 1024:.1f} МБ")
+
+    def get_seen_capacity(self) -> int:
+        if self.seen_capacity:
+            return self.seen_capacity
+
+        try:
+            file_stat = os.fstat(self.file.fileno())
+
+        except (OSError, ValueError):
+            return self.STREAM_SEEN_CAPACITY
+
+        if not stat.S_ISREG(file_stat.st_mode):
+            return self.STREAM_SEEN_CAPACITY
+
+        return max(self.MIN_SEEN_CAPACITY, (file_stat.st_size - self.offset) // self.MIN_LINE_BYTES)
+
+    def _read_lines(self, count: int) -> List[Tuple[bytes, int]]:
+        if self.file is None:
+            self._open()
+
+        lines = []
+        while len(lines) < count:
+            line = self.file.readline()
+            if not line:
+                self.exhausted = True
+                break
+
+            self.offset += len(line)
+            lines.append((line, self.offset))
+
+        return lines
+
+    async def start(self):
+        self.read_task = asyncio.create_task(self.read_loop())
+
+    async def read_loop(self):
+        loop = asyncio.get_running_loop()
+        while not self.exhausted:
+            if len(self.buffer) >= self.buffer_size:
+                self.space.clear()
+                await self.space.wait()
+                continue
+
+            lines = await loop.run_in_executor(self.executor, self._read_lines, self.buffer_size - len(self.buffer))
+            for line, offset in lines:
+                query = line.decode("utf-8", errors="replace").strip()
+                if not query or self.seen.add(query.encode("utf-8")):
+                    self.skipped_count += 1
+                    continue
+
+                self.read_count += 1
+                self.buffer.append((query, offset))
+
+        Config.logger.info(
+            f"Источник запросов прочитан до конца! Запросов: {self.read_count}, пропущено пустых и повторов: "
+            f"{self.skipped_count}"
+        )
+
+    async def take(self, count: int) -> List[Tuple[str, int]]:
+        taken = []
+        while self.buffer and len(taken) < count:
+            taken.append(self.buffer.popleft())
+
+        self.space.set()
+        return taken
+
+    async def close(self):
+        if self.read_task is not None:
+            # поток может висеть на чтении из канала - не ждем его
+            self.read_task.cancel()
+            self.read_task = None
+
+        self.executor.shutdown(wait=False)
+        if self.file is not None and self.file is not sys.stdin.buffer:
+            self.file.close()
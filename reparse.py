@@ -0,0 +1,119 @@
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+from typing import List, Dict, Tuple
+
+from archive import HtmlArchive
+from config import Config
+from extraction import Extractor
+from models import ResultBatch
+from writer import ResultWriter
+
+
+def _reparse_chunk(dirpath: str, index_rows: List[tuple], max_snippet_len: int) -> Tuple[List[list], int]:
+    # выполняется в отдельном процессе: читает объекты сам, в главный процесс возвращаются только строки
+    archive = HtmlArchive(dirpath=Path(dirpath))
+    # одинаковые страницы в архиве - один объект, разбираем его один раз на чанк
+    extracted: Dict[str, Tuple[str, List[Tuple[str, str, str]]]] = {}
+    rows = []
+    failed = 0
+    for _, _, query, mkt, page, start_position, country, user_agent, proxy, digest, codec in index_rows:
+        if digest not in extracted:
+            try:
+                extracted[digest] = Extractor.from_html(
+                    html=archive.read(digest=digest, codec=codec), max_snippet_len=max_snippet_len
+                )
+
+            except Exception:
+                failed += 1
+                continue
+
+        lang, records = extracted[digest]
+        rows.extend(ResultBatch(
+            query=query,
+            page=str(page),
+            lang=lang,
+            country=country,
+            mkt=mkt,
+            user_agent=user_agent,
+            proxy=proxy,
+            items=[
+                (str(start_position + n), title, url, snippet) for n, (title, url, snippet) in enumerate(records, 1)
+            ]
+        ).to_rows())
+
+    return rows, failed
+
+
+def reparse(arguments: argparse.Namespace):
+    sink_class = ResultWriter.SINKS.get(arguments.format)
+    if sink_class is None:
+        raise ValueError(f"Неизвестный формат выгрузки: {arguments.format}")
+
+    archive = HtmlArchive(dirpath=Path(os.path.abspath(arguments.archive)))
+    if not (archive.dirpath / HtmlArchive.INDEX_FILENAME).exists():
+        raise FileNotFoundError(f"Не найден индекс архива в {archive.dirpath}")
+
+    out_filepath = Path(os.path.abspath(arguments.out or archive.dirpath / f"reparse.{arguments.format}"))
+    out_filepath.parent.mkdir(parents=True, exist_ok=True)
+    sink = sink_class(out_filepath)
+
+    pages = rows_written = failed = 0
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=arguments.workers) as executor:
+        # в работе не больше двух чанков на процесс - индекс читается по мере разбора, а не целиком в память
+        in_flight = set()
+
+        def collect(done):
+            nonlocal rows_written, failed
+            for future in done:
+                rows, chunk_failed = future.result()
+                sink.write_rows(rows)
+                rows_written += len(rows)
+                failed += chunk_failed
+
+        for index_rows in archive.iter_index(latest_only=not arguments.all_versions, batch_size=arguments.chunk):
+            if len(in_flight) >= arguments.workers * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+
+            in_flight.add(executor.submit(
+                _reparse_chunk, str(archive.dirpath), index_rows, arguments.max_snippet_len
+            ))
+            pages += len(index_rows)
+
+        collect(wait(in_flight).done)
+
+    sink.close()
+    archive.close_index()
+
+    elapsed = time.perf_counter() - started
+    Config.logger.info(
+        f"Разобрал страниц из архива: {pages} за {elapsed:.1f}s ({pages / elapsed if elapsed else 0:.0f} стр/с), "
+        f"строк {rows_written}, не удалось разобрать {failed}. Записал в {out_filepath}"
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Повторный разбор архива HTML без браузера")
+    parser.add_argument("--archive", default=str(Config.ARCHIVE_DIR), help="Папка архива (по умолчанию ARCHIVE_DIR)")
+    parser.add_argument("--out", default=None, help="Файл выгрузки (по умолчанию reparse.<format> в папке архива)")
+    parser.add_argument("--format", default=Config.OUT_FORMAT, choices=sorted(ResultWriter.SINKS))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk", type=int, default=500, help="Страниц на одну задачу процесса")
+    parser.add_argument("--max-snippet-len", type=int, default=300)
+    parser.add_argument(
+        "--all-versions", action="store_true",
+        help="Разобрать все снимки страницы, а не только последний по каждому запросу, рынку и странице"
+    )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    Config.logger = logging.getLogger()
+
+    reparse(parse_args())
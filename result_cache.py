@@ -0,0 +1,154 @@
+import asyncio
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from config import Config
+from metrics import metrics
+from models import ResultBatch
+
+
+class ResultCache:
+    HIT = "hit"
+    PARTIAL = "partial"
+    MISS = "miss"
+
+    EVICT_EVERY = 1000
+
+    def __init__(self, filepath: Path, ttl: float, max_pages: int):
+        self.filepath: Path = filepath
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl: float = ttl
+        self.max_pages: int = max_pages
+
+        # один поток - запросы и коммиты sqlite идут в нем, цикл событий координатора не ждет диск
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="result-cache")
+        self.connection = sqlite3.connect(str(self.filepath), check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "query TEXT, mkt TEXT, page INTEGER, created_at REAL, rows TEXT, PRIMARY KEY (query, mkt, page))"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS pages_created_at ON pages (created_at)")
+        # запрос пройден до последней страницы выдачи - только тогда кэш заменяет его целиком
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS queries ("
+            "query TEXT, mkt TEXT, pages INTEGER, created_at REAL, PRIMARY KEY (query, mkt))"
+        )
+        self.connection.commit()
+
+        self.counts = {self.HIT: 0, self.PARTIAL: 0, self.MISS: 0}
+        self.pages_served: int = 0
+        self.puts: int = 0
+
+    @classmethod
+    def from_config(cls) -> Optional["ResultCache"]:
+        if not Config.RESULT_CACHE_TTL:
+            return None
+
+        return cls(
+            filepath=Config.RESULT_CACHE_FILEPATH, ttl=Config.RESULT_CACHE_TTL, max_pages=Config.RESULT_CACHE_MAX_PAGES
+        )
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def get(self, query: str, mkt: str) -> Tuple[List[List[list]], bool]:
+        # (строки страниц подряд с первой, запрос пройден целиком)
+        pages, complete = await self.run(self._select, self.normalize(query), mkt, time.time() - self.ttl)
+
+        outcome = self.HIT if complete else self.PARTIAL if pages else self.MISS
+        self.counts[outcome] += 1
+        metrics.inc("result_cache", outcome=outcome)
+        if pages:
+            self.pages_served += len(pages)
+            # строки отдаются под тем написанием запроса, которое пришло сейчас
+            for rows in pages:
+                for row in rows:
+                    row[0] = query
+
+        return pages, complete
+
+    def _select(self, key: str, mkt: str, fresh_since: float) -> Tuple[List[List[list]], bool]:
+        pages = []
+        for page, rows in self.connection.execute(
+                "SELECT page, rows FROM pages WHERE query = ? AND mkt = ? AND created_at >= ? ORDER BY page",
+                (key, mkt, fresh_since)
+        ):
+            if page != len(pages) + 1:
+                break
+
+            pages.append(json.loads(rows))
+
+        row = self.connection.execute(
+            "SELECT pages FROM queries WHERE query = ? AND mkt = ? AND created_at >= ?", (key, mkt, fresh_since)
+        ).fetchone()
+        return pages, row is not None and len(pages) >= row[0]
+
+    async def put_page(self, batch: ResultBatch):
+        await self.run(self._put_page, (
+            self.normalize(batch.query), batch.mkt, int(batch.page), time.time(),
+            json.dumps(batch.to_rows(), ensure_ascii=False)
+        ))
+
+        self.puts += 1
+        if self.puts % self.EVICT_EVERY == 0:
+            await self.evict()
+
+    def _put_page(self, values: tuple):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO pages (query, mkt, page, created_at, rows) VALUES (?, ?, ?, ?, ?)", values
+        )
+        self.connection.commit()
+
+    async def put_complete(self, query: str, mkt: str, pages: int):
+        await self.run(self._put_complete, (self.normalize(query), mkt, pages, time.time()))
+
+    def _put_complete(self, values: tuple):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO queries (query, mkt, pages, created_at) VALUES (?, ?, ?, ?)", values
+        )
+        self.connection.commit()
+
+    async def evict(self):
+        expired, overflow = await self.run(self._evict, time.time() - self.ttl)
+        if expired or overflow > 0:
+            Config.logger.info(f"Очистил кэш результатов: устаревших страниц {expired}, сверх лимита {max(overflow, 0)}")
+
+    def _evict(self, fresh_since: float) -> Tuple[int, int]:
+        expired = self.connection.execute("DELETE FROM pages WHERE created_at < ?", (fresh_since,)).rowcount
+        self.connection.execute("DELETE FROM queries WHERE created_at < ?", (fresh_since,))
+
+        # сверх лимита удаляются самые старые страницы; запрос без первых страниц перестает быть попаданием сам
+        overflow = self.connection.execute("SELECT COUNT(*) FROM pages").fetchone()[0] - self.max_pages
+        if overflow > 0:
+            self.connection.execute(
+                "DELETE FROM pages WHERE rowid IN (SELECT rowid FROM pages ORDER BY created_at LIMIT ?)", (overflow,)
+            )
+
+        self.connection.commit()
+        return expired, overflow
+
+    async def log_stats(self):
+        total = sum(self.counts.values())
+        if not total:
+            return
+
+        Config.logger.info(
+            f"Кэш результатов: попаданий {self.counts[self.HIT]} из {total} ({self.counts[self.HIT] / total:.1%}), "
+            f"частичных {self.counts[self.PARTIAL]}, страниц из кэша {self.pages_served}"
+        )
+
+    async def close(self):
+        await self.evict()
+        await self.run(self.connection.close)
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,84 @@
+import re
+from typing import List, Set, Pattern, Dict, Any
+
+from playwright.async_api import BrowserContext, Route, Response
+
+from config import Config
+
+# прозрачный gif 1x1 - заглушка для картинок, чтобы скрипты страницы не ловили ошибки загрузки
+EMPTY_GIF = bytes.fromhex("47494638396101000100800000000000ffffff21f90401000000002c00000000010001000002024401003b")
+
+
+class ResourceRouter:
+    ABORT = "abort"
+    STUB = "stub"
+
+    def __init__(self, blocked_types: Set[str], blocked_patterns: List[Pattern], allowed_patterns: List[Pattern],
+                 action: str):
+        self.blocked_types: Set[str] = blocked_types
+        self.blocked_patterns: List[Pattern] = blocked_patterns
+        self.allowed_patterns: List[Pattern] = allowed_patterns
+        self.action: str = action
+
+        # роутер один на процесс, а контексты работают через разные прокси - счетчики ведутся по ключу (id прокси),
+        # иначе трафик одного прокси попадает в отчет о другом
+        self.counters: Dict[Any, Dict[str, int]] = {}
+
+    @classmethod
+    def from_config(cls) -> "ResourceRouter":
+        return cls(
+            blocked_types=set(Config.BLOCK_RESOURCE_TYPES),
+            blocked_patterns=[re.compile(pattern) for pattern in Config.BLOCK_URL_PATTERNS],
+            allowed_patterns=[re.compile(pattern) for pattern in Config.ALLOW_URL_PATTERNS],
+            action=Config.BLOCK_ACTION
+        )
+
+    async def attach(self, context: BrowserContext, key: Any):
+        counters = self.counters.setdefault(key, {"blocked_requests": 0, "passed_bytes": 0})
+        await context.route("**/*", lambda route: self.handle_route(route=route, counters=counters))
+        context.on("response", lambda response: self.on_response(response=response, counters=counters))
+
+    async def is_blocked(self, url: str, resource_type: str) -> bool:
+        if any(pattern.search(url) for pattern in self.allowed_patterns):
+            return False
+
+        if resource_type in self.blocked_types:
+            return True
+
+        return any(pattern.search(url) for pattern in self.blocked_patterns)
+
+    async def handle_route(self, route: Route, counters: Dict[str, int]):
+        request = route.request
+        if not await self.is_blocked(url=request.url, resource_type=request.resource_type):
+            await route.continue_()
+            return
+
+        counters["blocked_requests"] += 1
+        if self.action == self.STUB and request.resource_type == "image":
+            await route.fulfill(status=200, content_type="image/gif", body=EMPTY_GIF)
+
+        elif self.action == self.STUB:
+            await route.fulfill(status=204, body=b"")
+
+        else:
+            await route.abort("blockedbyclient")
+
+    async def on_response(self, response: Response, counters: Dict[str, int]):
+        # заглушки тоже дают response, но их размер - десятки байт
+        content_length = response.headers.get("content-length")
+        if content_length is not None and content_length.isdigit():
+            counters["passed_bytes"] += int(content_length)
+            return
+
+        # chunked и сжатые ответы приходят без content-length - берем размер тела, переданного по сети
+        try:
+            counters["passed_bytes"] += (await response.request.sizes())["responseBodySize"]
+
+        except Exception:
+            pass
+
+    async def take_counters(self, key: Any) -> Dict[str, int]:
+        counters = self.counters.get(key, {"blocked_requests": 0, "passed_bytes": 0})
+        taken = dict(counters)
+        counters["blocked_requests"] = counters["passed_bytes"] = 0
+        return taken
@@ -0,0 +1,68 @@
+import asyncio
+from itertools import count
+from multiprocessing import Queue
+from typing import Dict, Optional, Any, Callable, Awaitable
+
+from config import Config
+from metrics import metrics
+from models import QueueMessage
+from utils import Utils as Ut
+
+
+class RpcClient:
+    READ_TIMEOUT = 1
+
+    def __init__(self, queue_in: Queue, queue_out: Queue, process_id: int,
+                 orphan_handler: Optional[Callable[[QueueMessage], Awaitable[None]]] = None):
+        self.queue_in: Queue = queue_in
+        self.queue_out: Queue = queue_out
+        self.process_id: int = process_id
+        self.orphan_handler = orphan_handler
+
+        self.futures: Dict[int, asyncio.Future] = {}
+        self.request_ids = count(1)
+        self.reader_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self.reader_task = asyncio.create_task(self.read_loop())
+
+    async def stop(self):
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+            try:
+                await self.reader_task
+
+            except asyncio.CancelledError:
+                pass
+
+            self.reader_task = None
+
+    async def read_loop(self):
+        while True:
+            for msg in await Ut.get_messages_from_queue(queue=self.queue_in, timeout=self.READ_TIMEOUT):
+                future = self.futures.pop(msg.request_id, None)
+                if future is not None and not future.done():
+                    future.set_result(msg)
+                    continue
+
+                Config.logger.warning(f"Получил ответ без ожидающего запроса: {msg.msg_type} ({msg.request_id})")
+                if self.orphan_handler is not None:
+                    await self.orphan_handler(msg)
+
+    async def request(self, msg_type: str, data: Any = None, timeout: Optional[float] = None) -> QueueMessage:
+        request_id = next(self.request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.futures[request_id] = future
+
+        self.queue_out.put(
+            QueueMessage(msg_type=msg_type, data=data, process_id=self.process_id, request_id=request_id)
+        )
+        try:
+            with metrics.timer("handoff", msg_type=msg_type):
+                return await asyncio.wait_for(future, timeout=timeout or Config.RPC_TIMEOUT)
+
+        finally:
+            self.futures.pop(request_id, None)
+
+    async def notify(self, msg_type: str, data: Any = None):
+        self.queue_out.put(QueueMessage(msg_type=msg_type, data=data, process_id=self.process_id))
@@ -0,0 +1,86 @@
+import time
+from multiprocessing import Process
+from typing import Dict, Any, Callable, List, Tuple
+
+from config import Config
+
+
+class Supervisor:
+    CRASH = "crash"
+    HANG = "hang"
+
+    def __init__(self, spawn: Callable[[int], Dict[str, Any]], heartbeat_timeout: float, max_restarts: int,
+                 restart_window: float):
+        # spawn(process_id) запускает воркер и возвращает запись для Coordinator.tasks
+        self.spawn: Callable[[int], Dict[str, Any]] = spawn
+        self.heartbeat_timeout: float = heartbeat_timeout
+        self.max_restarts: int = max_restarts
+        self.restart_window: float = restart_window
+
+        self.last_seen: Dict[int, float] = {}
+        # время перезапусков передается новому процессу: лимит действует в скользящем окне, поэтому воркер в цикле
+        # падений останавливается, а редкие падения за долгий запуск не сокращают число воркеров
+        self.restarts: Dict[int, List[float]] = {}
+        self.total_restarts: int = 0
+
+    @classmethod
+    def from_config(cls, spawn: Callable[[int], Dict[str, Any]]) -> "Supervisor":
+        return cls(
+            spawn=spawn, heartbeat_timeout=Config.WORKER_HEARTBEAT_TIMEOUT, max_restarts=Config.WORKER_MAX_RESTARTS,
+            restart_window=Config.WORKER_RESTART_WINDOW
+        )
+
+    def beat(self, process_id: int):
+        self.last_seen[process_id] = time.monotonic()
+
+    def find_failed(self, tasks: Dict[int, Dict[str, Any]]) -> List[Tuple[int, str]]:
+        now = time.monotonic()
+        failed = []
+        for process_id, task in tasks.items():
+            process = task["process"]
+            if not isinstance(process, Process):
+                # удаленный воркер жив, пока узел подтверждает его пульсом; завершить его может только сам узел
+                if not process.is_alive():
+                    Config.logger.error(f"Удаленный воркер {process_id} не подтверждался пульсом узла!")
+                    failed.append((process_id, self.HANG))
+
+                continue
+
+            if process.is_alive():
+                if now - self.last_seen.setdefault(process_id, now) > self.heartbeat_timeout:
+                    Config.logger.error(
+                        f"Воркер {process_id} не присылал пульс {self.heartbeat_timeout:.0f}s! Завершаю его"
+                    )
+                    process.kill()
+                    process.join(timeout=5)
+                    failed.append((process_id, self.HANG))
+
+            elif process.exitcode:
+                Config.logger.error(f"Воркер {process_id} упал с кодом {process.exitcode}!")
+                failed.append((process_id, self.CRASH))
+
+        for process_id, _ in failed:
+            self.last_seen.pop(process_id, None)
+
+        return failed
+
+    def recent_restarts(self, process_id: int) -> List[float]:
+        since = time.monotonic() - self.restart_window
+        restarts = [restarted_at for restarted_at in self.restarts.get(process_id, []) if restarted_at >= since]
+        self.restarts[process_id] = restarts
+        return restarts
+
+    def can_restart(self, process_id: int) -> bool:
+        return len(self.recent_restarts(process_id=process_id)) < self.max_restarts
+
+    def respawn(self, old_process_id: int, process_id: int) -> Dict[str, Any]:
+        restarts = self.recent_restarts(process_id=old_process_id) + [time.monotonic()]
+        self.restarts.pop(old_process_id, None)
+        self.restarts[process_id] = restarts
+        self.total_restarts += 1
+        self.beat(process_id=process_id)
+        Config.logger.info(
+            f"Перезапустил воркер {old_process_id} как {process_id} (перезапуск {len(restarts)} из "
+            f"{self.max_restarts} за {self.restart_window:.0f}s)"
+        )
+        return self.spawn(process_id)
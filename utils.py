@@ -2,29 +2,92 @@ import asyncio
 import os
 import logging
 from datetime import datetime
+import queue
 from logging import Logger
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 from queue import Empty
-from typing import Union
+from typing import Union, List, Dict, Optional, Tuple
 from multiprocessing import Queue
+from urllib.parse import urlencode
 
 from config import Config
 from models import QueueMessage
 
 
+class SamplingFilter(logging.Filter):
+    # записи с extra={"stage": ...} пропускаются с долей из LOG_SAMPLE_RATES: каждая N-я, без случайности
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates: Dict[str, float] = rates
+        self.counters: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        stage = getattr(record, "stage", None)
+        rate = self.rates.get(stage) if stage is not None else None
+        if rate is None or rate >= 1:
+            return True
+
+        if rate <= 0:
+            return False
+
+        n = self.counters.get(stage, 0)
+        self.counters[stage] = n + 1
+        return n % round(1 / rate) == 0
+
+
 class Utils:
-    BING = "https://www.bing.com"
+    BING = Config.BING_URL
+    log_listener: Optional[QueueListener] = None
 
-    GET_NEW_QUERY = "get_new_query"
-    SEND_NEW_QUERY = "send_new_query"
     GET_NEW_PROXY = "get_new_proxy"
     SEND_NEW_PROXY = "send_new_proxy"
     UPLOAD_DATA = "upload_data"
+    RELEASE_PROXY = "release_proxy"
+    GET_QUERY_BATCH = "get_query_batch"
+    SEND_QUERY_BATCH = "send_query_batch"
+    COMPLETE_QUERY = "complete_query"
+    RETURN_QUERIES = "return_queries"
+    PAGE_DONE = "page_done"
+    REPORT_PROXY = "report_proxy"
+    METRICS = "metrics"
+    REQUEUE_QUERY = "requeue_query"
+    NODE_HELLO = "node_hello"
+    NODE_WELCOME = "node_welcome"
+    NODE_HEARTBEAT = "node_heartbeat"
+    PROCESS_LOST = "process_lost"
+    WORKER_HEARTBEAT = "worker_heartbeat"
+    ARCHIVE_PAGE = "archive_page"
+
+    RESULTS_PER_PAGE = 10
 
     @staticmethod
     def wrapper(func, *args, **kwargs):
         return asyncio.run(func(*args, **kwargs))
 
+    @staticmethod
+    async def build_search_url(query: str, page_number: int, mkt: Optional[str] = None) -> str:
+        params = {"q": query, "first": (page_number - 1) * Utils.RESULTS_PER_PAGE + 1, "FORM": "PERE"}
+        if mkt:
+            params["mkt"] = mkt
+
+        return f"{Utils.BING}/search?{urlencode(params)}"
+
+    @staticmethod
+    def split_market(query: str) -> Tuple[str, str]:
+        # строка источника "запрос<TAB>рынок"; вся строка остается ключом запроса в журнале, кэше возвратов и аренде
+        text, _, mkt = query.partition("\t")
+        return text.strip(), mkt.strip() or Config.DEFAULT_MKT
+
+    @staticmethod
+    def market_country(mkt: str) -> str:
+        return mkt.rpartition("-")[2].lower()
+
+    @staticmethod
+    def market_accept_language(mkt: str) -> str:
+        lang = mkt.partition("-")[0].lower()
+        return f"{mkt},{lang};q=0.9" if lang != mkt else mkt
+
     @staticmethod
     async def calculate_pages_count(lst, n):
         k, m = divmod(len(lst), n)
@@ -39,6 +102,23 @@ class Utils:
         except Empty:
             return None
 
+    @staticmethod
+    async def get_messages_from_queue(queue: Queue, timeout: float) -> List[QueueMessage]:
+        # блокирующий get уходит в поток, чтобы не останавливать event loop
+        loop = asyncio.get_running_loop()
+        try:
+            messages = [await loop.run_in_executor(None, queue.get, True, timeout)]
+
+        except Empty:
+            return []
+
+        while True:
+            try:
+                messages.append(queue.get_nowait())
+
+            except Empty:
+                return messages
+
     @staticmethod
     async def add_logging(process_id: int, datetime_of_start: Union[datetime, str]) -> Logger:
         if isinstance(datetime_of_start, str):
@@ -55,7 +135,11 @@ class Utils:
         log_filepath.touch(exist_ok=True)
 
         logger = logging.getLogger()
-        logger.setLevel(logging.DEBUG)
+        logger.setLevel(Config.LOG_LEVEL)
+        # после fork процесс наследует обработчики родителя - их поток-слушатель в дочернем процессе не существует
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+
         formatter = logging.Formatter(u'%(filename)s:%(lineno)d #%(levelname)-8s [%(asctime)s] - %(name)s - ' + str(
             process_id) + '| %(message)s')
 
@@ -65,7 +149,21 @@ class Utils:
         file_handler = logging.FileHandler(log_filepath, mode="a", encoding="utf-8")
         file_handler.setFormatter(formatter)
 
-        logger.addHandler(console_handler)
-        logger.addHandler(file_handler)
+        # в цикле событий запись только кладется в очередь, форматирование и запись на диск - в потоке слушателя
+        log_queue = queue.SimpleQueue()
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(rates=Config.LOG_SAMPLE_RATES))
+        logger.addHandler(queue_handler)
+
+        await Utils.stop_logging()
+        Utils.log_listener = QueueListener(log_queue, console_handler, file_handler)
+        Utils.log_listener.start()
 
         return logger
+
+    @staticmethod
+    async def stop_logging():
+        # дописывает все, что осталось в очереди
+        if Utils.log_listener is not None:
+            Utils.log_listener.stop()
+            Utils.log_listener = None
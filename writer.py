@@ -0,0 +1,217 @@
+import asyncio
+import csv
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Dict, Type, Callable, Awaitable
+
+from config import Config
+from metrics import metrics
+from models import SearchResult
+
+COLUMNS = list(SearchResult.model_fields)
+
+
+class Sink:
+    def __init__(self, filepath: Path):
+        self.filepath: Path = filepath
+
+    def write_rows(self, rows: List[list]):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class CsvSink(Sink):
+    def __init__(self, filepath: Path):
+        super().__init__(filepath)
+        self.file = None
+        self.writer = None
+
+    def write_rows(self, rows: List[list]):
+        if self.file is None:
+            self.filepath.parent.mkdir(parents=True, exist_ok=True)
+            self.file = open(str(self.filepath), "a", newline="", encoding="utf-8-sig")
+            self.writer = csv.writer(self.file, delimiter=";")
+
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class JsonlSink(Sink):
+    def __init__(self, filepath: Path):
+        super().__init__(filepath)
+        self.file = None
+
+    def write_rows(self, rows: List[list]):
+        if self.file is None:
+            self.filepath.parent.mkdir(parents=True, exist_ok=True)
+            self.file = open(str(self.filepath), "a", encoding="utf-8")
+
+        self.file.write("".join(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows))
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class SqliteSink(Sink):
+    TABLE = "results"
+
+    def __init__(self, filepath: Path):
+        super().__init__(filepath)
+        self.connection: Optional[sqlite3.Connection] = None
+
+    def write_rows(self, rows: List[list]):
+        if self.connection is None:
+            self.filepath.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(str(self.filepath))
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS {self.TABLE} ({', '.join(COLUMNS)})")
+
+        self.connection.executemany(
+            f"INSERT INTO {self.TABLE} VALUES ({', '.join('?' * len(COLUMNS))})", rows
+        )
+        self.connection.commit()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class ParquetSink(Sink):
+    def __init__(self, filepath: Path):
+        # pyarrow не входит в requirements.txt - нужен только для этого формата
+        import pyarrow
+        import pyarrow.parquet
+
+        super().__init__(filepath)
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.schema = pyarrow.schema([(column, pyarrow.string()) for column in COLUMNS])
+        self.writer = None
+
+    def write_rows(self, rows: List[list]):
+        if self.writer is None:
+            self.filepath.parent.mkdir(parents=True, exist_ok=True)
+            self.writer = self.pq.ParquetWriter(str(self.filepath), self.schema)
+
+        columns = list(zip(*rows))
+        self.writer.write_table(
+            self.pa.Table.from_arrays([self.pa.array(column) for column in columns], schema=self.schema)
+        )
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class ResultWriter:
+    SINKS: Dict[str, Type[Sink]] = {
+        "csv": CsvSink,
+        "jsonl": JsonlSink,
+        "sqlite": SqliteSink,
+        "parquet": ParquetSink,
+    }
+
+    def __init__(self, sink: Sink, batch_size: int, flush_interval: float):
+        self.sink: Sink = sink
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+
+        self.buffer: List[list] = []
+        self.markers: List[tuple] = []
+        self.batches: asyncio.Queue = asyncio.Queue()
+        self.rows_written: int = 0
+
+        # вызывается с маркерами батча только после того, как его строки записаны
+        self.on_flushed: Optional[Callable[[List[tuple]], Awaitable[None]]] = None
+
+        # один поток - все обращения к файлу/соединению идут строго по порядку
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="result-writer")
+        self.write_task: Optional[asyncio.Task] = None
+        self.flush_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_config(cls) -> "ResultWriter":
+        sink_class = cls.SINKS.get(Config.OUT_FORMAT)
+        if sink_class is None:
+            raise ValueError(f"Неизвестный формат выгрузки: {Config.OUT_FORMAT}")
+
+        return cls(
+            sink=sink_class(Config.OUT_FILEPATH),
+            batch_size=Config.WRITER_BATCH_SIZE,
+            flush_interval=Config.WRITER_FLUSH_INTERVAL
+        )
+
+    async def start(self):
+        self.write_task = asyncio.create_task(self.write_loop())
+        self.flush_task = asyncio.create_task(self.flush_loop())
+
+    async def put(self, rows: List[list]):
+        self.buffer.extend(rows)
+        if len(self.buffer) >= self.batch_size:
+            await self.flush()
+
+    async def put_marker(self, marker: tuple):
+        self.markers.append(marker)
+
+    async def flush(self):
+        if self.buffer or self.markers:
+            rows, self.buffer = self.buffer, []
+            markers, self.markers = self.markers, []
+            self.batches.put_nowait((rows, markers))
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.batches.get()
+            if batch is None:
+                return
+
+            rows, markers = batch
+            try:
+                if rows:
+                    with metrics.timer("write", sink=self.sink.__class__.__name__):
+                        await loop.run_in_executor(self.executor, self.sink.write_rows, rows)
+
+                    self.rows_written += len(rows)
+                    metrics.inc("rows_written", len(rows))
+
+            except Exception as ex:
+                Config.logger.error(f"Не удалось записать {len(rows)} строк в {self.sink.filepath}: {ex}")
+                continue
+
+            if markers and self.on_flushed is not None:
+                await self.on_flushed(markers)
+
+    async def close(self):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+
+        await self.flush()
+        if self.write_task is not None:
+            self.batches.put_nowait(None)
+            await self.write_task
+            self.write_task = None
+
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.sink.close)
+        self.executor.shutdown(wait=True)
+        Config.logger.info(f"Записал строк в {self.sink.filepath}: {self.rows_written}")